@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Backends of the LLM used by the OpenAIHandler: the OpenAI API (or any OpenAI-compatible server),
+or a deterministic in-process mock answering with scripted function calls, for local tests and benchmarks.
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-22"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import json
+import re
+import time
+from abc import ABC, abstractmethod
+
+from app.config import Config
+from app.resilience import ResilientChatCompletion
+
+
+class ChatBackend(ABC):
+    """
+    Interface of the LLM backends, following the format of the OpenAI chat completions.
+    """
+
+    model = None
+
+    @abstractmethod
+    def create(self, messages, functions=None, stream=False):
+        """
+        Create a chat completion.
+
+        Args:
+            messages (list[dict]): Messages of the conversation
+            functions (list[dict]): Functions definitions the model can call
+            stream (bool): Stream the response
+
+        Returns:
+            dict | iterator: The response, or an iterator of the chunks of the response if streamed
+        """
+
+
+class OpenAIBackend(ChatBackend):
+    """
+    Backend of the OpenAI API, or of an OpenAI-compatible server with another base URL.
+    """
+
+    def __init__(
+        self,
+        model=Config.GPT_MODEL,
+        api_base=Config.OPENAI_API_BASE,
+        api_key=Config.OPENAI_API_KEY,
+        chat_completion=None,
+    ):
+        """
+        Initialize the backend.
+
+        Args:
+            model (str): Name of the model
+            api_base (str): Base URL of the API
+            api_key (str): Key of the API
+            chat_completion (ResilientChatCompletion): Wrapper of the API calls (timeouts, retries, circuit breaker)
+        """
+        if api_key is None:
+            raise ValueError("OPENAI_API_KEY not found in environment variables.")
+        self.model = model
+        self.api_base = api_base
+        self.api_key = api_key
+        self.chat_completion = chat_completion or ResilientChatCompletion()
+
+    def create(self, messages, functions=None, stream=False):
+        kwargs = {"functions": functions} if functions else {}
+        return self.chat_completion.create(
+            model=self.model,
+            messages=messages,
+            stream=stream,
+            api_base=self.api_base,
+            api_key=self.api_key,
+            **kwargs,
+        )
+
+
+# Scripted function calls of the mock backend: the first rule whose pattern matches the question is used.
+# The "{group}" values of the arguments are replaced by the named groups of the pattern.
+# fmt: off
+NUMBER = r"(?P<value>-?\d+(?:\.\d+)?)"
+ACTION = r"(?P<action>increase|decrease|set)"
+MOCK_SCRIPT = [
+    (r"\b(?:was|were)\b.*temperature|temperature.*\b(?:was|were)\b", "get_history", {}),
+    (ACTION + r".*set temperature.*?" + NUMBER, "adjust_set_temperature", {"temperature": "{value}", "action": "{action}"}),
+    (r"set temperature", "get_set_temperature", {}),
+    (ACTION + r".*outside temperature.*?" + NUMBER, "adjust_outside_temperature", {"temperature": "{value}", "action": "{action}"}),
+    (r"outside temperature", "get_outside_temperature", {}),
+    (ACTION + r".*boiler power.*?" + NUMBER, "adjust_boiler_power", {"power": "{value}", "action": "{action}"}),
+    (r"heat power", "get_boiler_heat_power", {}),
+    (r"boiler power", "get_boiler_power", {}),
+    (r"fuel consumption", "get_fuel_consumption", {}),
+    (r"fuel", "get_boiler_fuel", {}),
+    (r"edge|size", "get_building_edge", {}),
+    (r"coefficient", "get_heat_transfer_coefficient", {}),
+    (r"heat capacity", "get_volume_heat_capacity", {}),
+    (r"operating", "get_boiler_operating_percentage", {}),
+    (r"reach", "get_temperature_reached", {}),
+    (r"last (?:hour|day|month)|in total|so far", "get_energy_accounting", {}),
+    (r"energy consumption", "get_energy_consumption", {}),
+    (r"price|cost", "get_energy_price", {}),
+    (r"user (?P<user_id>\d+)", "get_user_info", {"user_id": "{user_id}"}),
+    (r"temperature", "get_building_temperature", {}),
+]
+# fmt: on
+
+QUESTION_PATTERN = re.compile(r"Question:(.*)$", re.DOTALL)
+
+
+class MockBackend(ChatBackend):
+    """
+    Deterministic in-process backend, calling the scripted function matching the question of the user,
+    then answering with the result of the function. It does not need an API key nor a network access.
+    """
+
+    model = "mock"
+
+    def __init__(self, script=MOCK_SCRIPT, latency=0):
+        """
+        Initialize the backend.
+
+        Args:
+            script (list[tuple]): Rules (pattern of the question, function name, arguments) of the function calls
+            latency (float): Simulated duration of a completion in seconds
+        """
+        self.script = [
+            (re.compile(pattern, re.IGNORECASE), name, arguments)
+            for pattern, name, arguments in script
+        ]
+        self.latency = latency
+
+    @staticmethod
+    def _parse_value(value):
+        """
+        Convert an argument captured in the question to a number if possible.
+        """
+        for parse in (int, float):
+            try:
+                return parse(value)
+            except ValueError:
+                pass
+        return value
+
+    def _function_call(self, question, functions):
+        """
+        Get the scripted function call for a question, or None if no rule matches an available function.
+        """
+        available = {definition["name"] for definition in functions or []}
+        for pattern, name, arguments in self.script:
+            match = pattern.search(question)
+            if match and name in available:
+                # Lower case captured values, the actions are expected in lower case
+                groups = {
+                    key: value.lower() for key, value in match.groupdict().items()
+                }
+                return {
+                    "name": name,
+                    "arguments": json.dumps(
+                        {
+                            key: self._parse_value(value.format(**groups))
+                            for key, value in arguments.items()
+                        }
+                    ),
+                }
+        return None
+
+    def _message(self, messages, functions):
+        """
+        Get the message answering the conversation.
+        """
+        last_message = messages[-1]
+        if last_message["role"] == "function":
+            return {
+                "role": "assistant",
+                "content": f"The result of {last_message['name']} is: {last_message['content']}",
+            }
+
+        question = QUESTION_PATTERN.search(last_message["content"])
+        question = question.group(1) if question else last_message["content"]
+        function_call = self._function_call(question, functions)
+        if function_call:
+            return {
+                "role": "assistant",
+                "content": None,
+                "function_call": function_call,
+            }
+        return {"role": "assistant", "content": "I am a mock assistant."}
+
+    def _stream(self, message):
+        """
+        Split a message into chunks, as streamed by the OpenAI API.
+        """
+        function_call = message.get("function_call")
+        if function_call:
+            deltas = [
+                {"function_call": {"name": function_call["name"]}},
+                {"function_call": {"arguments": function_call["arguments"]}},
+            ]
+        else:
+            deltas = [
+                {"content": word} for word in re.findall(r"\S+\s*", message["content"])
+            ]
+        for delta in deltas:
+            yield {"choices": [{"delta": delta}]}
+
+    def create(self, messages, functions=None, stream=False):
+        if self.latency:
+            time.sleep(self.latency)
+        message = self._message(messages, functions)
+        if stream:
+            return self._stream(message)
+
+        # Tokens estimated as words, the mock has no tokenizer
+        prompt_tokens = len(json.dumps(messages).split())
+        completion_tokens = len(json.dumps(message).split())
+        return {
+            "choices": [{"message": message}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+
+def get_backend(name=Config.LLM_BACKEND):
+    """
+    Get the LLM backend with the given name: "openai" or "mock".
+    """
+    if name == "openai":
+        return OpenAIBackend()
+    if name == "mock":
+        return MockBackend()
+    raise ValueError(f"LLM backend {name} not supported")
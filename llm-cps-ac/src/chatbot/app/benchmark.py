@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+End-to-end benchmark of the chatbot pipeline (functions routing, function calls to the simulator and to the
+SQL database) with the mock LLM backend, so that no API quota is used. The queries are the ones of the functions
+router fixture. The heating simulator must be running for the functions calling its API.
+
+Run the benchmark with:
+    python -m app.benchmark --requests 200 --threads 4
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-22"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle, islice
+
+from app.backends import MockBackend
+from app.config import ChatbotPrompt, Config
+from app.functions import all_functions
+from app.handler import OpenAIHandler
+from app.sql_db import init_db
+from app.tool_router import ToolRouter
+from app.usage import UsageTracker
+
+
+def run_benchmark(number_of_requests, threads, latency=0):
+    """
+    Send queries to a handler with the mock backend and measure the latency of each answer.
+
+    Args:
+        number_of_requests (int): Number of queries to send
+        threads (int): Number of queries processed in parallel
+        latency (float): Simulated duration of a completion in seconds
+
+    Returns:
+        dict: Throughput and latencies of the requests, with the usage metrics of the LLM calls
+    """
+    with open(Config.FNCT_DEF_PATH, "r") as file:
+        functions_definitions = json.load(file)["functions"]
+    with open(Config.TOOL_ROUTER_FIXTURE_PATH, "r") as file:
+        queries = [case["query"] for case in json.load(file)]
+
+    # Make sure the users tables exist
+    init_db()
+
+    usage_tracker = UsageTracker(None, None)
+    handler = OpenAIHandler(
+        all_functions,
+        functions_definitions,
+        ChatbotPrompt.system_message,
+        backend=MockBackend(latency=latency),
+        tool_router=ToolRouter(functions_definitions),
+        usage_tracker=usage_tracker,
+    )
+
+    def send(query):
+        start = time.perf_counter()
+        handler.send_response(query)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = sorted(
+            executor.map(send, islice(cycle(queries), number_of_requests))
+        )
+    duration = time.perf_counter() - start
+
+    return {
+        "requests": number_of_requests,
+        "duration": duration,
+        "throughput": number_of_requests / duration,
+        "mean_latency": sum(latencies) / len(latencies),
+        "p50_latency": latencies[len(latencies) // 2],
+        "p95_latency": latencies[int(0.95 * (len(latencies) - 1))],
+        "llm_calls": usage_tracker.metrics()["calls"],
+    }
+
+
+def main():
+    """
+    Main function to run the benchmark from the command line.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the chatbot pipeline with the mock LLM backend."
+    )
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Simulated LLM latency in seconds"
+    )
+    args = parser.parse_args()
+
+    results = run_benchmark(args.requests, args.threads, args.latency)
+    print(
+        f"{results['requests']} requests in {results['duration']:.2f} s "
+        + f"({results['throughput']:.1f} requests/s, {results['llm_calls']} LLM calls)"
+    )
+    print(
+        f"Latency: mean {results['mean_latency'] * 1000:.1f} ms, "
+        + f"p50 {results['p50_latency'] * 1000:.1f} ms, p95 {results['p95_latency'] * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
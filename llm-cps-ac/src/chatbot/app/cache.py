@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+In-memory caches used by the chatbot.
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-18"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+from app.config import Config
+from app.embeddings import get_embeddings
+
+
+class TTLCache:
+    """
+    Bounded in-memory cache with least recently used (LRU) eviction and time to live (TTL) expiration.
+    The cache is thread-safe, so it can be shared between the Streamlit sessions.
+    """
+
+    def __init__(self, max_size, ttl=None):
+        """
+        Initialize the cache.
+
+        Args:
+            max_size (int): Maximum number of entries, the least recently used entry is evicted first
+            ttl (float): Time to live of an entry in seconds, None for no expiration
+        """
+        if max_size <= 0:
+            raise ValueError("Cache size must be positive")
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expiration time, value)
+        self._lock = threading.Lock()
+
+    def _is_expired(self, expiration):
+        """
+        Check if an entry with the given expiration time is expired.
+        """
+        return expiration is not None and expiration <= time.monotonic()
+
+    def get(self, key, default=None):
+        """
+        Get the value of a key, or the default value if the key is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expiration, value = entry
+            if self._is_expired(expiration):
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """
+        Set the value of a key and evict the least recently used entries if the cache is full.
+        """
+        expiration = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expiration, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """
+        Remove a key from the cache and return its value.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def items(self):
+        """
+        Get a list of the (key, value) pairs which are not expired.
+        """
+        with self._lock:
+            return [
+                (key, value)
+                for key, (expiration, value) in self._entries.items()
+                if not self._is_expired(expiration)
+            ]
+
+    def clear(self):
+        """
+        Remove all the entries of the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class AnswerCache:
+    """
+    Cache of the answers given by the vector database.
+    Questions are matched on their normalized text, and optionally on the similarity of their embeddings.
+    """
+
+    NON_WORD_PATTERN = re.compile(r"[^\w]+")
+
+    def __init__(self, max_size, ttl=None, similarity_threshold=None, embeddings=None):
+        """
+        Initialize the answer cache.
+
+        Args:
+            max_size (int): Maximum number of cached answers
+            ttl (float): Time to live of an answer in seconds, None for no expiration
+            similarity_threshold (float): Minimum cosine similarity between two questions to reuse an answer,
+                None to only reuse answers of identical (normalized) questions
+            embeddings (Embeddings): Embeddings used to compare the questions, if None the configured ones are used
+        """
+        # Normalized question -> (embedding, answer)
+        self._answers = TTLCache(max_size, ttl)
+        self.similarity_threshold = similarity_threshold
+        self._embeddings = embeddings
+        self._embed = lru_cache(maxsize=max_size)(self._embed_question)
+
+    @classmethod
+    def normalize(cls, question):
+        """
+        Normalize a question: lower case, without punctuation and extra spaces.
+        """
+        return cls.NON_WORD_PATTERN.sub(" ", question.lower()).strip()
+
+    def _embed_question(self, normalized_question):
+        """
+        Embed a normalized question with the embeddings of the cache, as a unit vector
+        (the cosine similarity of two questions is then the dot product of their embeddings).
+        """
+        if self._embeddings is None:
+            self._embeddings = get_embeddings()
+        embedding = np.asarray(
+            self._embeddings.embed_query(normalized_question), dtype=float
+        )
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+
+    def get(self, question):
+        """
+        Get the cached answer of a question, or None if there is no answer for this (or a similar) question.
+        """
+        key = self.normalize(question)
+        entry = self._answers.get(key)
+        if entry is not None:
+            return entry[1]
+
+        if self.similarity_threshold is None:
+            return None
+
+        entries = [entry for _, entry in self._answers.items()]
+        if not entries:
+            return None
+
+        # Look for the most similar cached question, with all the similarities computed at once
+        similarities = np.vstack([entry[0] for entry in entries]) @ self._embed(key)
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.similarity_threshold:
+            return entries[best][1]
+        return None
+
+    def set(self, question, answer):
+        """
+        Cache the answer of a question.
+        """
+        key = self.normalize(question)
+        embedding = self._embed(key) if self.similarity_threshold is not None else None
+        self._answers.set(key, (embedding, answer))
+
+    def clear(self):
+        """
+        Remove all the cached answers, e.g. when the vector store is rebuilt.
+        """
+        self._answers.clear()
+        self._embed.cache_clear()
+
+
+class UserCache:
+    """
+    Read-through cache of the users data (profile and schedule), keyed by id. The names of the users are not
+    unique, so the users looked up by name are always read from the database.
+    """
+
+    def __init__(self, max_size, ttl=None):
+        """
+        Initialize the user cache.
+
+        Args:
+            max_size (int): Maximum number of cached users
+            ttl (float): Time to live of a user in seconds, None for no expiration
+        """
+        self._users = TTLCache(max_size, ttl)  # id -> user data
+
+    def get(self, user_id):
+        """
+        Get the data of a user by id. Return None if the user is not cached.
+        """
+        if user_id is None:
+            return None
+        return self._users.get(user_id)
+
+    def set(self, user_data):
+        """
+        Cache the data of a user, as returned by `User.to_json`.
+        """
+        self._users.set(user_data["id"], user_data)
+
+    def invalidate(self, user_id):
+        """
+        Remove a user from the cache, once it is modified in the database.
+        """
+        self._users.pop(user_id)
+
+    def clear(self):
+        """
+        Remove all the cached users.
+        """
+        self._users.clear()
+
+
+# Answers of the vector database, shared by all the sessions
+answer_cache = AnswerCache(
+    Config.ANSWER_CACHE_SIZE,
+    Config.ANSWER_CACHE_TTL,
+    Config.ANSWER_CACHE_SIMILARITY,
+)
+
+# Users of the SQL database, shared by all the sessions
+user_cache = UserCache(Config.USER_CACHE_SIZE, Config.USER_CACHE_TTL)
+
+# Values read from the simulator API, shared by all the sessions
+tool_cache = TTLCache(Config.TOOL_CACHE_SIZE, Config.TOOL_CACHE_TTL)
@@ -30,11 +30,71 @@ class Config:
     APP_PATH = PATH + "app/"
     DATA_FOLDER_PATH = PATH + "data/"
     VECTOR_STORE_PATH = DATA_FOLDER_PATH + "vectorstore.pkl"
+    KEYWORD_INDEX_PATH = DATA_FOLDER_PATH + "keyword_index.pkl"
     SQL_DB_PATH = DATA_FOLDER_PATH + "users.db"
     FNCT_DEF_PATH = APP_PATH + "functions_definitions.json"
+    TOOL_ROUTER_FIXTURE_PATH = APP_PATH + "tool_router_fixture.json"
 
+    # SQL database connections (shared by all the Streamlit sessions)
+    SQL_POOL_SIZE = 5
+    SQL_MAX_OVERFLOW = 10
+    SQL_BUSY_TIMEOUT = 5  # s, waiting time for a lock before failing
+
+    # Cache of the users data read from the SQL database
+    USER_CACHE_SIZE = 1024
+    USER_CACHE_TTL = 300  # s
+
+    # Cache of the values read from the simulator, cleared when a value is modified
+    TOOL_CACHE_SIZE = 64
+    TOOL_CACHE_TTL = 2  # s
+
+    # Occupancy scheduler
+    ABSENCE_TEMPERATURE = 16  # °C, set temperature when nobody is at home
+    SCHEDULER_REFRESH = 300  # s, maximum time between two reloads of the schedules
+
+    # Backend of the LLM: "openai" (OpenAI API or compatible server) or "mock" (scripted, for local tests)
+    LLM_BACKEND = os.environ.get("LLM_BACKEND", "openai")
     OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
     GPT_MODEL = "gpt-3.5-turbo"
+    # URL of the OpenAI API, can point to a local OpenAI-compatible server
+    OPENAI_API_BASE = os.environ.get("OPENAI_API_BASE", "https://api.openai.com/v1")
+
+    # Resilience of the calls to the OpenAI API
+    OPENAI_TIMEOUT = 30  # s, timeout of a request
+    OPENAI_MAX_RETRIES = 3  # Retries on rate limit, server errors and timeouts
+    OPENAI_BACKOFF_BASE = 1  # s, delay before the first retry (exponential with jitter)
+    OPENAI_BACKOFF_MAX = 20  # s
+    CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive failures before failing fast
+    CIRCUIT_RECOVERY_TIMEOUT = 30  # s, time before trying the API again
+
+    # Token budgets on a rolling window (None for no limit), and latencies kept for the usage metrics
+    SESSION_TOKEN_BUDGET = 20000
+    GLOBAL_TOKEN_BUDGET = 500000
+    TOKEN_BUDGET_WINDOW = 3600  # s
+    USAGE_HISTORY_SIZE = 10000
+    USAGE_SESSIONS_SIZE = 10000  # Sessions whose totals are kept, the least recently active one is dropped first
+    USAGE_SESSION_TTL = 86400  # s, totals of a session dropped after a day without calls
+    # Show the usage of all the sessions in the chatbot (for the operators), only the current session otherwise
+    SHOW_GLOBAL_USAGE = os.environ.get("SHOW_GLOBAL_USAGE", "false").lower() == "true"
+
+    # Only send the functions definitions relevant for each query (keyword router)
+    TOOL_ROUTING = True
+
+    # Embeddings used by the vector store: "openai", "huggingface" (local) or "hashing" (local)
+    EMBEDDING_PROVIDER = os.environ.get("EMBEDDING_PROVIDER", "openai")
+    HUGGINGFACE_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+    HASHING_EMBEDDING_SIZE = 1024
+
+    # Retrieval: hybrid (keyword and vector) or vector only
+    HYBRID_RETRIEVAL = True
+    RETRIEVAL_K = 4  # Number of documents given to the LLM
+    KEYWORD_WEIGHT = 0.5  # Weight of the keyword score merged with the vector score
+
+    # Cache of the vector database answers. A similarity (e.g. 0.95) also reuses the answers of similar questions,
+    # at the cost of an embedding of each new question; None (default) only matches identical questions.
+    ANSWER_CACHE_SIZE = 256
+    ANSWER_CACHE_TTL = 3600  # s
+    ANSWER_CACHE_SIMILARITY = None
 
 
 class ChatbotPrompt:
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Embedding providers used by the vector store of the chatbot.
+
+The provider is selected with `Config.EMBEDDING_PROVIDER`:
+    - "openai": OpenAI embeddings (remote API call for each query)
+    - "huggingface": local sentence-transformers model (requires `sentence_transformers`)
+    - "hashing": local hashing vectorizer, no model and no network needed
+
+https://python.langchain.com/docs/modules/data_connection/text_embedding/
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-18"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import hashlib
+import math
+import re
+from functools import lru_cache
+
+from app.config import Config
+
+from langchain.embeddings import HuggingFaceEmbeddings, OpenAIEmbeddings
+from langchain.embeddings.base import Embeddings
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Local embeddings based on the hashing trick.
+    Words and pairs of consecutive words are hashed into a fixed size vector, which is then normalized.
+    Embedding a query only takes a few microseconds and works without any network access.
+    """
+
+    WORD_PATTERN = re.compile(r"\w+")
+
+    def __init__(self, size=Config.HASHING_EMBEDDING_SIZE):
+        """
+        Initialize the hashing embeddings.
+
+        Args:
+            size (int): Size of the embedding vectors
+        """
+        if size <= 0:
+            raise ValueError("Embedding size must be positive")
+        self.size = size
+
+    def _hash(self, feature):
+        """
+        Hash a feature into an index of the vector and a sign (+1 or -1).
+
+        Args:
+            feature (str): Feature to hash
+        """
+        digest = int.from_bytes(
+            hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big"
+        )
+        sign = 1.0 if digest & 1 else -1.0
+        return (digest >> 1) % self.size, sign
+
+    def _embed(self, text):
+        """
+        Embed a single text.
+
+        Args:
+            text (str): Text to embed
+        """
+        words = self.WORD_PATTERN.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+        vector = [0.0] * self.size
+        for feature in features:
+            index, sign = self._hash(feature)
+            vector[index] += sign
+
+        # Normalize the vector so that the L2 distance matches the cosine similarity
+        norm = math.sqrt(sum(value * value for value in vector))
+        if norm > 0:
+            vector = [value / norm for value in vector]
+        return vector
+
+    def embed_documents(self, texts):
+        """
+        Embed a list of documents.
+        """
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        """
+        Embed a query.
+        """
+        return self._embed(text)
+
+
+@lru_cache(maxsize=None)
+def get_embeddings(provider=Config.EMBEDDING_PROVIDER):
+    """
+    Get the embeddings of the given provider. The embeddings are created only once per process.
+
+    Args:
+        provider (str): Embedding provider ("openai", "huggingface" or "hashing")
+    """
+    if provider == "openai":
+        return OpenAIEmbeddings(openai_api_key=Config.OPENAI_API_KEY)
+    if provider == "huggingface":
+        return HuggingFaceEmbeddings(
+            model_name=Config.HUGGINGFACE_EMBEDDING_MODEL,
+            model_kwargs={"device": "cpu"},
+        )
+    if provider == "hashing":
+        return HashingEmbeddings()
+    raise ValueError(f"Embedding provider {provider} not recognized")
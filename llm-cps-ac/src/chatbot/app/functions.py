@@ -15,13 +15,16 @@ __version__ = "1.3"
 import json
 import os
 import requests
+from urllib.parse import urlencode
 
+from sqlalchemy.orm import selectinload
 from langchain.chains import RetrievalQA
 from langchain.chat_models import ChatOpenAI
 
+from app.cache import answer_cache, tool_cache, user_cache
 from app.config import Config, ChatbotPrompt
-from app.sql_db import Session, User
-from app.vector_db import get_vectorstore
+from app.sql_db import User, session_scope
+from app.vector_db import get_retriever
 
 
 # Choose the right URL depending on the environment
@@ -40,16 +43,41 @@ error_message = "Error to connect to the heating system, please retry later."
 #############################################
 
 
-def get_value_from_API(endpoint):
+def get_value_from_API(endpoint, use_cache=True):
     """
     Send a GET request to the specified endpoint and return the value.
+    The values are cached for a short time, so that repeated reads (e.g. during one answer) are not sent again.
+    The cache is shared by all the sessions and is not cleared by the writes of other processes (e.g. the
+    scheduler), so a value which is modified based on its current value is read without the cache.
     """
+    if use_cache:
+        cached_value = tool_cache.get(endpoint)
+        if cached_value is not None:
+            return cached_value
+
     try:
         response = requests.get(f"{API_URL}/{endpoint}")
-        return response.json()
+        value = response.json()
     except:
         return {"message": error_message}
 
+    # Only successful responses are cached
+    if response.ok:
+        tool_cache.set(endpoint, value)
+    return value
+
+
+def post_value_on_API(endpoint, payload):
+    """
+    Send a POST request with the payload to the specified endpoint and return the response.
+    The cached values are cleared, as the modification may change any of them.
+    """
+    try:
+        response = requests.post(f"{API_URL}/{endpoint}", data=json.dumps(payload))
+        return response.json()
+    finally:
+        tool_cache.clear()
+
 
 def adjust_value_on_API(endpoint, value, action):
     """
@@ -58,7 +86,7 @@ def adjust_value_on_API(endpoint, value, action):
     try:
         if action in ["increase", "decrease"]:
             get_endpoint = endpoint.replace("set", "get", 1)
-            current_value = get_value_from_API(get_endpoint)[
+            current_value = get_value_from_API(get_endpoint, use_cache=False)[
                 get_endpoint.replace("get-", "").replace("-", "_")
             ]
             if action == "increase":
@@ -67,9 +95,7 @@ def adjust_value_on_API(endpoint, value, action):
                 new_value = current_value - abs(value)
         else:
             new_value = value
-        payload = json.dumps({"value": new_value})
-        response = requests.post(f"{API_URL}/{endpoint}", data=payload)
-        return response.json()
+        return post_value_on_API(endpoint, {"value": new_value})
     except:
         return {"message": error_message}
 
@@ -106,12 +132,7 @@ def use_real_weather(action):
     """
     Use real weather data instead of the outside temperature set by the user.
     """
-    if action == True:
-        payload = json.dumps({"value": True})
-    else:
-        payload = json.dumps({"value": False})
-    response = requests.post(f"{API_URL}/set-use-real-weather", data=payload)
-    return response.json()
+    return post_value_on_API("set-use-real-weather", {"value": action == True})
 
 
 def get_building_edge():
@@ -181,9 +202,7 @@ def change_boiler_fuel(fuel):
     """
     Change the boiler fuel.
     """
-    payload = json.dumps({"fuel": fuel})
-    response = requests.post(f"{API_URL}/set-boiler-fuel", data=payload)
-    return response.json()
+    return post_value_on_API("set-boiler-fuel", {"fuel": fuel})
 
 
 def get_volume_heat_capacity_var():
@@ -197,9 +216,9 @@ def change_volume_heat_capacity_var(heat_capacity):
     """
     Change the volume heat capacity variable.
     """
-    payload = json.dumps({"heat_capacity": heat_capacity})
-    response = requests.post(f"{API_URL}/set-volume-heat-capacity-var", data=payload)
-    return response.json()
+    return post_value_on_API(
+        "set-volume-heat-capacity-var", {"heat_capacity": heat_capacity}
+    )
 
 
 def get_building_temperature():
@@ -225,7 +244,7 @@ def get_boiler_operating_percentage():
 
 def get_energy_consumption():
     """
-    Get the current energy consumption in kWh.
+    Get the energy consumed during the last hour in kWh.
     """
     return get_value_from_API("get-current-building-energy-consumption")
 
@@ -246,54 +265,87 @@ def get_fuel_consumption():
 
 def get_energy_price():
     """
-    Get the current energy price in CHF/year.
+    Get the energy price in CHF/year, extrapolated from the cost of the last day.
     """
     return get_value_from_API("get-current-energy-price")
 
 
+def get_history(field="building_temperatures", start=-24, end=None, resolution=24):
+    """
+    Get the recorded values of a field between two times in hours (negative times are relative to now),
+    as buckets with the min, max and mean.
+    """
+    parameters = {"fields": field, "from": start, "resolution": resolution}
+    if end is not None:
+        parameters["to"] = end
+    return get_value_from_API(f"history?{urlencode(parameters)}")
+
+
+def get_energy_accounting():
+    """
+    Get the energy, fuel and cost consumed since the start and during the last hour, day and month.
+    """
+    return get_value_from_API("get-energy-accounting")
+
+
 #############################################
 # Functions related to the SQL database
 #############################################
 
 
-def get_user_by_name_or_id(session, user_name, user_id):
+def get_user_by_name_or_id(session, user_name, user_id, with_schedule=True):
     """
-    Get a user by name or id
+    Get a user by name or id, with his schedule loaded in the same lookup if requested
     """
     user = None
+    query = session.query(User)
+    if with_schedule:
+        query = query.options(selectinload(User.schedule))
     if user_name and user_name != "x-x-x-x-x":
-        user = session.query(User).filter(User.name == user_name).first()
+        user = query.filter(User.name == user_name).first()
     elif user_id and user_id != 9999999:
-        user = session.query(User).filter(User.id == user_id).first()
+        user = query.filter(User.id == user_id).first()
     return user
 
 
+def get_user_data(user_name, user_id):
+    """
+    Get the data of a user by name or id, from the cache (by id only, names are not unique) or else from the database
+    """
+    valid_name = user_name if user_name and user_name != "x-x-x-x-x" else None
+    valid_id = user_id if user_id and user_id != 9999999 else None
+    user_data = user_cache.get(valid_id) if valid_name is None else None
+
+    if user_data is None:
+        with session_scope() as session:
+            user = get_user_by_name_or_id(session, user_name, user_id)
+            if user:
+                user_data = user.to_json()
+                user_cache.set(user_data)
+
+    return user_data
+
+
 def get_user_info(user_name="x-x-x-x-x", user_id=9999999):
     """
     Get information about a specific user by name or id
     """
-    session = Session()
-    user = get_user_by_name_or_id(session, user_name, user_id)
+    user_data = get_user_data(user_name, user_id)
 
     # Check if user exists
-    if user:
-        user_info = json.dumps(user.to_json())
-        db_user_name = json.loads(user_info)["name"]
-        db_user_id = json.loads(user_info)["id"]
+    if not user_data:
+        return "User not found"
 
-        # Check if user name and id match
-        if user_name in (db_user_name, "x-x-x-x-x") and user_id in (
-            db_user_id,
-            9999999,
-        ):
-            session.close()
-            return user_info
-        else:
-            session.close()
-            return "User name and id do not match, please provide name and id of the same user"
+    # Check if user name and id match
+    if user_name in (user_data["name"], "x-x-x-x-x") and user_id in (
+        user_data["id"],
+        9999999,
+    ):
+        return json.dumps(user_data)
     else:
-        session.close()
-        return "User not found"
+        return (
+            "User name and id do not match, please provide name and id of the same user"
+        )
 
 
 def modify_user_preferred_temperature(
@@ -302,36 +354,33 @@ def modify_user_preferred_temperature(
     """
     Modify preferred temperature for a specific user
     """
-    session = Session()
-    user = get_user_by_name_or_id(session, user_name, user_id)
+    with session_scope() as session:
+        user = get_user_by_name_or_id(session, user_name, user_id, with_schedule=False)
 
-    # Check if user exists
-    if user:
-        user_info = json.dumps(user.to_json())
-        db_user_name = json.loads(user_info)["name"]
-        db_user_id = json.loads(user_info)["id"]
+        # Check if user exists
+        if not user:
+            return "User not found"
 
         # Check if user name and id match
-        if user_name in (db_user_name, "x-x-x-x-x") and user_id in (
-            db_user_id,
+        if user_name not in (user.name, "x-x-x-x-x") or user_id not in (
+            user.id,
             9999999,
         ):
-            if action == "increase":
-                new_temperature = user.preferred_temperature + temperature
-            elif action == "decrease":
-                new_temperature = user.preferred_temperature - abs(temperature)
-            else:
-                new_temperature = temperature
-            user.preferred_temperature = new_temperature
-            session.commit()
-            session.close()
-            return f"Preferred temperature modified to {new_temperature}°C"
-        else:
-            session.close()
             return "User name and id do not match, please provide name and id of the same user"
-    else:
-        session.close()
-        return "User not found"
+
+        if action == "increase":
+            new_temperature = user.preferred_temperature + temperature
+        elif action == "decrease":
+            new_temperature = user.preferred_temperature - abs(temperature)
+        else:
+            new_temperature = temperature
+        user.preferred_temperature = new_temperature
+        modified_id = user.id
+
+    # The cached data of the user is outdated once the change is committed
+    # (not before, a concurrent read could cache the old value again)
+    user_cache.invalidate(modified_id)
+    return f"Preferred temperature modified to {new_temperature}°C"
 
 
 #############################################
@@ -347,13 +396,24 @@ def ask_vector_db(question: str):
     https://python.langchain.com/docs/modules/chains/additional/openai_functions_retrieval_qa
 
     """
+    # Return the cached answer if the same (or a similar) question was already asked
+    cached_answer = answer_cache.get(question)
+    if cached_answer is not None:
+        return cached_answer
+
     qa = RetrievalQA.from_chain_type(
-        llm=ChatOpenAI(openai_api_key=Config.OPENAI_API_KEY),
+        llm=ChatOpenAI(
+            openai_api_key=Config.OPENAI_API_KEY,
+            openai_api_base=Config.OPENAI_API_BASE,
+            request_timeout=Config.OPENAI_TIMEOUT,
+            max_retries=Config.OPENAI_MAX_RETRIES,
+        ),
         chain_type="stuff",
-        retriever=get_vectorstore().as_retriever(),
+        retriever=get_retriever(),
         chain_type_kwargs={"prompt": ChatbotPrompt.PROMPT},
     )
     result = qa.run(question)
+    answer_cache.set(question, result)
     return result
 
 
@@ -383,6 +443,8 @@ all_functions = {
     "get_boiler_heat_power": get_boiler_heat_power,
     "get_fuel_consumption": get_fuel_consumption,
     "get_energy_price": get_energy_price,
+    "get_energy_accounting": get_energy_accounting,
+    "get_history": get_history,
     "get_user_info": get_user_info,
     "modify_user_preferred_temperature": modify_user_preferred_temperature,
     "ask_vector_db": ask_vector_db,
@@ -2,7 +2,8 @@
 # -*- coding: utf-8 -*-
 
 """
-OpenAI handler for the heating control chatbot, responsible for sending and receiving messages to and from the OpenAI API.
+OpenAI handler for the heating control chatbot, responsible for sending and receiving messages to and from the LLM backend
+(OpenAI API by default).
 """
 
 __author__ = "Philippe Marziale"
@@ -15,9 +16,43 @@ __email__ = "philippe.marziale@edu.hefr.ch"
 
 import json
 import logging
-import openai
+import tiktoken
+import time
+from functools import lru_cache
 
 from app.config import Config
+from app.backends import get_backend
+from app.usage import BudgetExceeded, UsageTracker
+
+
+# Message sent to the user if the OpenAI API is not available
+error_message = "Sorry, the OpenAI API is not available yet. Please try again later."
+
+# Message sent to the user if the token budget of the session or the global one is exhausted
+budget_message = "Sorry, the token budget is exhausted. Please try again later."
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    """
+    Get the tokenizer of a model, or None if it is not available (e.g. offline).
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception as e:
+        logging.warning(f"Tokenizer of {model} not available: {e}")
+        return None
+
+
+def count_tokens(text, model=Config.GPT_MODEL):
+    """
+    Count the tokens of a text for the given model. If the tokenizer is not available,
+    the count is estimated (about 4 characters per token).
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text))
 
 
 class OpenAIHandler:
@@ -31,45 +66,141 @@ class OpenAIHandler:
         all_functions,
         functions_definitions,
         system_message,
-        model=Config.GPT_MODEL,
+        backend=None,
+        tool_router=None,
+        usage_tracker=None,
     ):
-        # Initialize the OpenAI API
-        openai.api_key = Config.OPENAI_API_KEY
-        if openai.api_key is None:
-            raise ValueError("OPENAI_API_KEY not found in environment variables.")
+        # Initialize the LLM backend (OpenAI API by default)
+        self.backend = backend or get_backend()
+        self.model = self.backend.model
 
         # Initialize the handler
         self.all_functions = all_functions
         self.functions_definitions = functions_definitions
         self.system_message = system_message
-        self.model = model
+        self.tool_router = tool_router
+        self.usage_tracker = usage_tracker or UsageTracker(None, None)
 
-    def send_message(self, query):
+    def select_functions(self, query):
+        """
+        Select the functions definitions sent with a query: all of them, or only the relevant ones with a router.
+        """
+        if self.tool_router is None:
+            return self.functions_definitions
+        return self.tool_router.select(query)
+
+    def _messages(self, query):
+        """
+        Get the first messages sent to the OpenAI API for a query.
+        """
+        return [
+            {"role": "system", "content": self.system_message},
+            {"role": "user", "content": query},
+        ]
+
+    def _create_completion(self, messages, functions=None, session_id=None):
+        """
+        Send messages to the OpenAI API and record the tokens and latency of the call.
+        Return the message of the response and its total number of tokens.
+        """
+        self.usage_tracker.check(session_id)
+        start = time.perf_counter()
+        response = self.backend.create(messages, functions)
+        usage = response["usage"]
+        self.usage_tracker.record(
+            session_id,
+            usage["prompt_tokens"],
+            usage["completion_tokens"],
+            time.perf_counter() - start,
+        )
+        return response["choices"][0]["message"], usage["total_tokens"]
+
+    def send_message(self, query, session_id=None):
         """
         Send a message to the OpenAI API and receive a response.
         """
         try:
-            # Send the message to the OpenAI API
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": self.system_message,
-                    },
-                    {"role": "user", "content": query},
-                ],
-                functions=self.functions_definitions,
+            return self._create_completion(
+                self._messages(query), self.select_functions(query), session_id
             )
-            message = response["choices"][0]["message"]
-            total_tokens = response["usage"]["total_tokens"]
-            return message, total_tokens
+        except BudgetExceeded as e:
+            logging.warning(e)
+            return budget_message, 0
         except Exception as e:
             logging.error(f"Error while sending message: {e}")
-            return (
-                "Sorry, the OpenAI API is not available yet. Please try again later.",
-                None,
-            )
+            return error_message, 0
+
+    def _stream_completion(self, messages, functions=None, session_id=None):
+        """
+        Send messages to the OpenAI API with streaming enabled.
+        Yield the content tokens as they arrive, then the function call (if any) as a message.
+        Streamed responses do not report their usage, so the tokens of the call are counted locally.
+        """
+        self.usage_tracker.check(session_id)
+        start = time.perf_counter()
+        chunks = self.backend.create(messages, functions, stream=True)
+
+        content, function_name, function_arguments = "", "", ""
+        for chunk in chunks:
+            delta = chunk["choices"][0]["delta"]
+            if delta.get("function_call"):
+                function_name += delta["function_call"].get("name") or ""
+                function_arguments += delta["function_call"].get("arguments") or ""
+            elif delta.get("content"):
+                content += delta["content"]
+                yield delta["content"]
+
+        prompt = json.dumps(messages) + (json.dumps(functions) if functions else "")
+        self.usage_tracker.record(
+            session_id,
+            count_tokens(prompt, self.model),
+            count_tokens(content + function_name + function_arguments, self.model),
+            time.perf_counter() - start,
+        )
+
+        if function_name:
+            yield {
+                "role": "assistant",
+                "content": None,
+                "function_call": {
+                    "name": function_name,
+                    "arguments": function_arguments,
+                },
+            }
+
+    def stream_response(self, query, session_id=None):
+        """
+        Send a query to the OpenAI API and yield the tokens of the answer as they arrive, handling any function call.
+        """
+        messages = self._messages(query)
+        try:
+            message = None
+            functions = self.select_functions(query)
+            for token in self._stream_completion(messages, functions, session_id):
+                if isinstance(token, dict):
+                    message = token
+                else:
+                    yield token
+
+            # If the model called a function, stream a second response with the function result
+            if message:
+                function_name, result = self.process_function_call(message)
+                if function_name and result:
+                    logging.info("Streaming response with function call")
+                    messages += [
+                        message,
+                        {"role": "function", "name": function_name, "content": result},
+                    ]
+                    yield from self._stream_completion(messages, session_id=session_id)
+                else:
+                    yield result or "Sorry, I don't know how to do that."
+
+        except BudgetExceeded as e:
+            logging.warning(e)
+            yield budget_message
+        except Exception as e:
+            logging.error(f"Error while streaming response: {e}")
+            yield error_message
 
     def process_function_call(self, message):
         """
@@ -97,41 +228,38 @@ class OpenAIHandler:
 
         return None, None
 
-    def send_response(self, query):
+    def send_response(self, query, session_id=None):
         """
         Send a response to the OpenAI API and handle any function calls.
+        Return the answer and the total number of tokens of all the completions.
         """
-        message, total_tokens = self.send_message(query)
+        message, total_tokens = self.send_message(query, session_id)
+
+        # The first completion failed, its error message is the answer
+        if isinstance(message, str):
+            return message, total_tokens
+
         function_name, result = self.process_function_call(message)
 
         # If a function call was made, send a second response with the function call
         if function_name and result:
             logging.info("Sending response with function call")
+            messages = self._messages(query) + [
+                message,
+                {"role": "function", "name": function_name, "content": result},
+            ]
             try:
-                second_response = openai.ChatCompletion.create(
-                    model=self.model,
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": self.system_message,
-                        },
-                        {"role": "user", "content": query},
-                        message,
-                        {
-                            "role": "function",
-                            "name": function_name,
-                            "content": result,
-                        },
-                    ],
+                second_message, second_tokens = self._create_completion(
+                    messages, session_id=session_id
                 )
-                return second_response["choices"][0]["message"]["content"], total_tokens
+                return second_message["content"], total_tokens + second_tokens
+            except BudgetExceeded as e:
+                logging.warning(e)
+                return budget_message, total_tokens
             except Exception as e:
                 logging.error(f"Error while sending response: {e}")
-                return (
-                    "Sorry, the OpenAI API is not available yet. Please try again later.",
-                    None,
-                )
+                return error_message, total_tokens
 
         else:
             logging.info("Sending response without function call")
-            return message["content"], total_tokens
+            return message["content"] or result, total_tokens
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bulk import of users and their schedules into the SQL database, from a CSV or JSON file.
+
+CSV files have one user per line with the columns:
+    name,age,preferred_temperature,weekday_start,weekday_end,weekend_start,weekend_end
+
+JSON files contain a list of users:
+    [{"name": "Steve", "age": 28, "preferred_temperature": 19,
+      "weekday_schedule": {"start_time": "07:00", "end_time": "17:00"},
+      "weekend_schedule": {"start_time": "09:00", "end_time": "23:00"}}]
+
+Times are written as HH:MM, a missing schedule means that the user is never at home on these days.
+
+Run the import with:
+    python -m app.import_users users.csv
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-20"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import argparse
+import csv
+import json
+import os
+import time as timer
+from datetime import time
+
+from app.sql_db import bulk_insert_users, init_db, session_scope
+
+
+def parse_schedule(start_time, end_time):
+    """
+    Parse a schedule from its start and end times (HH:MM). Return None if there is no schedule.
+    """
+    if not start_time or not end_time:
+        return None
+    return {
+        "start_time": time.fromisoformat(start_time),
+        "end_time": time.fromisoformat(end_time),
+    }
+
+
+def read_csv(path):
+    """
+    Read the users of a CSV file.
+    """
+    with open(path, "r", newline="") as file:
+        return [
+            {
+                "name": row["name"],
+                "age": int(row["age"]),
+                "preferred_temperature": float(row["preferred_temperature"]),
+                "weekday_schedule": parse_schedule(
+                    row.get("weekday_start"), row.get("weekday_end")
+                ),
+                "weekend_schedule": parse_schedule(
+                    row.get("weekend_start"), row.get("weekend_end")
+                ),
+            }
+            for row in csv.DictReader(file)
+        ]
+
+
+def read_json(path):
+    """
+    Read the users of a JSON file.
+    """
+    with open(path, "r") as file:
+        users = json.load(file)
+
+    for user in users:
+        for schedule_key in ("weekday_schedule", "weekend_schedule"):
+            schedule = user.get(schedule_key) or {}
+            user[schedule_key] = parse_schedule(
+                schedule.get("start_time"), schedule.get("end_time")
+            )
+    return users
+
+
+def import_users(path):
+    """
+    Import the users of a CSV or JSON file in a single transaction.
+
+    Args:
+        path (str): Path of the file, the format is given by its extension (.csv or .json)
+
+    Returns:
+        int: Number of imported users
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        users_data = read_csv(path)
+    elif extension == ".json":
+        users_data = read_json(path)
+    else:
+        raise ValueError(f"File format {extension} not supported, use .csv or .json")
+
+    # Make sure the tables exist
+    init_db()
+
+    with session_scope() as session:
+        return bulk_insert_users(session, users_data)
+
+
+def main():
+    """
+    Main function to import users from the command line.
+    """
+    parser = argparse.ArgumentParser(
+        description="Import users and their schedules from a CSV or JSON file."
+    )
+    parser.add_argument("path", help="Path of the CSV or JSON file")
+    args = parser.parse_args()
+
+    start = timer.perf_counter()
+    number_of_users = import_users(args.path)
+    print(
+        f"Imported {number_of_users} users in {timer.perf_counter() - start:.2f} seconds"
+    )
+
+
+if __name__ == "__main__":
+    main()
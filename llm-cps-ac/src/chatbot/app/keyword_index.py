@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Keyword inverted index (BM25) built alongside the vector store, used for exact term matching.
+
+https://en.wikipedia.org/wiki/Okapi_BM25
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-19"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import math
+import re
+from collections import Counter, defaultdict
+
+
+WORD_PATTERN = re.compile(r"\w+")
+
+# Common words ignored by the index
+# fmt: off
+STOP_WORDS = frozenset(
+    {
+        "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for",
+        "from", "how", "i", "in", "is", "it", "my", "of", "on", "or", "our", "so",
+        "that", "the", "this", "to", "what", "when", "which", "who", "with", "you",
+        "your",
+    }
+)
+# fmt: on
+
+
+def tokenize(text):
+    """
+    Split a text into lower case words, without the stop words.
+
+    Args:
+        text (str): Text to split
+    """
+    return [
+        word for word in WORD_PATTERN.findall(text.lower()) if word not in STOP_WORDS
+    ]
+
+
+def find_identifiers(text):
+    """
+    Find the identifier-like words of a text, such as model numbers ("4000") or brand names ("ToastMaster").
+    These words are expected to be matched exactly rather than by meaning.
+
+    Args:
+        text (str): Text to search
+    """
+    return [
+        word.lower()
+        for word in WORD_PATTERN.findall(text)
+        if any(char.isdigit() for char in word)
+        or any(char.isupper() for char in word[1:])
+    ]
+
+
+class InvertedIndex:
+    """
+    Inverted index of documents scored with BM25.
+    """
+
+    K1 = 1.5  # Term frequency saturation
+    B = 0.75  # Document length normalization
+
+    def __init__(self, documents):
+        """
+        Build the index of the given documents.
+
+        Args:
+            documents (list[Document]): LangChain documents to index
+        """
+        self.documents = documents
+        self.postings = defaultdict(list)  # term -> [(document index, term frequency)]
+        self.document_lengths = []
+
+        for index, document in enumerate(documents):
+            terms = tokenize(document.page_content)
+            self.document_lengths.append(len(terms))
+            for term, frequency in Counter(terms).items():
+                self.postings[term].append((index, frequency))
+
+        self.postings = dict(self.postings)
+        self.average_length = (
+            sum(self.document_lengths) / len(documents) if documents else 0
+        )
+
+        # Precompute the inverse document frequency of each term
+        number_of_documents = len(documents)
+        self.idf = {
+            term: math.log(
+                1 + (number_of_documents - len(postings) + 0.5) / (len(postings) + 0.5)
+            )
+            for term, postings in self.postings.items()
+        }
+
+    def has_exact_match(self, query):
+        """
+        Check if the query contains an identifier-like word which appears in the indexed documents.
+
+        Args:
+            query (str): Query to check
+        """
+        return any(word in self.postings for word in find_identifiers(query))
+
+    def search(self, query, k=4):
+        """
+        Search the documents matching the query.
+
+        Args:
+            query (str): Query to search
+            k (int): Maximum number of documents to return
+
+        Returns:
+            list[tuple[Document, float]]: Documents and their BM25 score, best first
+        """
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for index, frequency in self.postings[term]:
+                length_ratio = self.document_lengths[index] / self.average_length
+                scores[index] += (
+                    idf
+                    * frequency
+                    * (self.K1 + 1)
+                    / (frequency + self.K1 * (1 - self.B + self.B * length_ratio))
+                )
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.documents[index], score) for index, score in best]
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Resilience of the calls to the OpenAI API: timeouts, retries with jittered exponential backoff on transient
+errors (rate limit, server errors, timeouts), and a circuit breaker failing fast when the API is down.
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-21"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import logging
+import random
+import threading
+import time
+
+import openai
+
+from app.config import Config
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when a call is rejected because the circuit breaker is open.
+    """
+
+
+def is_transient(error):
+    """
+    Check if an error of the OpenAI API is transient, i.e. if the call can be retried.
+    """
+    if isinstance(
+        error,
+        (
+            openai.error.RateLimitError,
+            openai.error.Timeout,
+            openai.error.APIConnectionError,
+            openai.error.ServiceUnavailableError,
+            openai.error.TryAgain,
+        ),
+    ):
+        return True
+    # Server errors (5xx), or errors without status (e.g. stream interrupted)
+    if isinstance(error, openai.error.APIError):
+        return error.http_status is None or error.http_status >= 500
+    return False
+
+
+def backoff_delay(attempt, base_delay, max_delay):
+    """
+    Get the delay before a retry, with exponential backoff and full jitter.
+
+    Args:
+        attempt (int): Number of the retry, starting at 0
+        base_delay (float): Delay of the first retry in seconds (before jitter)
+        max_delay (float): Maximum delay in seconds (before jitter)
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2**attempt))
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker shared by all the calls to an upstream service.
+
+    The circuit opens after a number of consecutive failures: the calls are then rejected immediately.
+    After the recovery timeout, a single trial call is let through (half-open): the circuit closes if it
+    succeeds, and opens again if it fails.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        failure_threshold=Config.CIRCUIT_FAILURE_THRESHOLD,
+        recovery_timeout=Config.CIRCUIT_RECOVERY_TIMEOUT,
+    ):
+        """
+        Initialize the circuit breaker.
+
+        Args:
+            failure_threshold (int): Number of consecutive failures opening the circuit
+            recovery_timeout (float): Time in seconds before a trial call is let through an open circuit
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Check if a call can be made.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with a trial call already running
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if (
+                self.state == self.OPEN
+                and time.monotonic() - self.opened_at >= self.recovery_timeout
+            ):
+                self.state = self.HALF_OPEN
+                return
+            raise CircuitOpenError("The OpenAI API is unavailable, circuit open")
+
+    def on_success(self):
+        """
+        Record a successful call, closing the circuit.
+        """
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def on_failure(self):
+        """
+        Record a failed call, opening the circuit after too many consecutive failures.
+        """
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logging.warning("Circuit breaker opened")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class ResilientChatCompletion:
+    """
+    Wrapper of `openai.ChatCompletion.create` with a timeout, retries and a circuit breaker.
+    """
+
+    def __init__(
+        self,
+        timeout=Config.OPENAI_TIMEOUT,
+        max_retries=Config.OPENAI_MAX_RETRIES,
+        base_delay=Config.OPENAI_BACKOFF_BASE,
+        max_delay=Config.OPENAI_BACKOFF_MAX,
+        circuit_breaker=None,
+        sleep=time.sleep,
+    ):
+        """
+        Initialize the wrapper.
+
+        Args:
+            timeout (float): Timeout of a request in seconds
+            max_retries (int): Maximum number of retries of a call on transient errors
+            base_delay (float): Delay before the first retry in seconds (before jitter)
+            max_delay (float): Maximum delay between two retries in seconds (before jitter)
+            circuit_breaker (CircuitBreaker): Circuit breaker of the API, a new one by default
+            sleep (callable): Function used to wait between two retries
+        """
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.sleep = sleep
+
+    def create(self, **kwargs):
+        """
+        Create a chat completion, with the same arguments as `openai.ChatCompletion.create`.
+        For streamed completions, only the opening of the stream is retried.
+
+        Raises:
+            CircuitOpenError: If the circuit breaker is open
+            openai.error.OpenAIError: If the call failed, after the retries for transient errors
+        """
+        kwargs.setdefault("request_timeout", self.timeout)
+        for attempt in range(self.max_retries + 1):
+            self.circuit_breaker.before_call()
+            try:
+                response = openai.ChatCompletion.create(**kwargs)
+            except Exception as e:
+                if not is_transient(e):
+                    # The API answered, the error comes from the request
+                    self.circuit_breaker.on_success()
+                    raise
+                self.circuit_breaker.on_failure()
+                if attempt == self.max_retries:
+                    raise
+                delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+                logging.warning(f"OpenAI API error ({e}), retry in {delay:.1f} s")
+                self.sleep(delay)
+            else:
+                self.circuit_breaker.on_success()
+                return response
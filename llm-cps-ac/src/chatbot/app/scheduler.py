@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Occupancy scheduler, driving the set temperature of the heating simulator from the presence hours of the users.
+The set temperature is the highest preferred temperature of the users at home, or the absence temperature
+when nobody is at home. It is only sent to the simulator when it changes.
+
+Run the scheduler with:
+    python -m app.scheduler
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-20"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import logging
+import threading
+from bisect import bisect_right
+from datetime import datetime
+from heapq import heappop, heappush
+from time import monotonic
+
+from app.config import Config
+from app.functions import adjust_set_temperature
+from app.sql_db import Day, PresenceHours, User, session_scope
+
+
+DAY_SECONDS = 24 * 3600
+WEEK_SECONDS = 7 * DAY_SECONDS
+
+# Days of the week, in the order of datetime.weekday()
+DAYS = [
+    Day.MONDAY,
+    Day.TUESDAY,
+    Day.WEDNESDAY,
+    Day.THURSDAY,
+    Day.FRIDAY,
+    Day.SATURDAY,
+    Day.SUNDAY,
+]
+
+
+def seconds_of_week(moment):
+    """
+    Get the number of seconds elapsed since Monday 00:00 at the given moment.
+
+    Args:
+        moment (datetime): Moment of the week
+    """
+    return (
+        moment.weekday() * DAY_SECONDS
+        + moment.hour * 3600
+        + moment.minute * 60
+        + moment.second
+    )
+
+
+class SetpointTimeline:
+    """
+    Weekly timeline of the set temperature, precomputed from the presence hours of the users.
+
+    The week is split at every change of the set temperature, and the interval containing a given time is found by
+    binary search. The timeline is built by sweeping the arrivals and departures in time order, with the number of
+    presences of each user at home and a heap of the preferred temperatures at home, so that each event costs
+    O(log n) instead of a scan of all the users.
+    """
+
+    def __init__(self, presences, absence_temperature=Config.ABSENCE_TEMPERATURE):
+        """
+        Build the timeline.
+
+        Args:
+            presences (list[tuple]): Presence intervals (user id, preferred temperature, start, end) with start
+                and end in seconds of the week. An end before the start means that the presence goes past midnight
+                on Sunday.
+            absence_temperature (float): Set temperature when nobody is at home
+        """
+        self.absence_temperature = absence_temperature
+        self.presences = presences
+
+        # Arrivals (+1) and departures (-1) of the users, the departures first at the same time
+        events = []
+        for user_id, preferred_temperature, start, end in presences:
+            if start < end:
+                events += [(start, 1, user_id), (end, -1, user_id)]
+            elif start > end:
+                events += [(start, 1, user_id), (WEEK_SECONDS, -1, user_id)]
+                if end > 0:
+                    events += [(0, 1, user_id), (end, -1, user_id)]
+        events.sort()
+        preferred_temperatures = {
+            user_id: preferred_temperature
+            for user_id, preferred_temperature, _, _ in presences
+        }
+
+        # Sweep the events, keeping the users at home (number of overlapping presences of each user), the number
+        # of users at home with each preferred temperature, and a max-heap of these temperatures (the temperatures
+        # without any user at home are removed lazily from the top of the heap)
+        self.starts = [0]
+        self.setpoints = [absence_temperature]
+        at_home = {}
+        temperatures_at_home = {}
+        heap = []
+        for i, (time, change, user_id) in enumerate(events):
+            count = at_home.get(user_id, 0) + change
+            temperature = preferred_temperatures[user_id]
+            if count == 0:
+                del at_home[user_id]
+                temperatures_at_home[temperature] -= 1
+                if temperatures_at_home[temperature] == 0:
+                    del temperatures_at_home[temperature]
+            else:
+                at_home[user_id] = count
+                if count == 1 and change == 1:
+                    if temperature not in temperatures_at_home:
+                        temperatures_at_home[temperature] = 0
+                        heappush(heap, -temperature)
+                    temperatures_at_home[temperature] += 1
+
+            # Set temperature once all the events at the same time are applied
+            if time >= WEEK_SECONDS or (
+                i + 1 < len(events) and events[i + 1][0] == time
+            ):
+                continue
+            while heap and -heap[0] not in temperatures_at_home:
+                heappop(heap)
+            setpoint = -heap[0] if heap else absence_temperature
+            if self.starts[-1] == time:
+                self.setpoints[-1] = setpoint
+            elif self.setpoints[-1] != setpoint:
+                self.starts.append(time)
+                self.setpoints.append(setpoint)
+
+    def _index_at(self, time):
+        """
+        Get the index of the interval containing the given time (in seconds of the week).
+        """
+        return bisect_right(self.starts, time % WEEK_SECONDS) - 1
+
+    def present_at(self, time):
+        """
+        Get the ids of the users at home at the given time (in seconds of the week).
+        This scans all the presences, it is not used to build the timeline.
+        """
+        elapsed = time % WEEK_SECONDS
+        return frozenset(
+            user_id
+            for user_id, _, start, end in self.presences
+            if (start <= elapsed < end)
+            or (start > end and (elapsed >= start or elapsed < end))
+        )
+
+    def setpoint_at(self, time):
+        """
+        Get the set temperature at the given time (in seconds of the week).
+        """
+        return self.setpoints[self._index_at(time)]
+
+    def next_transition(self, time):
+        """
+        Get the number of seconds from the given time (in seconds of the week) until the set temperature changes.
+        Return None if the set temperature is the same all week long.
+        """
+        index = self._index_at(time)
+        setpoint = self.setpoints[index]
+        elapsed = time % WEEK_SECONDS
+        # Consecutive intervals have different set temperatures, except the last and the first one (Sunday
+        # to Monday)
+        for offset in range(1, min(len(self.starts), 2) + 1):
+            next_index = (index + offset) % len(self.starts)
+            if self.setpoints[next_index] != setpoint:
+                return (self.starts[next_index] - elapsed) % WEEK_SECONDS
+        return None
+
+    @classmethod
+    def from_database(cls, absence_temperature=Config.ABSENCE_TEMPERATURE):
+        """
+        Build the timeline from the presence hours of all the users of the SQL database.
+        """
+        with session_scope() as session:
+            rows = (
+                session.query(
+                    User.id,
+                    User.preferred_temperature,
+                    PresenceHours.day,
+                    PresenceHours.start_time,
+                    PresenceHours.end_time,
+                )
+                .join(User.schedule)
+                .all()
+            )
+
+        presences = []
+        for user_id, preferred_temperature, day, start_time, end_time in rows:
+            day_start = DAYS.index(day) * DAY_SECONDS
+            start = day_start + start_time.hour * 3600 + start_time.minute * 60
+            end = day_start + end_time.hour * 3600 + end_time.minute * 60
+            # A presence ending before it starts goes past midnight
+            if end <= start:
+                end += DAY_SECONDS
+            presences.append(
+                (user_id, preferred_temperature, start, end % WEEK_SECONDS)
+            )
+        return cls(presences, absence_temperature)
+
+
+def push_to_simulator(temperature):
+    """
+    Send a set temperature to the simulator. Return True if the simulator applied it.
+
+    Args:
+        temperature (float): Set temperature in °C
+    """
+    response = adjust_set_temperature(temperature, "set")
+    return isinstance(response, dict) and "successfully" in response.get("message", "")
+
+
+class SetpointScheduler:
+    """
+    Service pushing the set temperature of the timeline to the simulator, only at the transitions.
+    """
+
+    def __init__(self, push_setpoint=None, refresh_interval=Config.SCHEDULER_REFRESH):
+        """
+        Initialize the scheduler.
+
+        Args:
+            push_setpoint (callable): Function sending a set temperature to the simulator, returning True if it
+                was applied
+            refresh_interval (float): Maximum time in seconds between two reloads of the schedules
+        """
+        self.push_setpoint = push_setpoint or push_to_simulator
+        self.refresh_interval = refresh_interval
+        self.timeline = None
+        self.last_setpoint = None
+        self.last_refresh = None
+        self._stop_event = threading.Event()
+
+    def refresh(self):
+        """
+        Reload the schedules and preferred temperatures of the users.
+        """
+        self.timeline = SetpointTimeline.from_database()
+        self.last_refresh = monotonic()
+
+    def refresh_due(self):
+        """
+        Check if the schedules must be reloaded: never loaded, or loaded more than the refresh interval ago.
+        """
+        return (
+            self.timeline is None
+            or monotonic() - self.last_refresh >= self.refresh_interval
+        )
+
+    def tick(self, moment=None):
+        """
+        Send the set temperature of the given moment to the simulator if it changed.
+        A set temperature which could not be sent is sent again at the next tick.
+        Return the number of seconds until the next transition (None if there is none).
+
+        Args:
+            moment (datetime): Moment to use, now by default
+        """
+        elapsed = seconds_of_week(moment or datetime.now())
+        setpoint = self.timeline.setpoint_at(elapsed)
+        if setpoint != self.last_setpoint:
+            logging.info(f"Scheduler: set temperature changed to {setpoint} °C")
+            if self.push_setpoint(setpoint):
+                self.last_setpoint = setpoint
+            else:
+                logging.warning("Scheduler: the set temperature could not be sent")
+        return self.timeline.next_transition(elapsed)
+
+    def run(self):
+        """
+        Run the scheduler until stop() is called. The schedules are reloaded at the refresh interval, not at
+        each transition.
+        """
+        while not self._stop_event.is_set():
+            if self.refresh_due():
+                self.refresh()
+            next_transition = self.tick()
+            delay = self.refresh_interval - (monotonic() - self.last_refresh)
+            if next_transition is not None:
+                delay = min(delay, next_transition)
+            # A failed push is retried after the refresh interval at the latest
+            self._stop_event.wait(max(delay, 1))
+
+    def stop(self):
+        """
+        Stop the scheduler.
+        """
+        self._stop_event.set()
+
+
+def main():
+    """
+    Main function to run the scheduler.
+    """
+    logging.basicConfig(level=logging.INFO)
+    SetpointScheduler().run()
+
+
+if __name__ == "__main__":
+    main()
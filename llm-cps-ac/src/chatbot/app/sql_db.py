@@ -13,6 +13,7 @@ __version__ = "1.0"
 __email__ = "philippe.marziale@edu.hefr.ch"
 
 
+from contextlib import contextmanager
 from datetime import time
 
 from app.config import Config
@@ -27,7 +28,11 @@ from sqlalchemy import (
     Table,
     ForeignKey,
     create_engine,
+    event,
+    func,
+    insert,
     inspect,
+    select,
 )
 from sqlalchemy.orm import sessionmaker, relationship, declarative_base
 
@@ -69,7 +74,7 @@ class User(Base):
 
     __tablename__ = "users"
     id = Column(Integer, primary_key=True)
-    name = Column(String)
+    name = Column(String, index=True)
     age = Column(Integer)
     preferred_temperature = Column(Float)
     schedule = relationship(
@@ -126,22 +131,92 @@ class PresenceHours(Base):
         }
 
 
-def create_schedule(user_data, days):
+# Days of the weekday and weekend schedules
+WEEKDAYS = [Day.MONDAY, Day.TUESDAY, Day.WEDNESDAY, Day.THURSDAY, Day.FRIDAY]
+WEEKENDS = [Day.SATURDAY, Day.SUNDAY]
+
+
+def bulk_insert_users(session, users_data):
     """
-    Helper function to create a schedule for given user data and days.
+    Insert users and their schedules with bulk inserts (one statement per table).
+    Identical presence hours (same day, start and end time) are stored only once and shared
+    between the users, including the presence hours already in the database.
+
+    Args:
+        session (Session): Session of the transaction
+        users_data (list[dict]): Users with their name, age, preferred_temperature, and
+            optionally a weekday_schedule and a weekend_schedule (dict with start_time and end_time)
+
+    Returns:
+        int: Number of inserted users
     """
-    schedule = []
-    start_time = user_data["start_time"]
-    end_time = user_data["end_time"]
-
-    # Create a PresenceHours object for each day with the start and end time
-    for day in days:
-        presence_hours = PresenceHours(
-            day=day, start_time=start_time, end_time=end_time
+    # Existing presence hours, reused by the new users
+    presence_hours_ids = {
+        (day, start_time, end_time): presence_hours_id
+        for presence_hours_id, day, start_time, end_time in session.execute(
+            select(
+                PresenceHours.id,
+                PresenceHours.day,
+                PresenceHours.start_time,
+                PresenceHours.end_time,
+            )
         )
-        schedule.append(presence_hours)
+    }
+
+    # Assign the ids here, so that the rows of the association table can be built before inserting
+    next_user_id = (session.scalar(select(func.max(User.id))) or 0) + 1
+    next_presence_hours_id = (
+        session.scalar(select(func.max(PresenceHours.id))) or 0
+    ) + 1
+
+    users_rows, presence_hours_rows, user_schedule_rows = [], [], []
+    for user_data in users_data:
+        user_id = next_user_id
+        next_user_id += 1
+        users_rows.append(
+            {
+                "id": user_id,
+                "name": user_data["name"],
+                "age": user_data["age"],
+                "preferred_temperature": user_data["preferred_temperature"],
+            }
+        )
+
+        for schedule_key, days in (
+            ("weekday_schedule", WEEKDAYS),
+            ("weekend_schedule", WEEKENDS),
+        ):
+            schedule = user_data.get(schedule_key)
+            if not schedule:
+                continue
+            for day in days:
+                key = (day, schedule["start_time"], schedule["end_time"])
+                presence_hours_id = presence_hours_ids.get(key)
+                if presence_hours_id is None:
+                    presence_hours_id = next_presence_hours_id
+                    next_presence_hours_id += 1
+                    presence_hours_ids[key] = presence_hours_id
+                    presence_hours_rows.append(
+                        {
+                            "id": presence_hours_id,
+                            "day": day,
+                            "start_time": schedule["start_time"],
+                            "end_time": schedule["end_time"],
+                        }
+                    )
+                user_schedule_rows.append(
+                    {"user_id": user_id, "presence_hours_id": presence_hours_id}
+                )
 
-    return schedule
+    # Bulk insert the rows of each table
+    if users_rows:
+        session.execute(insert(User), users_rows)
+    if presence_hours_rows:
+        session.execute(insert(PresenceHours), presence_hours_rows)
+    if user_schedule_rows:
+        session.execute(insert(user_schedule), user_schedule_rows)
+
+    return len(users_rows)
 
 
 def init_db():
@@ -150,7 +225,11 @@ def init_db():
     """
     # Check if the database is already initialized with the 'users' table
     inspector = inspect(engine)
-    if not inspector.has_table("users"):
+    if inspector.has_table("users"):
+        # Create the indexes missing in databases created by previous versions
+        for index in User.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
+    else:
         # Create the tables
         Base.metadata.create_all(bind=engine)
 
@@ -186,32 +265,8 @@ def init_db():
                     },
                 ]
 
-                # Create User instances
-                for user_data in users_data:
-                    user = User(
-                        name=user_data["name"],
-                        age=user_data["age"],
-                        preferred_temperature=user_data["preferred_temperature"],
-                    )
-
-                    # Define separate schedules for weekdays and weekends
-                    weekday_schedule = user_data["weekday_schedule"]
-                    weekend_schedule = user_data["weekend_schedule"]
-
-                    weekdays = [
-                        Day.MONDAY,
-                        Day.TUESDAY,
-                        Day.WEDNESDAY,
-                        Day.THURSDAY,
-                        Day.FRIDAY,
-                    ]
-                    weekends = [Day.SATURDAY, Day.SUNDAY]
-
-                    user.schedule.extend(create_schedule(weekday_schedule, weekdays))
-                    user.schedule.extend(create_schedule(weekend_schedule, weekends))
-
-                    # Add the user to the session
-                    session.add(user)
+                # Insert the users and their schedules
+                bulk_insert_users(session, users_data)
 
                 # Commit the changes
                 session.commit()
@@ -226,6 +281,55 @@ def init_db():
                 session.close()
 
 
+def create_db_engine(db_path=Config.SQL_DB_PATH):
+    """
+    Create the engine of the SQLite database, tuned for concurrent Streamlit sessions.
+    The WAL journal mode lets the readers run while a writer commits, and synchronous=NORMAL
+    only syncs the journal at checkpoints, which is safe in WAL mode.
+
+    Args:
+        db_path (str): Path of the SQLite database file
+    """
+    db_engine = create_engine(
+        f"sqlite:///{db_path}",
+        pool_size=Config.SQL_POOL_SIZE,
+        max_overflow=Config.SQL_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        connect_args={
+            "check_same_thread": False,
+            "timeout": Config.SQL_BUSY_TIMEOUT,
+        },
+    )
+
+    @event.listens_for(db_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        """
+        Set the SQLite pragmas on each new connection of the pool.
+        """
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    return db_engine
+
+
+@contextmanager
+def session_scope():
+    """
+    Provide a session for a series of operations: commit on success, rollback on error and always close.
+    """
+    session = Session()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
 # Setting up the engine and session
-engine = create_engine(f"sqlite:///{Config.SQL_DB_PATH}")
+engine = create_db_engine()
 Session = sessionmaker(bind=engine)
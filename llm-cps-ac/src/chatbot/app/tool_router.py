@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Keyword router selecting the functions definitions relevant for a query, to reduce the size of the prompt.
+
+Evaluate the router on the offline fixture of queries with:
+    python -m app.tool_router
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-21"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import json
+import re
+
+from app.config import Config
+from app.handler import count_tokens
+
+
+# Groups of functions and the keywords of the queries that need them.
+# A keyword of 4 characters or more also matches the words starting with it (e.g. "warm" matches "warmer").
+# fmt: off
+TOOL_GROUPS = {
+    "set_temperature": {
+        "keywords": [
+            "set", "setpoint", "target", "temperature", "warm", "cold", "hot", "cool",
+            "heat", "increase", "decrease", "raise", "lower", "degree", "thermostat",
+            "comfort", "chilly", "freezing",
+        ],
+        "functions": ["get_set_temperature", "adjust_set_temperature"],
+    },
+    "outside_temperature": {
+        "keywords": [
+            "outside", "outdoor", "exterior", "weather", "forecast", "real", "sunny",
+            "rain", "snow", "winter", "summer",
+        ],
+        "functions": [
+            "get_outside_temperature",
+            "adjust_outside_temperature",
+            "use_real_weather",
+        ],
+    },
+    "building_edge": {
+        "keywords": [
+            "edge", "size", "dimension", "big", "large", "small", "length", "side",
+            "cube", "surface", "meter", "metre",
+        ],
+        "functions": ["get_building_edge", "adjust_building_edge"],
+    },
+    "heat_transfer_coefficient": {
+        "keywords": [
+            "u", "coefficient", "transfer", "insulation", "insulate", "loss", "leak",
+            "thermal", "wall",
+        ],
+        "functions": [
+            "get_heat_transfer_coefficient",
+            "adjust_heat_transfer_coefficient",
+        ],
+    },
+    "boiler": {
+        "keywords": [
+            "boiler", "power", "watt", "w", "kw", "operating", "percentage", "percent",
+            "running", "load",
+        ],
+        "functions": [
+            "get_boiler_power",
+            "adjust_boiler_power",
+            "get_boiler_heat_power",
+            "get_boiler_operating_percentage",
+        ],
+    },
+    "volume_heat_capacity": {
+        "keywords": [
+            "capacity", "inertia", "air", "water", "house", "mass", "volume",
+        ],
+        "functions": [
+            "get_volume_heat_capacity",
+            "adjust_volume_heat_capacity",
+            "get_volume_heat_capacity_var",
+            "change_volume_heat_capacity_var",
+        ],
+    },
+    "fuel": {
+        "keywords": [
+            "fuel", "gas", "mazout", "oil", "wood", "pellet", "electric", "burn",
+            "switch",
+        ],
+        "functions": ["get_boiler_fuel", "change_boiler_fuel", "get_fuel_consumption"],
+    },
+    "building_state": {
+        "keywords": [
+            "temperature", "inside", "indoor", "room", "current", "now", "reach",
+            "will", "eventually", "status", "state", "warm", "cold",
+        ],
+        "functions": [
+            "get_building_temperature",
+            "get_temperature_reached",
+            "get_boiler_operating_percentage",
+        ],
+    },
+    "energy": {
+        "keywords": [
+            "energy", "consumption", "consume", "kwh", "price", "cost", "bill", "chf",
+            "money", "expensive", "cheap", "spend", "spent", "pay", "year", "annual",
+            "total", "hour", "day", "week", "month", "last",
+        ],
+        "functions": [
+            "get_energy_consumption",
+            "get_fuel_consumption",
+            "get_energy_price",
+            "get_energy_accounting",
+            "get_boiler_heat_power",
+        ],
+    },
+    "history": {
+        "keywords": [
+            "history", "past", "was", "were", "last", "night", "yesterday", "ago",
+            "earlier", "previous", "trend", "evolution", "minimum", "maximum", "average",
+        ],
+        "functions": ["get_history"],
+    },
+    "users": {
+        "keywords": [
+            "user", "prefer", "preference", "schedule", "home", "age", "old", "id",
+            "who", "profile", "person", "people", "presence",
+        ],
+        "functions": ["get_user_info", "modify_user_preferred_temperature"],
+    },
+}
+# fmt: on
+
+# Functions always sent to the model (general questions about the heating system)
+DEFAULT_FUNCTIONS = ["ask_vector_db"]
+
+WORD_PATTERN = re.compile(r"\w+")
+QUESTION_PATTERN = re.compile(r"Question:(.*)$", re.DOTALL)
+HUMAN_PATTERN = re.compile(r"Human:(.*?)(?:\n|$)")
+
+
+class ToolRouter:
+    """
+    Select the subset of functions definitions relevant for a query, based on its keywords.
+    If no keyword matches, all the functions definitions are selected so that no capability is lost.
+    """
+
+    def __init__(self, functions_definitions, tool_groups=TOOL_GROUPS):
+        """
+        Initialize the router.
+
+        Args:
+            functions_definitions (list[dict]): All the functions definitions
+            tool_groups (dict): Groups of functions with the keywords selecting them
+        """
+        self.functions_definitions = functions_definitions
+        self.tool_groups = tool_groups
+
+    @staticmethod
+    def _matches(word, keyword):
+        """
+        Check if a word of the query matches a keyword.
+        """
+        return word == keyword or (len(keyword) >= 4 and word.startswith(keyword))
+
+    def _select_names(self, text):
+        """
+        Get the names of the functions selected by the keywords of a text.
+        """
+        words = set(WORD_PATTERN.findall(text.lower()))
+        names = set()
+        for group in self.tool_groups.values():
+            if any(
+                self._matches(word, keyword)
+                for word in words
+                for keyword in group["keywords"]
+            ):
+                names.update(group["functions"])
+        return names
+
+    def select(self, query):
+        """
+        Select the functions definitions relevant for a query.
+        The question of the query is used first, then the previous question of the user (history).
+
+        Args:
+            query (str): Query sent to the model, optionally with the history of the conversation
+        """
+        question = QUESTION_PATTERN.search(query)
+        previous_question = HUMAN_PATTERN.search(query)
+        texts = [question.group(1) if question else query]
+        if previous_question:
+            texts.append(previous_question.group(1))
+
+        for text in texts:
+            names = self._select_names(text)
+            if names:
+                names.update(DEFAULT_FUNCTIONS)
+                return [
+                    definition
+                    for definition in self.functions_definitions
+                    if definition["name"] in names
+                ]
+
+        return self.functions_definitions
+
+
+def evaluate(router, fixture):
+    """
+    Evaluate the router on a fixture of queries with their expected functions.
+
+    Args:
+        router (ToolRouter): Router to evaluate
+        fixture (list[dict]): Queries ("query") with the names of the functions they need ("expected")
+
+    Returns:
+        dict: Accuracy (share of queries with all their expected functions selected), the failed queries,
+            and the average number of tokens of the selected functions definitions compared to all of them
+    """
+    full_size = count_tokens(json.dumps(router.functions_definitions))
+    failures, sizes = [], []
+    for case in fixture:
+        selected = router.select(case["query"])
+        selected_names = {definition["name"] for definition in selected}
+        if not set(case["expected"]) <= selected_names:
+            failures.append(case["query"])
+        sizes.append(count_tokens(json.dumps(selected)))
+
+    average_size = sum(sizes) / len(sizes)
+    return {
+        "accuracy": 1 - len(failures) / len(fixture),
+        "failures": failures,
+        "average_size": average_size,
+        "full_size": full_size,
+        "reduction": 1 - average_size / full_size,
+    }
+
+
+def main():
+    """
+    Main function to evaluate the router on the offline fixture of queries.
+    """
+    with open(Config.FNCT_DEF_PATH, "r") as file:
+        functions_definitions = json.load(file)["functions"]
+    with open(Config.TOOL_ROUTER_FIXTURE_PATH, "r") as file:
+        fixture = json.load(file)
+
+    results = evaluate(ToolRouter(functions_definitions), fixture)
+    print(f"Accuracy: {results['accuracy']:.1%} on {len(fixture)} queries")
+    print(
+        f"Functions definitions: {results['average_size']:.0f} tokens on average "
+        + f"instead of {results['full_size']} ({results['reduction']:.1%} less)"
+    )
+    for query in results["failures"]:
+        print(f"Missing function(s) for: {query}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Accounting of the tokens and latency of the calls to the LLM, with rolling token budgets per session and global.
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-21"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import threading
+import time
+from collections import Counter, deque, namedtuple
+
+from app.cache import TTLCache
+from app.config import Config
+
+
+# Usage of a single call to the LLM
+UsageRecord = namedtuple(
+    "UsageRecord",
+    ["time", "session_id", "prompt_tokens", "completion_tokens", "latency"],
+)
+
+
+class BudgetExceeded(Exception):
+    """
+    Raised when a call to the LLM would exceed the token budget of the session or the global one.
+    """
+
+
+class UsageTracker:
+    """
+    Thread-safe tracker of the LLM usage, shared by all the Streamlit sessions.
+
+    The tokens used in the budget window are kept as running sums, updated when a call is recorded and when
+    the oldest calls leave the window, so that checking a budget does not go through the whole history.
+    The all-time totals are kept for all the sessions together, and per session for the latest active sessions
+    only, so that the tracker does not grow with the number of sessions.
+    """
+
+    def __init__(
+        self,
+        session_budget=Config.SESSION_TOKEN_BUDGET,
+        global_budget=Config.GLOBAL_TOKEN_BUDGET,
+        window=Config.TOKEN_BUDGET_WINDOW,
+        history_size=Config.USAGE_HISTORY_SIZE,
+        sessions_size=Config.USAGE_SESSIONS_SIZE,
+        session_ttl=Config.USAGE_SESSION_TTL,
+    ):
+        """
+        Initialize the tracker.
+
+        Args:
+            session_budget (int): Maximum number of tokens of a session in the window, None for no limit
+            global_budget (int): Maximum number of tokens of all the sessions in the window, None for no limit
+            window (float): Duration of the rolling budget window in seconds
+            history_size (int): Number of latest calls kept to compute the latency metrics
+            sessions_size (int): Number of sessions whose totals are kept, the least recently active one is
+                dropped first
+            session_ttl (float): Time in seconds after which the totals of a session without calls are dropped
+        """
+        self.session_budget = session_budget
+        self.global_budget = global_budget
+        self.window = window
+
+        # Calls in the budget window, with the running sums of their tokens
+        self._window_records = deque()
+        self._window_tokens = Counter()  # session id -> tokens
+        self._window_total = 0
+
+        # All-time totals, the totals of the latest active sessions, and the latencies of the latest calls
+        self._calls = 0
+        self._prompt_tokens = 0
+        self._completion_tokens = 0
+        self._sessions = TTLCache(sessions_size, session_ttl)  # session id -> Counter
+        self._latencies = deque(maxlen=history_size)
+
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        """
+        Remove the calls which left the budget window from the running sums.
+        """
+        while (
+            self._window_records and self._window_records[0].time <= now - self.window
+        ):
+            record = self._window_records.popleft()
+            tokens = record.prompt_tokens + record.completion_tokens
+            self._window_tokens[record.session_id] -= tokens
+            if self._window_tokens[record.session_id] <= 0:
+                del self._window_tokens[record.session_id]
+            self._window_total -= tokens
+
+    def check(self, session_id=None):
+        """
+        Check that the session and the global budgets are not exhausted.
+
+        Raises:
+            BudgetExceeded: If one of the budgets is exhausted
+        """
+        with self._lock:
+            self._expire(time.monotonic())
+            if (
+                self.session_budget is not None
+                and self._window_tokens[session_id] >= self.session_budget
+            ):
+                raise BudgetExceeded(f"Token budget of session {session_id} exhausted")
+            if (
+                self.global_budget is not None
+                and self._window_total >= self.global_budget
+            ):
+                raise BudgetExceeded("Global token budget exhausted")
+
+    def record(self, session_id, prompt_tokens, completion_tokens, latency):
+        """
+        Record the usage of a call to the LLM.
+
+        Args:
+            session_id (str): Id of the session which made the call
+            prompt_tokens (int): Number of tokens of the prompt
+            completion_tokens (int): Number of tokens of the completion
+            latency (float): Duration of the call in seconds
+        """
+        now = time.monotonic()
+        record = UsageRecord(now, session_id, prompt_tokens, completion_tokens, latency)
+        with self._lock:
+            self._expire(now)
+            self._window_records.append(record)
+            self._window_tokens[session_id] += prompt_tokens + completion_tokens
+            self._window_total += prompt_tokens + completion_tokens
+
+            self._calls += 1
+            self._prompt_tokens += prompt_tokens
+            self._completion_tokens += completion_tokens
+            self._latencies.append(latency)
+
+            # Setting the totals again renews the time to live of the session
+            session = self._sessions.get(session_id) or Counter()
+            session["calls"] += 1
+            session["prompt_tokens"] += prompt_tokens
+            session["completion_tokens"] += completion_tokens
+            self._sessions.set(session_id, session)
+
+    def session_tokens(self, session_id):
+        """
+        Get the total number of tokens used by a session (0 once its totals are dropped).
+        """
+        return self.session_metrics(session_id)["total_tokens"]
+
+    def session_metrics(self, session_id):
+        """
+        Get the metrics of a single session, shown to its user.
+        """
+        with self._lock:
+            self._expire(time.monotonic())
+            session = self._sessions.get(session_id) or Counter()
+            return {
+                "calls": session["calls"],
+                "prompt_tokens": session["prompt_tokens"],
+                "completion_tokens": session["completion_tokens"],
+                "total_tokens": session["prompt_tokens"] + session["completion_tokens"],
+                "window_tokens": self._window_tokens[session_id],
+                "session_budget": self.session_budget,
+            }
+
+    def metrics(self):
+        """
+        Get the aggregated metrics of all the sessions, for the operators.
+        """
+        with self._lock:
+            self._expire(time.monotonic())
+            latencies = sorted(self._latencies)
+            prompt_tokens = self._prompt_tokens
+            completion_tokens = self._completion_tokens
+            mean_latency, p95_latency = None, None
+            if latencies:
+                mean_latency = sum(latencies) / len(latencies)
+                p95_latency = latencies[int(0.95 * (len(latencies) - 1))]
+            return {
+                "sessions": len(self._sessions.items()),
+                "calls": self._calls,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "mean_latency": mean_latency,
+                "p95_latency": p95_latency,
+                "window_tokens": self._window_total,
+                "global_budget": self.global_budget,
+                "session_budget": self.session_budget,
+            }
+
+
+# Usage of the LLM, shared by all the sessions
+usage_tracker = UsageTracker()
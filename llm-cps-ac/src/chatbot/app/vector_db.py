@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 """
-Create and load a vector store used by the chatbot.
+Create and load a vector store used by the chatbot, and the keyword index built alongside it.
 
 https://python.langchain.com/docs/modules/data_connection/vectorstores/
 """
@@ -16,18 +16,23 @@ __email__ = "philippe.marziale@edu.hefr.ch"
 
 
 import pickle
+from functools import lru_cache
 
+from app.cache import answer_cache
 from app.config import Config
+from app.embeddings import get_embeddings
+from app.keyword_index import InvertedIndex
 
 from langchain.document_loaders import DirectoryLoader, TextLoader
-from langchain.embeddings import OpenAIEmbeddings
+from langchain.schema import BaseRetriever
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.vectorstores.faiss import FAISS
 
 
 def create_vectorstore():
     """
-    Create a vector store from text documents using LangChain and OpenAI embeddings.
+    Create a vector store from text documents using LangChain and the configured embeddings.
+    A keyword index of the same documents is created alongside the vector store.
     """
     # Load all .txt files in the data folder
     loader = DirectoryLoader(
@@ -45,20 +50,33 @@ def create_vectorstore():
     )
     documents = text_splitter.split_documents(raw_documents)
 
-    # Create embeddings for each document
-    embeddings = OpenAIEmbeddings(openai_api_key=Config.OPENAI_API_KEY)
+    # Create embeddings for each document and store them into a FAISS vector store
+    vectorstore = FAISS.from_documents(documents, get_embeddings())
 
-    # Store embeddings into a FAISS vector store
-    vectorstore = FAISS.from_documents(documents, embeddings)
+    # Keep the embedding provider with the index, but not the embeddings object itself
+    # (it is attached again when loading, see get_vectorstore)
+    vectorstore.embedding_provider = Config.EMBEDDING_PROVIDER
+    vectorstore.embedding_function = None
 
     # Serialize and store the vector store into a file
     with open(Config.VECTOR_STORE_PATH, "wb") as f:
         pickle.dump(vectorstore, f)
 
+    # Create the keyword index of the same documents and store it into a file
+    with open(Config.KEYWORD_INDEX_PATH, "wb") as f:
+        pickle.dump(InvertedIndex(documents), f)
 
+    # The loaded vector store and keyword index, and the answers given with them, are outdated
+    get_vectorstore.cache_clear()
+    get_keyword_index.cache_clear()
+    answer_cache.clear()
+
+
+@lru_cache(maxsize=None)
 def get_vectorstore():
     """
     Function to load the vector store from disk. If it doesn't exist, create it.
+    The vector store is loaded only once per process, until it is recreated.
     """
     try:
         # Attempt to load the vector store
@@ -72,4 +90,125 @@ def get_vectorstore():
         with open(Config.VECTOR_STORE_PATH, "rb") as file:
             vectorstore = pickle.load(file)
 
+    # Rebuild the vector store if it was created with another embedding provider
+    # (stores without provider were created with OpenAI embeddings)
+    if (
+        getattr(vectorstore, "embedding_provider", "openai")
+        != Config.EMBEDDING_PROVIDER
+    ):
+        print("Vectorstore created with another embedding provider. Recreating it.")
+        create_vectorstore()
+        with open(Config.VECTOR_STORE_PATH, "rb") as file:
+            vectorstore = pickle.load(file)
+
+    # Attach the embeddings used to embed the queries
+    vectorstore.embedding_function = get_embeddings().embed_query
+
     return vectorstore
+
+
+@lru_cache(maxsize=None)
+def get_keyword_index():
+    """
+    Function to load the keyword index from disk. If it doesn't exist, create it with the vector store.
+    The keyword index is loaded only once per process, until it is recreated.
+    """
+    try:
+        with open(Config.KEYWORD_INDEX_PATH, "rb") as file:
+            keyword_index = pickle.load(file)
+
+    except FileNotFoundError:
+        print("Keyword index not found. Creating it with the vectorstore.")
+        create_vectorstore()
+        with open(Config.KEYWORD_INDEX_PATH, "rb") as file:
+            keyword_index = pickle.load(file)
+
+    return keyword_index
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever combining the keyword index (BM25) and the vector store (dense similarity).
+
+    Queries containing an identifier found in the documents (e.g. a model number) are answered
+    with the keyword index only, without embedding the query. Otherwise, the results of both
+    indexes are merged by their normalized score.
+    """
+
+    def __init__(self, vectorstore, keyword_index, k=4, keyword_weight=0.5):
+        """
+        Initialize the hybrid retriever.
+
+        Args:
+            vectorstore (FAISS): Vector store used for dense similarity
+            keyword_index (InvertedIndex): Keyword index used for exact term matching
+            k (int): Number of documents to return
+            keyword_weight (float): Weight of the keyword score in the merged score, between 0 and 1
+        """
+        self.vectorstore = vectorstore
+        self.keyword_index = keyword_index
+        self.k = k
+        self.keyword_weight = keyword_weight
+
+    @staticmethod
+    def _normalize_scores(hits):
+        """
+        Scale the scores of the hits between 0 and 1 (best hit = 1).
+        """
+        best_score = max((score for _, score in hits), default=0)
+        if best_score <= 0:
+            return [(document, 0.0) for document, _ in hits]
+        return [(document, score / best_score) for document, score in hits]
+
+    def get_relevant_documents(self, query):
+        """
+        Get the documents relevant for a query.
+        """
+        keyword_hits = self.keyword_index.search(query, self.k)
+
+        # Exact match, no need to embed the query
+        if keyword_hits and self.keyword_index.has_exact_match(query):
+            return [document for document, _ in keyword_hits]
+
+        # Convert the FAISS distances (lower is better) into similarities
+        dense_hits = [
+            (document, 1 / (1 + distance))
+            for document, distance in self.vectorstore.similarity_search_with_score(
+                query, k=self.k
+            )
+        ]
+
+        # Merge both results by their weighted normalized score
+        merged = {}
+        for weight, hits in (
+            (self.keyword_weight, self._normalize_scores(keyword_hits)),
+            (1 - self.keyword_weight, self._normalize_scores(dense_hits)),
+        ):
+            for document, score in hits:
+                key = (document.page_content, document.metadata.get("source"))
+                previous_document, previous_score = merged.get(key, (document, 0.0))
+                merged[key] = (previous_document, previous_score + weight * score)
+
+        best = sorted(merged.values(), key=lambda item: item[1], reverse=True)
+        return [document for document, _ in best[: self.k]]
+
+    async def aget_relevant_documents(self, query):
+        """
+        Get the documents relevant for a query (asynchronous version).
+        """
+        return self.get_relevant_documents(query)
+
+
+def get_retriever():
+    """
+    Get the retriever used to answer the questions: hybrid (keyword and vector) or vector only.
+    """
+    vectorstore = get_vectorstore()
+    if not Config.HYBRID_RETRIEVAL:
+        return vectorstore.as_retriever(search_kwargs={"k": Config.RETRIEVAL_K})
+    return HybridRetriever(
+        vectorstore,
+        get_keyword_index(),
+        k=Config.RETRIEVAL_K,
+        keyword_weight=Config.KEYWORD_WEIGHT,
+    )
@@ -16,46 +16,64 @@ __version__ = "1.3"
 
 
 import json
-import os
 import streamlit as st
+import uuid
 from streamlit_chat import message as st_message
 
 from app.functions import all_functions
 from app.handler import OpenAIHandler
-from app.vector_db import create_vectorstore
+from app.tool_router import ToolRouter
+from app.usage import usage_tracker
+from app.vector_db import get_keyword_index, get_vectorstore
 from app.sql_db import init_db
 from app.config import Config, ChatbotPrompt
 
 
-# Get the functions definitions from the JSON file
-with open(Config.FNCT_DEF_PATH, "r") as file:
-    functions_definitions = json.load(file)["functions"]
+@st.cache_resource
+def get_handler():
+    """
+    Create the OpenAIHandler, only once per process: it is shared by all the sessions and reruns.
+    """
+    # Get the functions definitions from the JSON file
+    with open(Config.FNCT_DEF_PATH, "r") as file:
+        functions_definitions = json.load(file)["functions"]
+
+    # Only send the relevant functions definitions with each query
+    tool_router = ToolRouter(functions_definitions) if Config.TOOL_ROUTING else None
+
+    return OpenAIHandler(
+        all_functions,
+        functions_definitions,
+        ChatbotPrompt.system_message,
+        tool_router=tool_router,
+        usage_tracker=usage_tracker,
+    )
 
-# Initialize the OpenAIHandler
-handler = OpenAIHandler(
-    all_functions, functions_definitions, ChatbotPrompt.system_message
-)
 
-# Create the vectorstore if it doesn't exist
-if not os.path.exists(Config.VECTOR_STORE_PATH):
-    create_vectorstore()
+@st.cache_resource
+def init_databases():
+    """
+    Initialize the databases, only once per process.
+    """
+    # Load the vectorstore and the keyword index in memory (they are created if they don't exist)
+    get_vectorstore()
+    get_keyword_index()
 
-# Initialize the (SQL) database
-init_db()
+    # Initialize the (SQL) database
+    init_db()
+
+
+# Initialize the OpenAIHandler and the databases
+handler = get_handler()
+init_databases()
 
 
 def run_conversation(query):
     """
     Run a conversation with the heating system using LangChain and OpenAI's chat models.
+    Yield the tokens of the answer as they are generated, the tokens used are recorded by the handler.
     """
-    # Get the response from the LLM and the total token count
-    response, total_tokens = handler.send_response(query)
-
-    # Add tokens from the response to the total token count
-    st.session_state.token_count += total_tokens
-
-    # Return the response
-    return response
+    yield from handler.stream_response(query, st.session_state.session_id)
 
 
 def main():
@@ -74,9 +92,9 @@ def main():
     if "history" not in st.session_state:
         st.session_state.history = []
 
-    # Initialize the total token count
-    if "token_count" not in st.session_state:
-        st.session_state.token_count = 0
+    # Initialize the session id, used to account the tokens of the session
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = str(uuid.uuid4())
 
     # Display the chat history
     for i, chat in enumerate(st.session_state.history):
@@ -84,10 +102,16 @@ def main():
 
     def generate_answer():
         """
-        Generate the bot's answer and add it to the chat history.
+        Set the user's message as pending, its answer is generated (streamed) below the chat history.
         """
-        # Get the user's message
-        user_message = st.session_state.input_text
+        st.session_state.pending_message = st.session_state.input_text
+
+        # Clear the input text
+        st.session_state.input_text = ""
+
+    # Generate the bot's answer to the pending user's message
+    if st.session_state.get("pending_message"):
+        user_message = st.session_state.pop("pending_message")
 
         # Get previous user question and bot answer
         if len(st.session_state.history) > 0:
@@ -100,21 +124,35 @@ def main():
         # Create the next message to send to the bot (history depth of 1)
         next_message = f"History:\nHuman: {prev_user_question}\nAssistant: {prev_bot_answer}\nQuestion: {user_message}"
 
-        # Generate the bot's answer
-        answer = run_conversation(next_message)
+        # Display the user's message
+        st_message(user_message, is_user=True, key=str(len(st.session_state.history)))
+
+        # Display the bot's answer as it is generated
+        answer = ""
+        answer_placeholder = st.empty()
+        for token in run_conversation(next_message):
+            answer += token
+            answer_placeholder.markdown(answer + "▌")
+        answer_placeholder.empty()
+        st_message(answer, key=str(len(st.session_state.history) + 1))
 
         # Add the user's message and the bot's answer to the chat history
         st.session_state.history.append({"message": user_message, "is_user": True})
         st.session_state.history.append({"message": answer, "is_user": False})
 
-        # Clear the input text
-        st.session_state.input_text = ""
-
     # Create a text input field for the user's message
     st.text_input("Talk to the bot", key="input_text", on_change=generate_answer)
 
-    # Display the total token count
-    st.caption(f"Used {st.session_state.token_count} tokens")
+    # Display the usage of the current session
+    session_metrics = usage_tracker.session_metrics(st.session_state.session_id)
+    st.caption(f"Used {session_metrics['total_tokens']} tokens")
+    with st.expander("Usage metrics"):
+        st.json(session_metrics)
+
+    # Display the usage of all the sessions to the operators only
+    if Config.SHOW_GLOBAL_USAGE:
+        with st.expander("Usage metrics of all the sessions"):
+            st.json(usage_tracker.metrics())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the LLM backends, with the deterministic mock backend.
+
+Use the command "pytest" to run the tests.
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-31"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import json
+import unittest
+
+from app.backends import MockBackend, OpenAIBackend, get_backend
+from app.config import Config
+from app.handler import OpenAIHandler
+
+
+def definitions(*names):
+    return [{"name": name, "parameters": {}} for name in names]
+
+
+class TestMockBackend(unittest.TestCase):
+    """Test the scripted function calls and answers of the mock backend."""
+
+    def setUp(self):
+        self.backend = MockBackend()
+
+    def message(self, question, functions):
+        messages = [{"role": "user", "content": f"Question: {question}"}]
+        return self.backend.create(messages, functions)["choices"][0]["message"]
+
+    # Test the function call of a question, with the arguments captured in the question
+    def test_function_call(self):
+        message = self.message(
+            "Please increase the set temperature by 2.5 degrees",
+            definitions("adjust_set_temperature", "get_set_temperature"),
+        )
+        self.assertEqual(message["function_call"]["name"], "adjust_set_temperature")
+        self.assertEqual(
+            json.loads(message["function_call"]["arguments"]),
+            {"temperature": 2.5, "action": "increase"},
+        )
+        message = self.message("What is user 2 like?", definitions("get_user_info"))
+        self.assertEqual(
+            json.loads(message["function_call"]["arguments"]), {"user_id": 2}
+        )
+
+    # Test that only the available functions are called
+    def test_unavailable_function(self):
+        message = self.message(
+            "What is the set temperature?", definitions("get_boiler_fuel")
+        )
+        self.assertEqual(message["content"], "I am a mock assistant.")
+        self.assertNotIn("function_call", message)
+
+    # Test the answer with the result of a function, and the usage of the response
+    def test_function_result(self):
+        messages = [
+            {"role": "user", "content": "What is the fuel?"},
+            {"role": "function", "name": "get_boiler_fuel", "content": "pellets"},
+        ]
+        response = self.backend.create(messages)
+        self.assertIn("pellets", response["choices"][0]["message"]["content"])
+        usage = response["usage"]
+        self.assertEqual(
+            usage["total_tokens"], usage["prompt_tokens"] + usage["completion_tokens"]
+        )
+
+    # Test that the streamed chunks rebuild the same message
+    def test_stream(self):
+        functions = definitions("get_boiler_fuel")
+        messages = [{"role": "user", "content": "Which fuel is used?"}]
+        chunks = list(self.backend.create(messages, functions, stream=True))
+        name = "".join(
+            chunk["choices"][0]["delta"]["function_call"].get("name", "")
+            for chunk in chunks
+        )
+        self.assertEqual(name, "get_boiler_fuel")
+
+        messages = [{"role": "user", "content": "Hello"}]
+        content = "".join(
+            chunk["choices"][0]["delta"]["content"]
+            for chunk in self.backend.create(messages, stream=True)
+        )
+        self.assertEqual(content, "I am a mock assistant.")
+
+    # Test a whole conversation of the handler with a function call
+    def test_handler(self):
+        handler = OpenAIHandler(
+            {"get_boiler_fuel": lambda: "pellets"},
+            definitions("get_boiler_fuel"),
+            "You are a heating assistant.",
+            backend=self.backend,
+        )
+        answer, tokens = handler.send_response("Which fuel is used?")
+        self.assertEqual(answer, "The result of get_boiler_fuel is: pellets")
+        self.assertGreater(tokens, 0)
+        self.assertEqual(
+            "".join(handler.stream_response("Which fuel is used?")), answer
+        )
+
+
+class TestGetBackend(unittest.TestCase):
+    """Test the selection of the backend."""
+
+    # Test the backends by name
+    def test_get_backend(self):
+        self.assertIsInstance(get_backend("mock"), MockBackend)
+        if Config.OPENAI_API_KEY is not None:
+            self.assertIsInstance(get_backend("openai"), OpenAIBackend)
+        with self.assertRaises(ValueError):
+            get_backend("unknown")
+
+
+if __name__ == "__main__":
+    unittest.main()
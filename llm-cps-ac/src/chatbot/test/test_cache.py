@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the in-memory caches of the chatbot.
+
+Use the command "pytest" to run the tests.
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-31"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import unittest
+from unittest.mock import patch
+
+from app.cache import AnswerCache, TTLCache, UserCache
+
+
+class FakeEmbeddings:
+    """Embeddings of a few known questions, counting the calls."""
+
+    VECTORS = {
+        "what is the boiler power": [1, 0, 0],
+        "what s the power of the boiler": [0.99, 0.1, 0],
+        "who are you": [0, 0, 1],
+    }
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self.VECTORS.get(text, [0, 1, 0])
+
+
+class TestTTLCache(unittest.TestCase):
+    """Test the bounded cache with LRU eviction and expiration."""
+
+    # Test that the least recently used entry is evicted first
+    def test_lru_eviction(self):
+        cache = TTLCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 2)
+
+    # Test that the entries expire after their time to live
+    def test_expiration(self):
+        cache = TTLCache(10, ttl=5)
+        with patch("app.cache.time.monotonic", return_value=100):
+            cache.set("a", 1)
+        with patch("app.cache.time.monotonic", return_value=104):
+            self.assertEqual(cache.get("a"), 1)
+        with patch("app.cache.time.monotonic", return_value=105):
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual(cache.items(), [])
+
+    # Test the removal of the entries
+    def test_pop_and_clear(self):
+        cache = TTLCache(10)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.pop("a"), 1)
+        self.assertEqual(cache.pop("a", "missing"), "missing")
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    # Test that the size must be positive
+    def test_invalid_size(self):
+        with self.assertRaises(ValueError):
+            TTLCache(0)
+
+
+class TestAnswerCache(unittest.TestCase):
+    """Test the cache of the answers of the vector database."""
+
+    # Test that identical questions match without any embedding by default
+    def test_exact_match(self):
+        embeddings = FakeEmbeddings()
+        cache = AnswerCache(10, embeddings=embeddings)
+        cache.set("What is the boiler power?", "30 kW")
+        self.assertEqual(cache.get("what is the  BOILER power"), "30 kW")
+        self.assertIsNone(cache.get("Who are you?"))
+        self.assertEqual(embeddings.calls, 0)
+
+    # Test that similar questions match when a similarity threshold is given
+    def test_similar_match(self):
+        cache = AnswerCache(10, similarity_threshold=0.95, embeddings=FakeEmbeddings())
+        cache.set("What is the boiler power?", "30 kW")
+        cache.set("Who are you?", "Opti")
+        self.assertEqual(cache.get("What's the power of the boiler?"), "30 kW")
+        self.assertIsNone(cache.get("Is it sunny?"))
+
+    # Test that clearing the cache removes the answers
+    def test_clear(self):
+        cache = AnswerCache(10, similarity_threshold=0.95, embeddings=FakeEmbeddings())
+        cache.set("Who are you?", "Opti")
+        cache.clear()
+        self.assertIsNone(cache.get("Who are you?"))
+
+
+class TestUserCache(unittest.TestCase):
+    """Test the read-through cache of the users."""
+
+    # Test the reads by id and the invalidation of a user
+    def test_get_and_invalidate(self):
+        cache = UserCache(10)
+        cache.set({"id": 1, "name": "Steve", "preferred_temperature": 21})
+        self.assertEqual(cache.get(1)["name"], "Steve")
+        cache.invalidate(1)
+        self.assertIsNone(cache.get(1))
+        self.assertIsNone(cache.get(None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the functions of the chatbot using the SQL database, on a temporary database.
+
+Use the command "pytest" to run the tests.
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-31"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from app import functions
+from app.cache import tool_cache, user_cache
+from app.sql_db import Base, Session, User, bulk_insert_users, create_db_engine
+
+
+class TestUserFunctions(unittest.TestCase):
+    """Test the functions reading and modifying the users, with the user cache."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = create_db_engine(os.path.join(self.directory.name, "test.db"))
+        Base.metadata.create_all(bind=self.engine)
+        Session.configure(bind=self.engine)
+        with Session() as session:
+            bulk_insert_users(
+                session,
+                [
+                    {"name": "Steve", "age": 28, "preferred_temperature": 19},
+                    {"name": "Steve", "age": 45, "preferred_temperature": 22},
+                ],
+            )
+            session.commit()
+        user_cache.clear()
+
+    def tearDown(self):
+        user_cache.clear()
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def read_preferred_temperature(self, user_id):
+        with Session() as session:
+            return session.get(User, user_id).preferred_temperature
+
+    # Test that a user read by id is cached, and a user read by name is not (names are not unique)
+    def test_get_user_info(self):
+        self.assertEqual(json.loads(functions.get_user_info(user_id=2))["age"], 45)
+        self.assertEqual(user_cache.get(2)["age"], 45)
+
+        functions.get_user_info(user_name="Steve")
+        self.assertEqual(
+            json.loads(functions.get_user_info(user_name="Steve"))["id"], 1
+        )
+        self.assertEqual(json.loads(functions.get_user_info(user_id=2))["id"], 2)
+
+    # Test that the cached user is invalidated after the modification is committed
+    def test_modify_user_preferred_temperature(self):
+        functions.get_user_info(user_id=1)
+        committed = []
+        invalidate = user_cache.invalidate
+
+        def check_committed(user_id):
+            committed.append(self.read_preferred_temperature(user_id))
+            invalidate(user_id)
+
+        with mock.patch.object(user_cache, "invalidate", check_committed):
+            result = functions.modify_user_preferred_temperature(
+                2, "increase", user_id=1
+            )
+        self.assertEqual(result, "Preferred temperature modified to 21.0°C")
+        self.assertEqual(committed, [21])
+        self.assertIsNone(user_cache.get(1))
+        self.assertEqual(
+            json.loads(functions.get_user_info(user_id=1))["preferredTemperature"], 21
+        )
+
+    # Test that a mismatched name and id modify nothing
+    def test_modify_mismatched_user(self):
+        result = functions.modify_user_preferred_temperature(
+            25, "set", user_name="Marie", user_id=1
+        )
+        self.assertEqual(result, "User not found")
+        result = functions.modify_user_preferred_temperature(
+            25, "set", user_name="Steve", user_id=2
+        )
+        self.assertIn("do not match", result)
+        self.assertEqual(self.read_preferred_temperature(2), 22)
+
+
+class FakeResponse:
+    """Response of the simulator API."""
+
+    def __init__(self, value):
+        self.value = value
+        self.ok = True
+
+    def json(self):
+        return self.value
+
+
+class TestAPIFunctions(unittest.TestCase):
+    """Test the functions of the simulator API, with the tool cache."""
+
+    def setUp(self):
+        self.set_temperature = 20
+        self.gets = 0
+        tool_cache.clear()
+
+        def get(url):
+            self.gets += 1
+            return FakeResponse({"set_temperature": self.set_temperature})
+
+        def post(url, data):
+            self.set_temperature = json.loads(data)["value"]
+            return FakeResponse({"message": "Set temperature successfully set"})
+
+        for name, function in (("get", get), ("post", post)):
+            patcher = mock.patch.object(functions.requests, name, function)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(tool_cache.clear)
+
+    # Test that the repeated reads are cached
+    def test_cached_read(self):
+        functions.get_set_temperature()
+        functions.get_set_temperature()
+        self.assertEqual(self.gets, 1)
+
+    # Test that a relative change is based on the current value, not on a cached one
+    def test_relative_change(self):
+        functions.get_set_temperature()
+        self.set_temperature = 18  # Written by another process
+        functions.adjust_set_temperature(2, "increase")
+        self.assertEqual(self.set_temperature, 20)
+        self.assertEqual(functions.get_set_temperature(), {"set_temperature": 20})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the bulk import of the users, on a temporary database.
+
+Use the command "pytest" to run the tests.
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-31"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import json
+import os
+import tempfile
+import unittest
+from datetime import time
+
+from app.import_users import read_csv, read_json
+from app.sql_db import (
+    Base,
+    Day,
+    PresenceHours,
+    Session,
+    User,
+    bulk_insert_users,
+    create_db_engine,
+    user_schedule,
+)
+
+
+class TestBulkInsertUsers(unittest.TestCase):
+    """Test the bulk insert of the users and of their schedules."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = create_db_engine(os.path.join(self.directory.name, "test.db"))
+        Base.metadata.create_all(bind=self.engine)
+        Session.configure(bind=self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    # Test that the users get their schedules and that identical presence hours are shared
+    def test_insert(self):
+        schedule = {"start_time": time(7, 0), "end_time": time(17, 0)}
+        users_data = [
+            {"name": "Anna", "age": 30, "preferred_temperature": 20},
+            {
+                "name": "Bob",
+                "age": 40,
+                "preferred_temperature": 21,
+                "weekday_schedule": schedule,
+            },
+            {
+                "name": "Carl",
+                "age": 50,
+                "preferred_temperature": 22,
+                "weekday_schedule": schedule,
+                "weekend_schedule": schedule,
+            },
+        ]
+        with Session() as session:
+            self.assertEqual(bulk_insert_users(session, users_data), 3)
+            session.commit()
+
+        with Session() as session:
+            users = {user.name: user for user in session.query(User)}
+            self.assertEqual(len(users["Anna"].schedule), 0)
+            self.assertEqual(len(users["Bob"].schedule), 5)
+            self.assertEqual(len(users["Carl"].schedule), 7)
+            self.assertEqual(session.query(PresenceHours).count(), 7)
+            self.assertEqual(session.query(user_schedule).count(), 12)
+            days = {presence.day for presence in users["Bob"].schedule}
+            self.assertNotIn(Day.SUNDAY, days)
+
+    # Test that a second import reuses the presence hours and continues the ids
+    def test_insert_twice(self):
+        users_data = [
+            {
+                "name": "Anna",
+                "age": 30,
+                "preferred_temperature": 20,
+                "weekend_schedule": {"start_time": time(9), "end_time": time(23)},
+            }
+        ]
+        with Session() as session:
+            bulk_insert_users(session, users_data)
+            bulk_insert_users(session, users_data)
+            session.commit()
+
+        with Session() as session:
+            self.assertEqual([user.id for user in session.query(User)], [1, 2])
+            self.assertEqual(session.query(PresenceHours).count(), 2)
+            self.assertEqual(session.query(user_schedule).count(), 4)
+
+    # Test the files read by the import command, with and without schedules
+    def test_read_files(self):
+        with open(self.path("users.csv"), "w") as file:
+            file.write(
+                "name,age,preferred_temperature,weekday_start,weekday_end,weekend_start,weekend_end\n"
+                + "Anna,30,20.5,07:00,17:00,,\n"
+            )
+        with open(self.path("users.json"), "w") as file:
+            json.dump(
+                [
+                    {
+                        "name": "Anna",
+                        "age": 30,
+                        "preferred_temperature": 20.5,
+                        "weekday_schedule": {
+                            "start_time": "07:00",
+                            "end_time": "17:00",
+                        },
+                    }
+                ],
+                file,
+            )
+
+        for users in (
+            read_csv(self.path("users.csv")),
+            read_json(self.path("users.json")),
+        ):
+            self.assertEqual(users[0]["preferred_temperature"], 20.5)
+            self.assertEqual(users[0]["weekday_schedule"]["end_time"], time(17, 0))
+            self.assertIsNone(users[0]["weekend_schedule"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the resilience of the calls to the OpenAI API (retries, circuit breaker and fallback answer),
+with a fake OpenAI-compatible HTTP server on localhost instead of the API.
+
+Use the command "pytest" to run the tests.
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-31"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import http.server
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+import openai
+
+from app.backends import OpenAIBackend
+from app.handler import OpenAIHandler, error_message
+from app.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilientChatCompletion,
+    backoff_delay,
+    is_transient,
+)
+
+
+RESPONSE = {
+    "id": "chatcmpl-test",
+    "object": "chat.completion",
+    "choices": [
+        {
+            "index": 0,
+            "message": {"role": "assistant", "content": "Hello"},
+            "finish_reason": "stop",
+        }
+    ],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11},
+}
+
+
+class FakeServer:
+    """
+    Fake OpenAI-compatible server on localhost, answering the chat completions with the given (status, delay)
+    responses in order, and then with RESPONSE.
+    """
+
+    def __init__(self, responses=()):
+        self.responses = list(responses)
+        self.calls = []
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                server.calls.append((self.path, json.loads(body)))
+                status, delay = (
+                    server.responses.pop(0) if server.responses else (200, 0)
+                )
+                time.sleep(delay)
+                if status == 200:
+                    data = RESPONSE
+                else:
+                    data = {"error": {"message": f"HTTP {status}", "type": "fake"}}
+                content = json.dumps(data).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(content)))
+                    self.end_headers()
+                    self.wfile.write(content)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped waiting (timeout)
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_port}/v1"
+        threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True
+        ).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def backend(self, chat_completion):
+        """Get a backend calling the fake server through the OpenAI client."""
+        return OpenAIBackend(
+            model="gpt",
+            api_base=self.url,
+            api_key="test",
+            chat_completion=chat_completion,
+        )
+
+
+def start_server(test, responses=()):
+    """Start a fake server, stopped at the end of the test."""
+    server = FakeServer(responses)
+    test.addCleanup(server.close)
+    return server
+
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+class TestRetries(unittest.TestCase):
+    """Test the retries of the transient errors, with exponential backoff."""
+
+    def setUp(self):
+        self.delays = []
+
+    def create(self, server, max_retries=3, timeout=5):
+        chat_completion = ResilientChatCompletion(
+            timeout=timeout,
+            max_retries=max_retries,
+            base_delay=1,
+            max_delay=4,
+            circuit_breaker=CircuitBreaker(failure_threshold=10),
+            sleep=self.delays.append,
+        )
+        return server.backend(chat_completion).create(MESSAGES)
+
+    # Test that the HTTP 429 and 5xx errors are retried until the call succeeds
+    def test_retry(self):
+        server = start_server(self, [(429, 0), (503, 0), (502, 0)])
+        response = self.create(server)
+        self.assertEqual(response["choices"][0]["message"]["content"], "Hello")
+        self.assertEqual(len(server.calls), 4)
+        self.assertEqual(server.calls[0][0], "/v1/chat/completions")
+        self.assertEqual(server.calls[0][1]["messages"], MESSAGES)
+        self.assertEqual(len(self.delays), 3)
+
+    # Test that a response slower than the timeout is retried
+    def test_timeout(self):
+        server = start_server(self, [(200, 1)])
+        start = time.monotonic()
+        response = self.create(server, timeout=0.2)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(response["choices"][0]["message"]["content"], "Hello")
+        self.assertEqual(len(server.calls), 2)
+        self.assertEqual(len(self.delays), 1)
+
+    # Test that the last error is raised once the retries are exhausted
+    def test_retries_exhausted(self):
+        server = start_server(self, [(500, 0)] * 3)
+        with self.assertRaises(openai.error.APIError) as context:
+            self.create(server, max_retries=2)
+        self.assertEqual(context.exception.http_status, 500)
+        self.assertEqual(len(server.calls), 3)
+
+    # Test that the errors of the request are not retried
+    def test_no_retry(self):
+        server = start_server(self, [(400, 0)])
+        with self.assertRaises(openai.error.InvalidRequestError):
+            self.create(server)
+        self.assertEqual(len(server.calls), 1)
+        self.assertEqual(self.delays, [])
+        self.assertFalse(is_transient(openai.error.APIError("bad", http_status=400)))
+        self.assertTrue(is_transient(openai.error.APIError("down", http_status=502)))
+
+    # Test that the backoff delays grow exponentially up to the maximum, with jitter
+    def test_backoff_delay(self):
+        with mock.patch("app.resilience.random.uniform", lambda low, high: high):
+            delays = [backoff_delay(attempt, 1, 4) for attempt in range(4)]
+        self.assertEqual(delays, [1, 2, 4, 4])
+        for attempt in range(10):
+            self.assertTrue(0 <= backoff_delay(attempt, 1, 4) <= 4)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test the states of the circuit breaker."""
+
+    def setUp(self):
+        self.now = 1000
+        patcher = mock.patch("app.resilience.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    # Test the circuit opening, then half-open after the recovery timeout, then closed after a success
+    def test_open_half_open_closed(self):
+        server = start_server(self, [(503, 0)] * 2)
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=30)
+        backend = server.backend(
+            ResilientChatCompletion(
+                max_retries=5, circuit_breaker=breaker, sleep=lambda delay: None
+            )
+        )
+
+        with self.assertRaises(CircuitOpenError):
+            backend.create(MESSAGES)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(len(server.calls), 2)
+
+        # Rejected without calling the server
+        with self.assertRaises(CircuitOpenError):
+            backend.create(MESSAGES)
+        self.assertEqual(len(server.calls), 2)
+
+        # A single trial call once the recovery timeout elapsed
+        self.now += 30
+        breaker.before_call()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.on_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        response = backend.create(MESSAGES)
+        self.assertEqual(response["choices"][0]["message"]["content"], "Hello")
+        self.assertEqual(len(server.calls), 3)
+
+    # Test that a failed trial call opens the circuit again
+    def test_half_open_failure(self):
+        breaker = CircuitBreaker(failure_threshold=5, recovery_timeout=30)
+        for _ in range(5):
+            breaker.on_failure()
+        self.now += 30
+        breaker.before_call()
+        breaker.on_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.now += 29
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+
+class TestFallback(unittest.TestCase):
+    """Test the answer of the chatbot when the API is not available."""
+
+    # Test that the handler answers with the error message instead of raising
+    def test_fallback_answer(self):
+        server = start_server(self, [(503, 0)] * 10)
+        chat_completion = ResilientChatCompletion(
+            max_retries=1,
+            circuit_breaker=CircuitBreaker(failure_threshold=2, recovery_timeout=30),
+            sleep=lambda delay: None,
+        )
+        handler = OpenAIHandler(
+            {},
+            [],
+            "You are a heating assistant.",
+            backend=server.backend(chat_completion),
+        )
+        self.assertEqual(handler.send_response("Hello"), (error_message, 0))
+        self.assertEqual(list(handler.stream_response("Hello")), [error_message])
+        self.assertEqual(len(server.calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
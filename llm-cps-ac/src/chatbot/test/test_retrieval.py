@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the keyword index and of the hybrid retrieval of the vector database.
+
+Use the command "pytest" to run the tests.
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-31"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import unittest
+
+from langchain.schema import Document
+
+from app.keyword_index import InvertedIndex, find_identifiers, tokenize
+from app.vector_db import HybridRetriever
+
+
+DOCUMENTS = [
+    Document(page_content="The ToastMaster 4000 boiler has an eco mode."),
+    Document(page_content="The boiler can burn pellets, wood or gas."),
+    Document(page_content="Open the windows a few minutes every day to ventilate."),
+]
+
+
+class FakeVectorStore:
+    """Vector store returning fixed hits, counting the searches."""
+
+    def __init__(self, hits):
+        self.hits = hits
+        self.searches = 0
+
+    def similarity_search_with_score(self, query, k=4):
+        self.searches += 1
+        return self.hits[:k]
+
+
+class TestKeywordIndex(unittest.TestCase):
+    """Test the BM25 keyword index."""
+
+    def setUp(self):
+        self.index = InvertedIndex(DOCUMENTS)
+
+    # Test the tokenization without the stop words
+    def test_tokenize(self):
+        self.assertEqual(tokenize("What is the Eco mode?"), ["eco", "mode"])
+        self.assertEqual(
+            find_identifiers("Is the ToastMaster 4000 good?"), ["toastmaster", "4000"]
+        )
+
+    # Test that the documents are ranked by their BM25 score
+    def test_search(self):
+        hits = self.index.search("which fuel can the boiler burn, pellets?", k=2)
+        self.assertEqual(hits[0][0], DOCUMENTS[1])
+        self.assertGreater(hits[0][1], hits[1][1])
+        self.assertEqual(self.index.search("unknown words"), [])
+
+    # Test the detection of the identifiers found in the documents
+    def test_has_exact_match(self):
+        self.assertTrue(self.index.has_exact_match("What is the 4000?"))
+        self.assertFalse(self.index.has_exact_match("What is the 5000?"))
+
+
+class TestHybridRetriever(unittest.TestCase):
+    """Test the retriever merging the keyword index and the vector store."""
+
+    def setUp(self):
+        self.vectorstore = FakeVectorStore([(DOCUMENTS[2], 0.1), (DOCUMENTS[1], 0.5)])
+        self.retriever = HybridRetriever(
+            self.vectorstore, InvertedIndex(DOCUMENTS), k=2, keyword_weight=0.5
+        )
+
+    # Test that an exact identifier match does not query the vector store
+    def test_exact_match(self):
+        documents = self.retriever.get_relevant_documents("Does the 4000 have eco?")
+        self.assertEqual(documents[0], DOCUMENTS[0])
+        self.assertEqual(self.vectorstore.searches, 0)
+
+    # Test that the hits of both indexes are merged by their weighted score
+    def test_merge(self):
+        documents = self.retriever.get_relevant_documents("Can I burn pellets?")
+        self.assertEqual(documents, [DOCUMENTS[1], DOCUMENTS[2]])
+        self.assertEqual(self.vectorstore.searches, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
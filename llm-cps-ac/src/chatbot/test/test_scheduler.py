@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the occupancy scheduler of the set temperature.
+
+Use the command "pytest" to run the tests.
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-31"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import random
+import time
+import unittest
+from datetime import datetime
+
+from app.scheduler import (
+    DAY_SECONDS,
+    WEEK_SECONDS,
+    SetpointScheduler,
+    SetpointTimeline,
+)
+
+
+def random_presences(users, seed=0):
+    """
+    Generate presences of users, some of them overlapping and going past midnight on Sunday.
+    """
+    generator = random.Random(seed)
+    presences = []
+    for user_id in range(users):
+        temperature = generator.choice([18, 19, 20, 21, 22])
+        for _ in range(generator.randint(1, 3)):
+            start = generator.randrange(0, WEEK_SECONDS, 900)
+            end = (
+                start + generator.randrange(900, 2 * DAY_SECONDS, 900)
+            ) % WEEK_SECONDS
+            presences.append((user_id, temperature, start, end))
+    return presences
+
+
+class TestSetpointTimeline(unittest.TestCase):
+    """Test the weekly timeline of the set temperature."""
+
+    # Test the set temperature against the users at home found by scanning the presences
+    def test_setpoint_at(self):
+        presences = random_presences(50)
+        timeline = SetpointTimeline(presences, absence_temperature=16)
+        temperatures = {
+            user_id: temperature for user_id, temperature, _, _ in presences
+        }
+        for time_of_week in range(0, WEEK_SECONDS, 450):
+            present = timeline.present_at(time_of_week)
+            expected = max((temperatures[user] for user in present), default=16)
+            self.assertEqual(timeline.setpoint_at(time_of_week), expected)
+
+    # Test that the consecutive intervals have different set temperatures
+    def test_intervals(self):
+        timeline = SetpointTimeline(random_presences(50))
+        self.assertEqual(timeline.starts, sorted(set(timeline.starts)))
+        for previous, setpoint in zip(timeline.setpoints, timeline.setpoints[1:]):
+            self.assertNotEqual(previous, setpoint)
+
+    # Test the time until the next change of the set temperature
+    def test_next_transition(self):
+        timeline = SetpointTimeline([(1, 21, 3600, 7200)], absence_temperature=16)
+        self.assertEqual(timeline.next_transition(0), 3600)
+        self.assertEqual(timeline.next_transition(5400), 1800)
+        self.assertEqual(timeline.next_transition(7200), WEEK_SECONDS - 3600)
+        self.assertIsNone(SetpointTimeline([]).next_transition(0))
+
+    # Test that a presence going past midnight on Sunday wraps to Monday
+    def test_wrap(self):
+        timeline = SetpointTimeline(
+            [(1, 21, WEEK_SECONDS - 3600, 3600)], absence_temperature=16
+        )
+        self.assertEqual(timeline.setpoint_at(0), 21)
+        self.assertEqual(timeline.setpoint_at(WEEK_SECONDS - 1), 21)
+        self.assertEqual(timeline.setpoint_at(DAY_SECONDS), 16)
+
+    # Test that the timeline of many users is built quickly (O(log n) per event)
+    def test_many_users(self):
+        presences = random_presences(20000)
+        start = time.perf_counter()
+        SetpointTimeline(presences)
+        self.assertLess(time.perf_counter() - start, 5)
+
+
+class TestSetpointScheduler(unittest.TestCase):
+    """Test the pushes of the set temperature to the simulator."""
+
+    def setUp(self):
+        self.pushes = []
+        self.success = True
+
+        def push_setpoint(temperature):
+            self.pushes.append(temperature)
+            return self.success
+
+        self.scheduler = SetpointScheduler(push_setpoint, refresh_interval=300)
+        self.scheduler.timeline = SetpointTimeline(
+            [(1, 21, 3600, 7200)], absence_temperature=16
+        )
+
+    # Test that the set temperature is only sent when it changes
+    def test_tick(self):
+        monday = datetime(2023, 7, 31)
+        self.assertEqual(self.scheduler.tick(monday), 3600)
+        self.scheduler.tick(monday.replace(minute=30))
+        self.scheduler.tick(monday.replace(hour=1, minute=30))
+        self.assertEqual(self.pushes, [16, 21])
+
+    # Test that a set temperature which could not be sent is sent again
+    def test_failed_push(self):
+        monday = datetime(2023, 7, 31)
+        self.success = False
+        self.scheduler.tick(monday)
+        self.assertIsNone(self.scheduler.last_setpoint)
+        self.success = True
+        self.scheduler.tick(monday.replace(minute=30))
+        self.assertEqual(self.pushes, [16, 16])
+        self.assertEqual(self.scheduler.last_setpoint, 16)
+
+    # Test that the schedules are only reloaded at the refresh interval
+    def test_refresh_due(self):
+        scheduler = SetpointScheduler(lambda temperature: True, refresh_interval=300)
+        self.assertTrue(scheduler.refresh_due())
+        scheduler.timeline, scheduler.last_refresh = self.scheduler.timeline, 0
+        self.assertTrue(scheduler.refresh_due())
+        scheduler.last_refresh = time.monotonic()
+        self.assertFalse(scheduler.refresh_due())
+
+
+if __name__ == "__main__":
+    unittest.main()
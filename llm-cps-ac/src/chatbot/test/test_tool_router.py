@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the keyword router of the functions definitions, on the offline fixture of queries.
+
+Use the command "pytest" to run the tests.
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-31"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import json
+import unittest
+
+from app.config import Config
+from app.tool_router import DEFAULT_FUNCTIONS, TOOL_GROUPS, ToolRouter, evaluate
+
+
+class TestToolRouter(unittest.TestCase):
+    """Test the selection of the functions definitions sent to the model."""
+
+    @classmethod
+    def setUpClass(cls):
+        with open(Config.FNCT_DEF_PATH, "r") as file:
+            cls.functions_definitions = json.load(file)["functions"]
+        with open(Config.TOOL_ROUTER_FIXTURE_PATH, "r") as file:
+            cls.fixture = json.load(file)
+        cls.router = ToolRouter(cls.functions_definitions)
+
+    # Test that every query of the fixture gets its functions, with a much smaller prompt
+    def test_fixture(self):
+        results = evaluate(self.router, self.fixture)
+        self.assertEqual(results["failures"], [])
+        self.assertEqual(results["accuracy"], 1)
+        self.assertGreater(results["reduction"], 0.5)
+
+    # Test that the groups only reference existing functions
+    def test_groups(self):
+        names = {definition["name"] for definition in self.functions_definitions}
+        for group in TOOL_GROUPS.values():
+            self.assertLessEqual(set(group["functions"]), names)
+
+    # Test the selection of a question, of the previous question and of an unknown question
+    def test_select(self):
+        def selected(query):
+            return {definition["name"] for definition in self.router.select(query)}
+
+        self.assertIn("get_outside_temperature", selected("How cold is it outside?"))
+        self.assertLessEqual(
+            set(DEFAULT_FUNCTIONS), selected("How cold is it outside?")
+        )
+        self.assertEqual(
+            selected("Human: How cold is it outside?\nQuestion: And why?"),
+            selected("How cold is it outside?"),
+        )
+        self.assertEqual(
+            len(self.router.select("Hello")), len(self.functions_definitions)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
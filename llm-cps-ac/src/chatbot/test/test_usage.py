@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the tracker of the LLM usage and of its token budgets.
+
+Use the command "pytest" to run the tests.
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-31"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import unittest
+from unittest import mock
+
+from app.usage import BudgetExceeded, UsageTracker
+
+
+class TestUsageTracker(unittest.TestCase):
+    """Test the budgets and the metrics of the usage tracker."""
+
+    def setUp(self):
+        self.now = 1000
+        patcher = mock.patch("app.usage.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tracker = UsageTracker(
+            session_budget=100, global_budget=150, window=60, history_size=10
+        )
+
+    # Test that a session is blocked once its budget is used, without blocking the others
+    def test_session_budget(self):
+        self.tracker.record("a", 60, 40, 0.5)
+        with self.assertRaises(BudgetExceeded):
+            self.tracker.check("a")
+        self.tracker.check("b")
+
+    # Test that all the sessions are blocked once the global budget is used
+    def test_global_budget(self):
+        self.tracker.record("a", 50, 20, 0.5)
+        self.tracker.record("b", 50, 30, 0.5)
+        with self.assertRaises(BudgetExceeded):
+            self.tracker.check("c")
+
+    # Test that the tokens leave the budget window, but not the totals
+    def test_window(self):
+        self.tracker.record("a", 60, 40, 0.5)
+        self.now += 30
+        self.tracker.record("b", 10, 0, 0.5)
+        self.now += 31
+        self.tracker.check("a")
+        self.assertEqual(self.tracker.metrics()["window_tokens"], 10)
+        self.assertEqual(self.tracker.session_tokens("a"), 100)
+
+    # Test that no limit is applied without budgets
+    def test_no_budget(self):
+        tracker = UsageTracker(session_budget=None, global_budget=None, window=60)
+        tracker.record("a", 10**6, 10**6, 1)
+        tracker.check("a")
+
+    # Test the aggregated metrics, with the latencies of the latest calls only
+    def test_metrics(self):
+        for i in range(20):
+            self.tracker.record(f"session {i % 2}", 2, 1, i)
+        metrics = self.tracker.metrics()
+        self.assertEqual(metrics["sessions"], 2)
+        self.assertEqual(metrics["calls"], 20)
+        self.assertEqual(metrics["total_tokens"], 60)
+        self.assertEqual(metrics["mean_latency"], 14.5)
+        self.assertEqual(metrics["p95_latency"], 18)
+
+    # Test the metrics of a single session
+    def test_session_metrics(self):
+        self.tracker.record("a", 20, 10, 0.5)
+        self.tracker.record("b", 5, 5, 0.5)
+        metrics = self.tracker.session_metrics("a")
+        self.assertEqual(metrics["calls"], 1)
+        self.assertEqual(metrics["total_tokens"], 30)
+        self.assertEqual(metrics["window_tokens"], 30)
+        self.assertEqual(self.tracker.session_metrics("c")["total_tokens"], 0)
+
+    # Test that the totals of the sessions are bounded, without changing the global totals
+    def test_sessions_bounded(self):
+        tracker = UsageTracker(None, None, window=60, sessions_size=3, session_ttl=100)
+        for i in range(10):
+            tracker.record(f"session {i}", 2, 1, 0.5)
+        self.assertEqual(tracker.metrics()["sessions"], 3)
+        self.assertEqual(tracker.metrics()["total_tokens"], 30)
+        self.assertEqual(tracker.session_tokens("session 0"), 0)
+        self.assertEqual(tracker.session_tokens("session 9"), 3)
+
+        # The totals of a session are dropped after the time to live without calls
+        with mock.patch("app.cache.time.monotonic", lambda: self.now + 100):
+            self.assertEqual(tracker.session_tokens("session 9"), 0)
+            self.assertEqual(tracker.metrics()["sessions"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -21,6 +21,9 @@ class Boiler:
     Class to simulate a boiler heating system.
     """
 
+    # Physical state only (no instance dictionary), to keep the instances small and cheap to copy
+    __slots__ = ("boiler_power", "operating_percentage", "fuel", "current_power")
+
     def __init__(self, boiler_power, operating_percentage, fuel):
         """
         Initialize a Boiler with given parameters.
@@ -63,7 +66,8 @@ class Boiler:
 
     def calculate_fuel_price_per_year(self):
         """
-        Calculate the annual fuel price based on the fuel consumption.
+        Calculate the annual fuel price based on the current fuel consumption. The price extrapolated from
+        the cost actually integrated is given by EnergyMeter.cost_per_year.
         """
         fuel_consumption = self.calculate_fuel_consumption()  # kg/h
         fuel_price = FUEL_PRICE[self.fuel]  # fuel price in ct./kWh
@@ -13,7 +13,9 @@ __version__ = "2.4"
 __email__ = "philippe.marziale@edu.hefr.ch"
 
 
-from app.constants import TIME_STEP
+import math
+
+from app.constants import HEAT_CAPACITY, INTEGRATORS, TIME_STEP
 
 
 class Building:
@@ -24,6 +26,26 @@ class Building:
     EXPOSED_FACES = 5  # Number of faces exposed to the outside
     MAX_DELTA_TEMP = 50  # Maximum allowed temperature change
 
+    # Physical state only (no instance dictionary), to keep the instances small and cheap to copy
+    __slots__ = (
+        "building_temperature",
+        "set_temperature",
+        "outside_temperature",
+        "_building_edge",
+        "_heat_transfer_coefficient",
+        "_volume_heat_capacity",
+        "volume_heat_capacity_var",
+        "_building_surface",
+        "_building_volume",
+        "_thermal_conductance",
+        "_thermal_capacity",
+        "heat_loss",
+        "boiler",
+        "weather",
+        "integrator",
+        "use_real_weather",
+    )
+
     def __init__(
         self,
         building_temperature,
@@ -34,6 +56,7 @@ class Building:
         volume_heat_capacity,
         boiler,
         weather,
+        integrator="euler",
     ):
         """
         Initialize a building with given parameters.
@@ -47,6 +70,8 @@ class Building:
             volume_heat_capacity (int): Volume heat capacity type
             boiler (Boiler): Boiler used to heat the building
             weather (Weather): Weather object used to get the outside temperature
+            integrator (str): Integration method of the temperature, "euler" (explicit step) or "exact"
+                (closed-form solution, accurate for any time step)
         """
         if (
             heat_transfer_coefficient <= 0
@@ -56,6 +81,14 @@ class Building:
             raise ValueError(
                 "Heat transfer coefficient, building edge and volume heat capacity must be positive!"
             )
+        if integrator not in INTEGRATORS:
+            raise ValueError(f"Integrator {integrator} not recognized")
+
+        # Initialize the derived quantities, computed when they are first used
+        self._building_surface = None
+        self._building_volume = None
+        self._thermal_conductance = None
+        self._thermal_capacity = None
 
         # Initialize the building parameters
         self.building_temperature = building_temperature  # °C
@@ -66,37 +99,122 @@ class Building:
         self.volume_heat_capacity = volume_heat_capacity  # J/m³/°C
         self.boiler = boiler
         self.weather = weather
+        self.integrator = integrator
+
+        # Initialize the volume heat capacity variable (None if the capacity is not one of the choices)
+        self.volume_heat_capacity_var = next(
+            (
+                choice
+                for choice, capacity in HEAT_CAPACITY.items()
+                if capacity == volume_heat_capacity
+            ),
+            None,
+        )
 
         # Initialize the use_real_weather variable
         self.use_real_weather = False
 
         # Initialize class functions
-        self._calculate_building_surface()
-        self._calculate_building_volume()
         self._calculate_heat_loss()
 
+    @property
+    def building_edge(self):
+        """
+        Edge length of the cubical building in m.
+        """
+        return self._building_edge
+
+    @building_edge.setter
+    def building_edge(self, value):
+        self._building_edge = value
+        self._building_surface = None
+        self._building_volume = None
+        self._thermal_conductance = None
+        self._thermal_capacity = None
+
+    @property
+    def heat_transfer_coefficient(self):
+        """
+        Heat transfer coefficient (U) of the building in W/m²/K.
+        """
+        return self._heat_transfer_coefficient
+
+    @heat_transfer_coefficient.setter
+    def heat_transfer_coefficient(self, value):
+        self._heat_transfer_coefficient = value
+        self._thermal_conductance = None
+
+    @property
+    def volume_heat_capacity(self):
+        """
+        Volume heat capacity of the building in J/m³/°C.
+        """
+        return self._volume_heat_capacity
+
+    @volume_heat_capacity.setter
+    def volume_heat_capacity(self, value):
+        self._volume_heat_capacity = value
+        self._thermal_capacity = None
+
+    @property
+    def building_surface(self):
+        """
+        Surface of the building exposed to the outside in m², cached until the edge changes.
+        """
+        if self._building_surface is None:
+            self._building_surface = self.building_edge**2 * self.EXPOSED_FACES
+        return self._building_surface
+
+    @property
+    def building_volume(self):
+        """
+        Volume of the building in m³, cached until the edge changes.
+        """
+        if self._building_volume is None:
+            self._building_volume = self.building_edge**3
+        return self._building_volume
+
+    @property
+    def thermal_conductance(self):
+        """
+        Thermal conductance (U * surface) of the building in W/K, cached until its inputs change.
+        """
+        if self._thermal_conductance is None:
+            self._thermal_conductance = (
+                self.heat_transfer_coefficient * self.building_surface
+            )
+        return self._thermal_conductance
+
+    @property
+    def thermal_capacity(self):
+        """
+        Heat capacity (volume * volume heat capacity) of the building in J/K, cached until its inputs change.
+        """
+        if self._thermal_capacity is None:
+            building_volume_to_liters = self.building_volume * 1000  # m³ to L
+            self._thermal_capacity = (
+                building_volume_to_liters * self.volume_heat_capacity
+            )
+        return self._thermal_capacity
+
     def _calculate_building_surface(self):
         """
         Calculate the building's surface area.
         """
-        self.building_surface = self.building_edge**2 * self.EXPOSED_FACES
         return self.building_surface
 
     def _calculate_building_volume(self):
         """
         Calculate the building's volume.
         """
-        self.building_volume = self.building_edge**3
         return self.building_volume
 
     def _calculate_heat_loss(self):
         """
-        Calculate the heat transfer coefficient.
+        Calculate the heat loss of the building in W.
         """
-        self.heat_loss = (
-            self.heat_transfer_coefficient
-            * self.building_surface
-            * (self.building_temperature - self.outside_temperature)
+        self.heat_loss = self.thermal_conductance * (
+            self.building_temperature - self.outside_temperature
         )
         return self.heat_loss
 
@@ -108,7 +226,8 @@ class Building:
 
     def calculate_energy_consumption_kWh(self):
         """
-        Calculate the energy consumption in kWh in the building.
+        Calculate the energy consumption in kWh in the building, extrapolated from the current power of the boiler.
+        The energy actually consumed is integrated by the EnergyMeter of the engine.
         """
         energy = self.boiler.current_power / 1000 * 60  # W to kW to kWh
         return energy
@@ -117,44 +236,59 @@ class Building:
         """
         Calculate the temperature to be reached in the building based on current boiler usage.
         """
-        # Calculate the loss of the building
-        loss = self.heat_transfer_coefficient * self.building_surface  # W/K
-
         # Calculate the gain of temperature in the building
-        gain_temp = self.boiler.current_power / loss
+        gain_temp = self.boiler.current_power / self.thermal_conductance
 
         # Calculate the temperature to be reached
         reached_temp = self.outside_temperature + gain_temp
         return reached_temp
 
-    def update_temperature(self, time_step):
+    def _update_temperature_euler(self, duration):
         """
-        Update the temperature of the building, considering the heat from boiler and heat loss to the outside.
+        Update the temperature of the building with an explicit (Euler) step, limited to MAX_DELTA_TEMP.
 
         Args:
-            time_step (float): Time step of the simulation in seconds
+            duration (float): Duration of the step in seconds
         """
-        # Update boiler heating power
-        self.boiler._update_heating_power()
-
-        # Update building dimensions
-        self._calculate_building_surface()
-        self._calculate_building_volume()
-
-        energy = self.boiler.current_power * TIME_STEP[time_step]  # Wh
-
-        building_volume_to_liters = self.building_volume * 1000  # m³ to L
-        building_heat_loss = (
-            self._calculate_heat_loss() * TIME_STEP[time_step]
-        )  # Building heat loss
+        energy = self.boiler.current_power * duration  # J
+        building_heat_loss = self._calculate_heat_loss() * duration  # J
 
         # New temperature
-        delta_temperature = (energy - building_heat_loss) / (
-            building_volume_to_liters * self.volume_heat_capacity
-        )
+        delta_temperature = (energy - building_heat_loss) / self.thermal_capacity
 
         # Apply delta limit
         delta_temperature = max(
             min(delta_temperature, self.MAX_DELTA_TEMP), -self.MAX_DELTA_TEMP
         )
         self.building_temperature += delta_temperature
+
+    def _update_temperature_exact(self, duration):
+        """
+        Update the temperature of the building with the exact solution of the thermal model, for a constant
+        boiler power and outside temperature during the step:
+            C * dT/dt = P - G * (T - T_out)  =>  T(t) = T_eq + (T(0) - T_eq) * exp(-G * t / C)
+        with the thermal conductance G = U * S, the heat capacity C = V * c and the equilibrium T_eq = T_out + P / G.
+
+        Args:
+            duration (float): Duration of the step in seconds
+        """
+        equilibrium_temperature = self.calculate_temperature_reached()  # °C
+
+        self.building_temperature = equilibrium_temperature + (
+            self.building_temperature - equilibrium_temperature
+        ) * math.exp(-self.thermal_conductance * duration / self.thermal_capacity)
+
+    def update_temperature(self, time_step):
+        """
+        Update the temperature of the building, considering the heat from boiler and heat loss to the outside.
+
+        Args:
+            time_step (str): Time step of the simulation ("minute", "hour" or "day")
+        """
+        # Update boiler heating power
+        self.boiler._update_heating_power()
+
+        if self.integrator == "exact":
+            self._update_temperature_exact(TIME_STEP[time_step])
+        else:
+            self._update_temperature_euler(TIME_STEP[time_step])
@@ -32,7 +32,11 @@ FUEL_PRICE = {  # ct./kWh
 }
 
 # Simulation parameters
-TIME_STEP = {"minute": 60, "hour": 3600}  # seconds
+TIME_STEP = {"minute": 60, "hour": 3600, "day": 86400}  # seconds
+INTEGRATORS = [
+    "euler",
+    "exact",
+]  # Integration methods of the building temperature
 MIN_SET_TEMPERATURE = -10
 MAX_SET_TEMPERATURE = 40
 MIN_OUTSIDE_TEMPERATURE = -50
@@ -45,3 +49,36 @@ MIN_BOILER_POWER = 1000
 MAX_BOILER_POWER = 35000
 MIN_VOLUME_HEAT_CAPACITY = 1
 MAX_VOLUME_HEAT_CAPACITY = 5000
+
+# Checkpoints of the simulation state
+CHECKPOINT_PATH = "checkpoint.snapshot"
+CHECKPOINT_INTERVAL = 60  # seconds
+
+# What-if simulations of the live state
+WHAT_IF_WORKERS = 4  # Number of worker processes
+MAX_WHAT_IF_HOURS = 24 * 30  # Maximum duration in hours
+
+# Parameter sweeps
+MAX_SWEEP_CASES = 10000  # Maximum number of cases of a sweep run by the API
+SWEEP_WORKERS = None  # Number of worker processes of the API sweeps (one per core)
+
+# Monte Carlo simulations
+MAX_MONTE_CARLO_REPLICAS = 10000  # Maximum number of replicas run by the API
+
+# Windows of the energy accounting (simulated time)
+ENERGY_WINDOWS = {"hour": 3600, "day": 86400, "month": 30 * 86400}  # seconds
+ENERGY_FINE_HORIZON = 2 * 86400  # s, cumulative sums kept at each step, hourly before
+ENERGY_BUCKET = 3600  # s, resolution of the cumulative sums before the fine horizon
+ENERGY_COMPACTION_SIZE = (
+    10000  # Number of cumulative sums above which they are compacted
+)
+
+# Queries of the history
+HISTORY_RESOLUTION = 500  # Default maximum number of points of each field
+MAX_HISTORY_RESOLUTION = 10000
+
+# Compaction of the history of the live simulation
+HISTORY_FINE_HORIZON = 7 * 86400  # s, values kept at each step, hourly before
+HISTORY_HORIZON = 365 * 86400  # s, values dropped before
+HISTORY_BUCKET = 3600  # s, resolution of the values before the fine horizon
+HISTORY_COMPACTION_SIZE = 20000  # Number of values above which they are compacted
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for the EnergyMeter class, integrating the energy, fuel and cost of the boiler over the simulated time.
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-29"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+from bisect import bisect_right
+
+import app.constants as cst
+
+
+class EnergyMeter:
+    """
+    Accumulators of the energy, fuel and cost of the boiler, updated at each step of the simulation.
+    The cumulative energy and cost are also recorded at each step (prefix sums), so that the consumption
+    during any window of time is the difference of two values found by binary search.
+
+    The prefix sums are bounded: they are kept at each step during the last ENERGY_FINE_HORIZON, hourly
+    (ENERGY_BUCKET) up to the longest window of ENERGY_WINDOWS, and dropped before, except the first one.
+    """
+
+    def __init__(self):
+        self.energy_kWh = 0  # kWh, since the start
+        self.cost = 0  # CHF, since the start
+        self.fuel_consumption = {}  # kg, m³ or kWh of each fuel, since the start
+
+        # Prefix sums at the end of each step
+        self.times = [0]  # s, simulated time
+        self.cumulative_energy = [0]  # kWh
+        self.cumulative_cost = [0]  # CHF
+
+        # Number of prefix sums above which they are compacted
+        self._compaction_size = cst.ENERGY_COMPACTION_SIZE
+
+    def record(self, time, boiler, duration):
+        """
+        Add the consumption of the boiler during a step.
+
+        Args:
+            time (float): Simulated time at the end of the step in seconds
+            boiler (Boiler): Boiler of the simulation, at the power of the step
+            duration (float): Duration of the step in seconds
+        """
+        energy = boiler.current_power * duration / 3.6e6  # J to kWh
+        self.energy_kWh += energy
+        self.cost += energy * cst.FUEL_PRICE[boiler.fuel] / 100  # ct. to CHF
+        self.fuel_consumption[boiler.fuel] = (
+            self.fuel_consumption.get(boiler.fuel, 0)
+            + energy / cst.FUEL_EFFICIENCIES[boiler.fuel]
+        )
+
+        self.times.append(time)
+        self.cumulative_energy.append(self.energy_kWh)
+        self.cumulative_cost.append(self.cost)
+        if len(self.times) > self._compaction_size:
+            self._compact()
+
+    def _compact(self):
+        """
+        Compact the prefix sums: all the ones of the last ENERGY_FINE_HORIZON, the last one of each ENERGY_BUCKET
+        before, and before the longest window only the last one (to interpolate the start of the window) and
+        the first one (start of the simulation). The compaction is amortized: the next one happens when the
+        number of prefix sums has doubled.
+        """
+        end = self.times[-1]
+        fine_start = end - cst.ENERGY_FINE_HORIZON
+        window_start = end - max(cst.ENERGY_WINDOWS.values())
+        times = self.times
+
+        kept = [0]
+        for i in range(1, len(times) - 1):
+            time, next_time = times[i], times[i + 1]
+            if time >= fine_start:
+                kept.extend(range(i, len(times) - 1))
+                break
+            if time <= window_start:
+                if next_time > window_start:
+                    kept.append(i)
+            elif time // cst.ENERGY_BUCKET != next_time // cst.ENERGY_BUCKET:
+                kept.append(i)
+        kept.append(len(times) - 1)
+
+        self.times = [times[i] for i in kept]
+        self.cumulative_energy = [self.cumulative_energy[i] for i in kept]
+        self.cumulative_cost = [self.cumulative_cost[i] for i in kept]
+        self._compaction_size = max(cst.ENERGY_COMPACTION_SIZE, 2 * len(self.times))
+
+    def _cumulative(self, values, time):
+        """
+        Get a cumulative value at any time, interpolated within the step (constant power during a step).
+        """
+        index = bisect_right(self.times, time) - 1
+        if index >= len(self.times) - 1:
+            return values[-1]
+        if index < 0:
+            return values[0]
+        start, end = self.times[index], self.times[index + 1]
+        fraction = (time - start) / (end - start)
+        return values[index] + fraction * (values[index + 1] - values[index])
+
+    def window(self, duration):
+        """
+        Get the consumption during the last duration of simulated time (or since the start if shorter).
+
+        Args:
+            duration (float): Duration of the window in seconds
+
+        Returns:
+            dict: Energy in kWh, cost in CHF and mean power in W during the window
+        """
+        end = self.times[-1]
+        start = max(self.times[0], end - duration)
+        energy = self.cumulative_energy[-1] - self._cumulative(
+            self.cumulative_energy, start
+        )
+        cost = self.cumulative_cost[-1] - self._cumulative(self.cumulative_cost, start)
+        return {
+            "hours": (end - start) / 3600,
+            "energy_kWh": energy,
+            "cost": cost,
+            "mean_power": energy * 3.6e6 / (end - start) if end > start else 0,
+        }
+
+    def cost_per_year(self, duration):
+        """
+        Extrapolate the cost during the last duration of simulated time to a year.
+
+        Args:
+            duration (float): Duration of the window in seconds
+
+        Returns:
+            float: Cost in CHF per year, 0 before the first step
+        """
+        window = self.window(duration)
+        if window["hours"] == 0:
+            return 0
+        return window["cost"] * 24 * 365 / window["hours"]
+
+    def summary(self):
+        """
+        Get the consumption since the start and during the windows of ENERGY_WINDOWS.
+        """
+        return {
+            "total": {
+                "hours": (self.times[-1] - self.times[0]) / 3600,
+                "energy_kWh": self.energy_kWh,
+                "cost": self.cost,
+                "fuel_consumption": dict(self.fuel_consumption),
+            },
+            **{
+                name: self.window(duration)
+                for name, duration in cst.ENERGY_WINDOWS.items()
+            },
+        }
+
+    def to_dict(self):
+        """
+        Get the state of the meter as a dictionary.
+        """
+        return {
+            "energy_kWh": self.energy_kWh,
+            "cost": self.cost,
+            "fuel_consumption": dict(self.fuel_consumption),
+            "times": list(self.times),
+            "cumulative_energy": list(self.cumulative_energy),
+            "cumulative_cost": list(self.cumulative_cost),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Create a meter from a dictionary returned by `to_dict`.
+        """
+        meter = cls()
+        meter.energy_kWh = data["energy_kWh"]
+        meter.cost = data["cost"]
+        meter.fuel_consumption = dict(data["fuel_consumption"])
+        meter.times = list(data["times"])
+        meter.cumulative_energy = list(data["cumulative_energy"])
+        meter.cumulative_cost = list(data["cumulative_cost"])
+        return meter
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for the Engine class, advancing the heating simulation independently of the user interface.
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-25"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import threading
+from bisect import bisect_left
+
+import app.constants as cst
+from app.energy import EnergyMeter
+
+
+class History:
+    """
+    Values of the simulation recorded at each step.
+    """
+
+    FIELDS = [
+        "times",
+        "building_temperatures",
+        "outside_temperatures",
+        "set_temperatures",
+        "boiler_operating_percentages",
+    ]
+
+    def __init__(self):
+        self.times = []  # s, simulated time
+        self.building_temperatures = []  # °C
+        self.outside_temperatures = []  # °C
+        self.set_temperatures = []  # °C
+        self.boiler_operating_percentages = []  # %
+
+    def append(self, time, building):
+        """
+        Record the values of the building (and its boiler) at the given time.
+
+        Args:
+            time (float): Simulated time in seconds
+            building (Building): Building of the simulation
+        """
+        self.times.append(time)
+        self.building_temperatures.append(building.building_temperature)
+        self.outside_temperatures.append(building.outside_temperature)
+        self.set_temperatures.append(building.set_temperature)
+        self.boiler_operating_percentages.append(building.boiler.operating_percentage)
+
+    def to_dict(self, length=None):
+        """
+        Get the recorded values as a dictionary of lists.
+
+        Args:
+            length (int): Number of values to get, all by default. The lists are only appended to, so the values
+                recorded until a given length can be copied while the simulation runs.
+        """
+        return {field: getattr(self, field)[:length] for field in self.FIELDS}
+
+    def compact(self, end):
+        """
+        Get a compacted copy of the history: the values of the last HISTORY_FINE_HORIZON at each step, the last
+        values of each HISTORY_BUCKET up to HISTORY_HORIZON before, and none before.
+
+        Args:
+            end (float): Simulated time in seconds at the end of the history
+
+        Returns:
+            History: The compacted history
+        """
+        times = self.times
+        start = end - cst.HISTORY_HORIZON
+        fine_index = bisect_left(times, end - cst.HISTORY_FINE_HORIZON)
+        kept = [
+            i
+            for i in range(bisect_left(times, start), fine_index)
+            if times[i] // cst.HISTORY_BUCKET != times[i + 1] // cst.HISTORY_BUCKET
+        ]
+        kept.extend(range(fine_index, len(times)))
+
+        history = History()
+        for field in self.FIELDS:
+            values = getattr(self, field)
+            setattr(history, field, [values[i] for i in kept])
+        return history
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Create a history from a dictionary of lists.
+        """
+        history = cls()
+        for field in cls.FIELDS:
+            setattr(history, field, list(data[field]))
+        return history
+
+    def __len__(self):
+        return len(self.times)
+
+
+class Engine:
+    """
+    Class advancing the simulation of the building, its boiler and its regulator step by step.
+    """
+
+    def __init__(
+        self,
+        boiler,
+        building,
+        regulator,
+        time_step,
+        history=None,
+        meter=None,
+        compact_history=False,
+    ):
+        """
+        Initialize the engine.
+
+        Args:
+            boiler (Boiler): Boiler object
+            building (Building): Building object
+            regulator (Regulator): Regulator object
+            time_step (str): Time step of the simulation ("minute", "hour" or "day")
+            history (History): Values recorded previously, a new history starting now by default
+            meter (EnergyMeter): Consumption integrated previously, a new meter starting now by default
+            compact_history (bool): Compact the history when it grows (`History.compact`), for a simulation
+                running for a long time
+        """
+        self.boiler = boiler
+        self.building = building
+        self.regulator = regulator
+        self.time_step = time_step
+        self.time = 0  # s, simulated time
+
+        if history is None:
+            history = History()
+            history.append(self.time, building)
+        self.history = history
+        self.meter = meter or EnergyMeter()
+
+        # Number of recorded values above which the history is compacted (None if it is never compacted)
+        self._history_compaction_size = (
+            cst.HISTORY_COMPACTION_SIZE if compact_history else None
+        )
+
+        # Lock of the state, which is also read and modified by the API
+        self.lock = threading.RLock()
+
+    def step(self):
+        """
+        Advance the simulation of one time step: update the outside temperature (if real weather data is used),
+        regulate the boiler, calculate the new building temperature and record the new values and the consumption.
+        """
+        with self.lock:
+            duration = cst.TIME_STEP[self.time_step]
+
+            # Update outside temperature (if we use real weather data)
+            if self.building.use_real_weather:
+                self.building.weather.update_building_outside_temperature(
+                    self.building, duration
+                )
+
+            # Regulate boiler
+            self.regulator.regulate_temperature(self.building)
+
+            # Calculate new building temperature
+            self.building.update_temperature(self.time_step)
+
+            # Record the new values
+            self.time += duration
+            self.history.append(self.time, self.building)
+            self.meter.record(self.time, self.boiler, duration)
+
+            # The compacted history replaces the previous one, which stays consistent for the queries reading it
+            if (
+                self._history_compaction_size is not None
+                and len(self.history) > self._history_compaction_size
+            ):
+                self.history = self.history.compact(self.time)
+                self._history_compaction_size = max(
+                    cst.HISTORY_COMPACTION_SIZE, 2 * len(self.history)
+                )
@@ -3,7 +3,7 @@
 
 """
 Instances module for the heating simulation.
-This module is used to initialize the boiler, building, regulator and weather objects.
+This module is used to initialize the boiler, building, regulator, weather and engine objects.
 """
 
 __author__ = "Philippe Marziale"
@@ -16,6 +16,7 @@ __email__ = "philippe.marziale@edu.hefr.ch"
 
 from app.boiler import Boiler
 from app.building import Building
+from app.engine import Engine
 from app.regulator import Regulator
 from app.weather import Weather
 
@@ -33,6 +34,7 @@ BUILDING_EDGE = 10  # m
 HEAT_TRANSFER_COEFFICIENT = 0.2  # W/m²*K
 CHOOSE_HEAT_CAPACITY = "house"
 TIME_STEP = "hour"
+INTEGRATOR = "euler"
 LOCATION = "HEIA-FR, Fribourg"
 
 
@@ -56,7 +58,11 @@ building = Building(
     volume_heat_capacity=HEAT_CAPACITY[CHOOSE_HEAT_CAPACITY],
     boiler=boiler,
     weather=weather,
+    integrator=INTEGRATOR,
 )
 
 # Initialization of the regulator
 regulator = Regulator()
+
+# Initialization of the engine advancing the simulation (running for a long time, its history is compacted)
+engine = Engine(boiler, building, regulator, TIME_STEP, compact_history=True)
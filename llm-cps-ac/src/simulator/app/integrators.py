@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for the adaptive step-size integration (Dormand-Prince RK45) used in the heating simulation.
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-24"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import math
+
+from app.constants import TIME_STEP
+
+
+# Dormand-Prince coefficients (Butcher tableau)
+# fmt: off
+RK45_C = [0, 1 / 5, 3 / 10, 4 / 5, 8 / 9, 1, 1]
+RK45_A = [
+    [],
+    [1 / 5],
+    [3 / 40, 9 / 40],
+    [44 / 45, -56 / 15, 32 / 9],
+    [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729],
+    [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656],
+    [35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84],
+]
+RK45_B = [35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84, 0]  # 5th order
+RK45_E = [  # Difference between the 5th and 4th order solutions
+    71 / 57600, 0, -71 / 16695, 71 / 1920, -17253 / 339200, 22 / 525, -1 / 40,
+]
+# fmt: on
+
+# Step size control
+SAFETY_FACTOR = 0.9
+MIN_FACTOR = 0.2
+MAX_FACTOR = 5
+
+
+def rk45_step(fun, t, y, h):
+    """
+    Compute a Dormand-Prince step.
+
+    Args:
+        fun (callable): Derivative of the state, fun(t, y) -> list
+        t (float): Current time
+        y (list[float]): Current state
+        h (float): Step size
+
+    Returns:
+        tuple: The state at t + h (5th order) and the estimated error of each component
+    """
+    k = []
+    for c, a in zip(RK45_C, RK45_A):
+        state = [
+            y_i + h * sum(a_j * k_j[i] for a_j, k_j in zip(a, k))
+            for i, y_i in enumerate(y)
+        ]
+        k.append(fun(t + c * h, state))
+
+    y_new = [
+        y_i + h * sum(b * k_j[i] for b, k_j in zip(RK45_B, k))
+        for i, y_i in enumerate(y)
+    ]
+    error = [h * sum(e * k_j[i] for e, k_j in zip(RK45_E, k)) for i in range(len(y))]
+    return y_new, error
+
+
+def solve_rk45(
+    fun, t0, y0, t_end, rtol=1e-4, atol=1e-6, first_step=None, max_step=math.inf
+):
+    """
+    Integrate an ordinary differential equation from t0 to t_end with adaptive step-size control.
+    The steps are large where the state changes slowly, and small around fast changes.
+
+    Args:
+        fun (callable): Derivative of the state, fun(t, y) -> list
+        t0 (float): Initial time
+        y0 (list[float]): Initial state
+        t_end (float): Final time
+        rtol (float): Relative tolerance of the local error
+        atol (float): Absolute tolerance of the local error
+        first_step (float): Size of the first step, by default a hundredth of the interval
+        max_step (float): Maximum step size
+
+    Returns:
+        tuple: The accepted times, the states at these times, and the number of rejected steps
+    """
+    t, y = t0, list(y0)
+    h = min(first_step or (t_end - t0) / 100, max_step)
+    times, states, rejected = [t], [y], 0
+
+    while t < t_end:
+        h = min(h, t_end - t)
+        y_new, error = rk45_step(fun, t, y, h)
+
+        # Error relative to the tolerances (RMS norm), 1 is the limit
+        error_norm = math.sqrt(
+            sum(
+                (e / (atol + rtol * max(abs(a), abs(b)))) ** 2
+                for e, a, b in zip(error, y, y_new)
+            )
+            / len(y)
+        )
+
+        if error_norm <= 1:
+            t, y = t + h, y_new
+            times.append(t)
+            states.append(y)
+        else:
+            rejected += 1
+
+        # New step size (5th order method, the error scales with h^5)
+        factor = (
+            MAX_FACTOR if error_norm == 0 else SAFETY_FACTOR * error_norm ** (-1 / 5)
+        )
+        h = min(h * min(MAX_FACTOR, max(MIN_FACTOR, factor)), max_step)
+
+    return times, states, rejected
+
+
+def closed_loop_derivative(building, regulator, reference_step):
+    """
+    Get the derivative of the closed loop (building and regulator) as a continuous-time system.
+
+    The state is (building temperature, operating percentage, cumulative error). The regulator applies its
+    adjustment once per reference step in the discrete simulation; here the same adjustment is spread over the
+    reference step, so that both simulations match when the state changes slowly at this scale.
+    The set temperature, the outside temperature and the building parameters are constant.
+
+    Args:
+        building (Building): Building of the simulation
+        regulator (Regulator): Regulator of the boiler
+        reference_step (float): Time step of the discrete regulator in seconds
+    """
+    conductance = building.thermal_conductance  # W/K
+    capacity = building.thermal_capacity  # J/K
+
+    def derivative(t, state):
+        temperature, operating_percentage, cumulative_error = state
+        operating_percentage = min(
+            regulator.MAX_OPERATING_PERCENTAGE,
+            max(regulator.MIN_OPERATING_PERCENTAGE, operating_percentage),
+        )
+        power = building.boiler.boiler_power * operating_percentage / 100  # W
+
+        # Thermal model of the building
+        temperature_rate = (
+            power - conductance * (temperature - building.outside_temperature)
+        ) / capacity
+
+        # PID regulator, with the derivative term from the temperature rate
+        delta_temperature = building.set_temperature - temperature
+        abs_delta = abs(delta_temperature)
+        abs_delta_rate = -math.copysign(1, delta_temperature) * temperature_rate
+        adjustment_rate = (
+            regulator.Kp * abs_delta
+            + regulator.Ki * cumulative_error
+            + regulator.Kd * abs_delta_rate * reference_step
+        )
+        operating_percentage_rate = delta_temperature * adjustment_rate / reference_step
+
+        # The operating percentage stays within its limits
+        if (
+            operating_percentage >= regulator.MAX_OPERATING_PERCENTAGE
+            and operating_percentage_rate > 0
+        ) or (
+            operating_percentage <= regulator.MIN_OPERATING_PERCENTAGE
+            and operating_percentage_rate < 0
+        ):
+            operating_percentage_rate = 0
+
+        return [temperature_rate, operating_percentage_rate, abs_delta / reference_step]
+
+    return derivative
+
+
+def simulate_adaptive(
+    building, regulator, duration, reference_step="minute", rtol=1e-4, atol=1e-3
+):
+    """
+    Simulate the building and its regulator during a duration with adaptive steps (RK45).
+    The building, the boiler and the regulator are updated to their state at the end of the simulation.
+
+    Args:
+        building (Building): Building of the simulation
+        regulator (Regulator): Regulator of the boiler
+        duration (float): Duration of the simulation in seconds
+        reference_step (str): Time step of the regulator ("minute", "hour" or "day")
+        rtol (float): Relative tolerance of the local error
+        atol (float): Absolute tolerance of the local error
+
+    Returns:
+        tuple: The accepted times (s), the building temperatures and the operating percentages at these times
+    """
+    reference_step = TIME_STEP[reference_step]
+
+    times, states, _ = solve_rk45(
+        closed_loop_derivative(building, regulator, reference_step),
+        0,
+        [
+            building.building_temperature,
+            building.boiler.operating_percentage,
+            regulator.cumulative_error,
+        ],
+        duration,
+        rtol=rtol,
+        atol=atol,
+        first_step=reference_step,
+    )
+
+    # Keep the final state
+    temperature, operating_percentage, cumulative_error = states[-1]
+    building.building_temperature = temperature
+    building.boiler.operating_percentage = min(
+        regulator.MAX_OPERATING_PERCENTAGE,
+        max(regulator.MIN_OPERATING_PERCENTAGE, operating_percentage),
+    )
+    building.boiler._update_heating_power()
+    regulator.cumulative_error = cumulative_error
+    regulator.previous_error = abs(building.set_temperature - temperature)
+
+    temperatures = [state[0] for state in states]
+    operating_percentages = [
+        min(
+            regulator.MAX_OPERATING_PERCENTAGE,
+            max(regulator.MIN_OPERATING_PERCENTAGE, state[1]),
+        )
+        for state in states
+    ]
+    return times, temperatures, operating_percentages
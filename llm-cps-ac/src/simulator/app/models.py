@@ -13,6 +13,8 @@ __version__ = "1.1"
 __email__ = "philippe.marziale@edu.hefr.ch"
 
 
+from typing import Dict, List, Optional, Tuple, Union
+
 from pydantic import BaseModel
 from enum import Enum
 
@@ -57,3 +59,63 @@ class HeatCapacity(BaseModel):
     """Heat capacity model for the API"""
 
     heat_capacity: HeatCapacityChoice
+
+
+class IntegratorChoice(str, Enum):
+    """Integrator choice for the API"""
+
+    euler = "euler"
+    exact = "exact"
+
+
+class Integrator(BaseModel):
+    """Integrator model for the API"""
+
+    integrator: IntegratorChoice
+
+
+class TimeStepChoice(str, Enum):
+    """Time step choice for the API"""
+
+    minute = "minute"
+    hour = "hour"
+    day = "day"
+
+
+class WhatIf(BaseModel):
+    """What-if simulation model for the API, the parameters not given keep their live values"""
+
+    hours: float = 24
+    time_step: Optional[TimeStepChoice] = None
+    adaptive: bool = False
+    set_temperature: Optional[float] = None
+    outside_temperature: Optional[float] = None
+    building_edge: Optional[float] = None
+    heat_transfer_coefficient: Optional[float] = None
+    boiler_power: Optional[float] = None
+    fuel: Optional[FuelChoice] = None
+    volume_heat_capacity: Optional[HeatCapacityChoice] = None
+
+
+class Sweep(BaseModel):
+    """Parameter sweep model for the API: a grid of values, or a Latin hypercube sample if samples is given"""
+
+    grid: Dict[str, List[Union[float, str]]] = {}
+    ranges: Dict[str, Tuple[float, float]] = {}
+    samples: Optional[int] = None
+    seed: Optional[int] = None
+    hours: float = 24
+    time_step: TimeStepChoice = TimeStepChoice.minute
+    adaptive: bool = False
+
+
+class MonteCarlo(BaseModel):
+    """Monte Carlo simulation model for the API"""
+
+    replicas: int = 1000
+    hours: float = 24 * 7
+    time_step: TimeStepChoice = TimeStepChoice.minute
+    seed: Optional[int] = None
+    outside_sigma: float = 2
+    heat_transfer_sigma: float = 0.1
+    heat_capacity_sigma: float = 0.1
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for the Monte Carlo uncertainty simulations: thousands of replicas of the building, with perturbed outside
+temperatures, heat transfer coefficients and heat capacities, are simulated together as numpy arrays, and the
+percentile bands of the temperature, energy and cost are returned.
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-28"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import numpy as np
+
+import app.constants as cst
+
+
+# Percentiles of the returned bands
+PERCENTILES = [5, 25, 50, 75, 95]
+
+# Correlation of the outside temperature perturbation between two consecutive hours
+OUTSIDE_CORRELATION = 0.9
+
+
+def outside_temperature_trace(building, steps, duration):
+    """
+    Get the outside temperature at each step of the simulation without perturbation: the weather forecast
+    if the building uses real weather data, the current outside temperature otherwise.
+
+    Args:
+        building (Building): Building of the simulation
+        steps (int): Number of steps
+        duration (float): Duration of a step in seconds
+
+    Returns:
+        numpy.ndarray: Outside temperature of each step
+    """
+    weather = building.weather
+    if not building.use_real_weather or weather is None:
+        return np.full(steps, float(building.outside_temperature))
+
+    # Same hour as Weather.update_building_outside_temperature after each step
+    elapsed = weather.counter + np.arange(1, steps + 1) * duration  # s
+    hours = elapsed // cst.TIME_STEP["hour"]
+    forecast = np.array([temperature for _, temperature in weather.weather_data])
+    return forecast[(weather.index + hours.astype(int)) % len(forecast)]
+
+
+def sample_outside_perturbations(generator, replicas, hours, sigma):
+    """
+    Sample hourly perturbations of the outside temperature, correlated in time (AR(1) process).
+
+    Args:
+        generator (numpy.random.Generator): Random generator
+        replicas (int): Number of replicas
+        hours (int): Number of hours
+        sigma (float): Standard deviation of the perturbations in °C
+
+    Returns:
+        numpy.ndarray: Perturbation of each replica (rows) at each hour (columns)
+    """
+    noise = generator.standard_normal((replicas, hours)) * sigma
+    noise[:, 1:] *= np.sqrt(1 - OUTSIDE_CORRELATION**2)
+    perturbations = np.empty((replicas, hours))
+    perturbations[:, 0] = noise[:, 0]
+    for hour in range(1, hours):
+        perturbations[:, hour] = (
+            OUTSIDE_CORRELATION * perturbations[:, hour - 1] + noise[:, hour]
+        )
+    return perturbations
+
+
+def run_monte_carlo(
+    boiler,
+    building,
+    regulator,
+    replicas=1000,
+    hours=24 * 7,
+    time_step="minute",
+    seed=None,
+    outside_sigma=2,
+    heat_transfer_sigma=0.1,
+    heat_capacity_sigma=0.1,
+):
+    """
+    Simulate replicas of the building with perturbed parameters, from the given state and with the exact integrator.
+    The objects are not modified.
+
+    Args:
+        boiler (Boiler): Boiler of the simulation
+        building (Building): Building of the simulation
+        regulator (Regulator): Regulator of the boiler
+        replicas (int): Number of replicas
+        hours (float): Duration of the simulation in hours
+        time_step (str): Time step of the simulation ("minute", "hour" or "day")
+        seed (int): Seed of the random generator, for reproducible results
+        outside_sigma (float): Standard deviation of the outside temperature perturbations in °C
+        heat_transfer_sigma (float): Relative standard deviation of the heat transfer coefficient (log-normal)
+        heat_capacity_sigma (float): Relative standard deviation of the volume heat capacity (log-normal)
+
+    Returns:
+        dict: Percentile bands of the hourly building temperature, of the energy, of the cost of the simulation
+            and of the fuel price per year at the mean consumption of the simulation
+    """
+    generator = np.random.default_rng(seed)
+    duration = cst.TIME_STEP[time_step]
+    steps = int(np.ceil(hours * 3600 / duration))
+
+    # Parameters of each replica, the geometry of the building is certain
+    conductance = building.thermal_conductance * generator.lognormal(
+        -(heat_transfer_sigma**2) / 2, heat_transfer_sigma, replicas
+    )  # W/K
+    capacity = building.thermal_capacity * generator.lognormal(
+        -(heat_capacity_sigma**2) / 2, heat_capacity_sigma, replicas
+    )  # J/K
+    decay = np.exp(-conductance * duration / capacity)
+
+    # Outside temperature of each replica, perturbed hourly
+    trace = outside_temperature_trace(building, steps, duration)
+    step_hours = np.arange(1, steps + 1) * duration // cst.TIME_STEP["hour"]
+    perturbations = sample_outside_perturbations(
+        generator, replicas, int(step_hours[-1]) + 1, outside_sigma
+    )
+
+    # State of each replica
+    temperature = np.full(replicas, float(building.building_temperature))
+    operating_percentage = np.full(replicas, float(boiler.operating_percentage))
+    cumulative_error = np.full(replicas, float(regulator.cumulative_error))
+    previous_error = np.full(replicas, float(regulator.previous_error))
+    energy = np.zeros(replicas)  # J
+
+    record_every = max(1, cst.TIME_STEP["hour"] // duration)
+    times, temperatures = [0], [temperature.copy()]
+    for step in range(steps):
+        outside_temperature = trace[step] + perturbations[:, step_hours[step]]
+
+        # Regulator (same PID as Regulator.regulate_temperature)
+        delta_temperature = building.set_temperature - temperature
+        abs_delta = np.abs(delta_temperature)
+        cumulative_error += abs_delta
+        error_difference = abs_delta - previous_error
+        previous_error = abs_delta
+        adjustment_rate = (
+            regulator.Kp * abs_delta
+            + regulator.Ki * cumulative_error
+            + regulator.Kd * error_difference
+        )
+        operating_percentage = np.clip(
+            operating_percentage + delta_temperature * adjustment_rate,
+            regulator.MIN_OPERATING_PERCENTAGE,
+            regulator.MAX_OPERATING_PERCENTAGE,
+        )
+        power = boiler.boiler_power * operating_percentage / 100  # W
+
+        # Exact solution of the thermal model during the step
+        equilibrium_temperature = outside_temperature + power / conductance
+        temperature = (
+            equilibrium_temperature + (temperature - equilibrium_temperature) * decay
+        )
+        energy += power * duration
+
+        if (step + 1) % record_every == 0 or step == steps - 1:
+            times.append((step + 1) * duration / 3600)  # h
+            temperatures.append(temperature)
+
+    energy_kWh = energy / 3.6e6
+    cost = energy_kWh * cst.FUEL_PRICE[boiler.fuel] / 100  # CHF
+
+    # Price per year at the mean consumption (as Boiler.calculate_fuel_price_per_year)
+    mean_power_kW = energy_kWh / (steps * duration / 3600)
+    fuel_consumption = mean_power_kW / cst.FUEL_EFFICIENCIES[boiler.fuel]
+    fuel_price_per_year = (
+        fuel_consumption * 24 * 365 * cst.FUEL_PRICE[boiler.fuel] / 100
+    )
+
+    def bands(values, axis=0):
+        return {
+            f"p{percentile}": band.tolist()
+            for percentile, band in zip(
+                PERCENTILES, np.percentile(values, PERCENTILES, axis=axis)
+            )
+        }
+
+    return {
+        "replicas": replicas,
+        "seed": seed,
+        "times": times,
+        "building_temperature": bands(np.array(temperatures), axis=1),
+        "energy_kWh": bands(energy_kWh),
+        "cost": bands(cost),
+        "fuel_price_per_year": bands(fuel_price_per_year),
+    }
@@ -21,6 +21,9 @@ class Regulator:
     MIN_OPERATING_PERCENTAGE = 0  # Minimum operating percentage
     MAX_OPERATING_PERCENTAGE = 100  # Maximum operating percentage
 
+    # Controller state only (no instance dictionary), to keep the instances small and cheap to copy
+    __slots__ = ("cumulative_error", "previous_error", "Kp", "Ki", "Kd")
+
     def __init__(self):
         self.cumulative_error = 0
         self.previous_error = 0
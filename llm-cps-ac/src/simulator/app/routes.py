@@ -14,13 +14,42 @@ __version__ = "1.2"
 __email__ = "philippe.marziale@edu.hefr.ch"
 
 
-from fastapi import APIRouter, Request
-from fastapi.responses import HTMLResponse
+import asyncio
+import os
+from enum import Enum
+
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.templating import Jinja2Templates
 
 import app.constants as cst
-from app.instances import building, boiler
-from app.models import Attribute, Boolean, HeatCapacity, Fuel
+from app.instances import building, boiler, engine
+from app.snapshot import dumps, loads
+from app.montecarlo import run_monte_carlo
+from app.timeseries import query_history
+from app.sweep import (
+    cancel_sweep,
+    count_cases,
+    get_executor as get_sweep_executor,
+    grid,
+    iter_csv,
+    iter_results,
+    latin_hypercube,
+    submit_sweep,
+    validate_cases,
+)
+from app.whatif import fork, get_executor, submit_what_if
+from app.models import (
+    Attribute,
+    Boolean,
+    HeatCapacity,
+    Fuel,
+    Integrator,
+    MonteCarlo,
+    Sweep,
+    WhatIf,
+)
 
 
 # Initialize the API router
@@ -217,6 +246,26 @@ def set_volume_heat_capacity_var(attr: HeatCapacity):
     }
 
 
+# Integrator of the building temperature
+@router.get(
+    "/get-integrator",
+    description="Get the integration method of the building temperature.",
+)
+def get_integrator():
+    return {"integrator": building.integrator}
+
+
+@router.post(
+    "/set-integrator",
+    description="Set the integration method of the building temperature (euler or exact).",
+)
+def set_integrator(attr: Integrator):
+    if attr.integrator.value == building.integrator:
+        return {"message": f"Integrator already set to {attr.integrator.value}"}
+    building.integrator = attr.integrator.value
+    return {"message": f"Integrator successfully set to {attr.integrator.value}"}
+
+
 # Building temperature
 @router.get(
     "/get-current-building-temperature",
@@ -248,17 +297,15 @@ def get_boiler_operating_percentage():
     return {"boiler_operating_percentage": float(f"{boiler.operating_percentage:.2f}")}
 
 
-# Current energy consumption
+# Current energy consumption (integrated by the meter)
 @router.get(
     "/get-current-building-energy-consumption",
-    description="Get the current building energy consumption in kWh.",
+    description="Get the energy consumed by the building during the last hour of simulated time in kWh.",
 )
 def get_energy_consumption():
-    return {
-        "current_building_energy_consumption": float(
-            f"{building.calculate_energy_consumption_kWh():.2f}"
-        )
-    }
+    with engine.lock:
+        window = engine.meter.window(cst.ENERGY_WINDOWS["hour"])
+    return {"current_building_energy_consumption": float(f"{window['energy_kWh']:.2f}")}
 
 
 # Current boiler heat power
@@ -281,11 +328,185 @@ def get_fuel_consumption():
     }
 
 
-# Current energy price
+# Current energy price (integrated by the meter)
 @router.get(
-    "/get-current-energy-price", description="Get the current energy price in CHF/year."
+    "/get-current-energy-price",
+    description="Get the energy price in CHF/year, extrapolated from the cost during the last day of simulated time.",
 )
 def get_energy_price():
-    return {
-        "current_energy_price": float(f"{boiler.calculate_fuel_price_per_year():.2f}")
+    with engine.lock:
+        price = engine.meter.cost_per_year(cst.ENERGY_WINDOWS["day"])
+    return {"current_energy_price": float(f"{price:.2f}")}
+
+
+# Energy accounting
+@router.get(
+    "/get-energy-accounting",
+    description="Get the energy in kWh, the cost in CHF and the fuel consumed since the start of the simulation, "
+    + "and the energy, cost and mean power in W during the last hour, day and month of simulated time.",
+)
+def get_energy_accounting():
+    with engine.lock:
+        return engine.meter.summary()
+
+
+# History of the simulation
+@router.get(
+    "/history",
+    description="Get the recorded values between two times in hours of simulated time (negative times are relative "
+    + "to now, e.g. from=-12 for the last 12 hours), downsampled to at most resolution points per field: buckets "
+    + "with the min, max and mean (method=buckets) or the points shaping the curve (method=lttb). Fields: "
+    + "building_temperatures, outside_temperatures, set_temperatures, boiler_operating_percentages (comma-separated).",
+)
+def get_history(
+    fields: str = "building_temperatures",
+    start: float = Query(None, alias="from"),
+    end: float = Query(None, alias="to"),
+    resolution: int = cst.HISTORY_RESOLUTION,
+    method: str = "buckets",
+):
+    if resolution > cst.MAX_HISTORY_RESOLUTION:
+        return {
+            "message": f"Resolution must be at most {cst.MAX_HISTORY_RESOLUTION} points"
+        }
+    # The history is only appended to (a compacted history replaces it), it can be read while the simulation runs
+    try:
+        return query_history(
+            engine.history, fields.split(","), start, end, resolution, method
+        )
+    except ValueError as e:
+        return {"message": f"History not available: {e}"}
+
+
+# Snapshot of the simulation state
+@router.get(
+    "/snapshot",
+    response_class=Response,
+    description="Get a snapshot of the complete simulation state (compressed binary).",
+)
+def get_snapshot():
+    return Response(content=dumps(engine), media_type="application/octet-stream")
+
+
+@router.post(
+    "/snapshot",
+    description="Restore the simulation state from a snapshot returned by GET /snapshot.",
+)
+async def set_snapshot(request: Request):
+    try:
+        loads(engine, await request.body())
+    except ValueError as e:
+        return {"message": f"Snapshot not restored: {e}"}
+    return {"message": "Snapshot successfully restored"}
+
+
+# What-if simulation
+@router.post(
+    "/what-if",
+    description="Simulate the next hours from the current state with hypothetical changes "
+    + "(set temperature, outside temperature, building edge, heat transfer coefficient, boiler power, fuel, "
+    + "volume heat capacity), without changing the live simulation. Returns the hourly trajectories, "
+    + "the energy consumption in kWh, the fuel consumption and the cost in CHF. With adaptive=true, the building "
+    + "and its regulator are integrated with adaptive steps, for long simulations.",
+)
+async def what_if(what_if: WhatIf):
+    changes = what_if.dict(
+        exclude_none=True, exclude={"hours", "time_step", "adaptive"}
+    )
+    changes = {
+        parameter: value.value if isinstance(value, Enum) else value
+        for parameter, value in changes.items()
     }
+    time_step = what_if.time_step.value if what_if.time_step else None
+    try:
+        future = submit_what_if(
+            engine, changes, what_if.hours, time_step, what_if.adaptive
+        )
+    except ValueError as e:
+        return {"message": f"What-if simulation not run: {e}"}
+    return await asyncio.wrap_future(future)
+
+
+# Parameter sweep
+@router.post(
+    "/sweep",
+    description="Simulate a grid of parameters, or a Latin hypercube sample of parameter ranges if samples is given. "
+    + "The parameters are the ones of a building and its boiler (building_edge, heat_transfer_coefficient, "
+    + "boiler_power, fuel...), the results are streamed as CSV. With adaptive=true, the cases are integrated with "
+    + "adaptive steps, for long simulations.",
+)
+def sweep(sweep: Sweep):
+    # The number of cases is checked before they are built
+    try:
+        count = count_cases(sweep.grid, sweep.ranges, sweep.samples)
+    except ValueError as e:
+        return {"message": f"Sweep not run: {e}"}
+    if count > cst.MAX_SWEEP_CASES:
+        return {
+            "message": f"Sweep not run: the number of cases must be at most {cst.MAX_SWEEP_CASES}"
+        }
+    if sweep.hours <= 0 or sweep.hours > cst.MAX_WHAT_IF_HOURS:
+        return {
+            "message": f"Sweep not run: duration must be between 0 and {cst.MAX_WHAT_IF_HOURS} h"
+        }
+
+    if sweep.samples is not None:
+        cases = latin_hypercube(
+            {**sweep.grid, **sweep.ranges}, sweep.samples, sweep.seed
+        )
+    else:
+        cases = grid(sweep.grid)
+    try:
+        validate_cases(cases)
+    except ValueError as e:
+        return {"message": f"Sweep not run: {e}"}
+
+    # The chunks not started yet are cancelled when the stream ends, e.g. if the client disconnects
+    executor = get_sweep_executor()
+    futures = submit_sweep(
+        cases,
+        sweep.hours,
+        sweep.time_step.value,
+        executor,
+        cst.SWEEP_WORKERS or os.cpu_count(),
+        sweep.adaptive,
+    )
+    return StreamingResponse(
+        iter_csv(iter_results(futures)),
+        media_type="text/csv",
+        background=BackgroundTask(cancel_sweep, futures),
+    )
+
+
+# Monte Carlo simulation
+@router.post(
+    "/monte-carlo",
+    description="Simulate replicas of the current state with perturbed outside temperatures (°C), heat transfer "
+    + "coefficients and volume heat capacities (relative), and return the percentile bands (p5 to p95) of the "
+    + "building temperature, of the energy in kWh, of the cost in CHF and of the fuel price per year in CHF. "
+    + "Give a seed for reproducible results.",
+)
+async def monte_carlo(monte_carlo: MonteCarlo):
+    if monte_carlo.replicas < 1 or monte_carlo.replicas > cst.MAX_MONTE_CARLO_REPLICAS:
+        return {
+            "message": f"Number of replicas must be between 1 and {cst.MAX_MONTE_CARLO_REPLICAS}"
+        }
+    if monte_carlo.hours <= 0 or monte_carlo.hours > cst.MAX_WHAT_IF_HOURS:
+        return {"message": f"Duration must be between 0 and {cst.MAX_WHAT_IF_HOURS} h"}
+    if (
+        min(
+            monte_carlo.outside_sigma,
+            monte_carlo.heat_transfer_sigma,
+            monte_carlo.heat_capacity_sigma,
+        )
+        < 0
+    ):
+        return {"message": "Standard deviations must be positive"}
+
+    future = get_executor().submit(
+        run_monte_carlo,
+        *fork(engine),
+        **monte_carlo.dict(exclude={"time_step"}),
+        time_step=monte_carlo.time_step.value,
+    )
+    return await asyncio.wrap_future(future)
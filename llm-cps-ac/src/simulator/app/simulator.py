@@ -18,6 +18,7 @@ from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.pyplot as plt
 
 import app.constants as cst
+from app.engine import Engine
 
 
 class Simulator:
@@ -36,6 +37,7 @@ class Simulator:
         regulator,
         time_step,
         built_in_screen=False,
+        engine=None,
     ):
         """
         Initialize the simulator with boiler, building, regulator and weather objects.
@@ -45,14 +47,15 @@ class Simulator:
             boiler (Boiler): Boiler object
             building (Building): Building object
             regulator (Regulator): Regulator object
-            time_step (int): Time step for the simulation in seconds
+            time_step (str): Time step for the simulation ("minute", "hour" or "day"), if no engine is given
             built_in_screen (bool): If True, the size of figure elements is reduced
+            engine (Engine): Engine advancing the simulation, a new one with the given elements by default
         """
         # Initialize the simulator's elements
         self.boiler = boiler
         self.building = building
         self.regulator = regulator
-        self.time_step = time_step
+        self.engine = engine or Engine(boiler, building, regulator, time_step)
 
         # Initialize the old values of the scales and variables
         self.old_temperature_scale = None
@@ -65,12 +68,7 @@ class Simulator:
         self.old_fuel_var = None
         self.old_volume_heat_capacity_var = None
         self.old_time_step_var = None
-
-        # Initialize the lists of values to display
-        self.temperatures = [building.building_temperature]
-        self.outside_temperatures = [building.outside_temperature]
-        self.set_temperatures = [building.set_temperature]
-        self.boiler_operating_percentages = [boiler.operating_percentage]
+        self.old_integrator_var = None
 
         # Create Tkinter window
         self.window = tk.Tk()
@@ -102,6 +100,17 @@ class Simulator:
         # Start Tkinter event loop
         self.window.mainloop()
 
+    @property
+    def time_step(self):
+        """
+        Time step of the simulation, kept by the engine.
+        """
+        return self.engine.time_step
+
+    @time_step.setter
+    def time_step(self, value):
+        self.engine.time_step = value
+
     def _create_slider(self, parent, label, length, from_, to_, initial, resolution=1):
         """
         Create and configure a single slider with the given parameters.
@@ -152,13 +161,13 @@ class Simulator:
             self.building.outside_temperature,
         )
 
-        # Create the building.use_real_weather button (next to the outside temperature slider)
-        self.building.use_real_weather_button = tk.Button(
+        # Create the use_real_weather button of the building (next to the outside temperature slider)
+        self.use_real_weather_button = tk.Button(
             sliders_frame,
             text="x",
             command=self.building.toggle_use_real_weather,
         )
-        self.building.use_real_weather_button.pack(pady=25)
+        self.use_real_weather_button.pack(pady=25)
 
         sliders_frame_2 = tk.Frame(self.window)
         sliders_frame_2.pack()
@@ -224,7 +233,7 @@ class Simulator:
 
     def _create_options(self):
         """
-        Create and configure an option menu for fuel, volume heat capacity and time step.
+        Create and configure an option menu for fuel, volume heat capacity, time step and integrator.
         """
         options_frame = tk.Frame(self.window)
         options_frame.pack()
@@ -269,6 +278,16 @@ class Simulator:
         )
         self.time_step_optionmenu.grid(row=0, column=5, padx=10, pady=10)
 
+        # Integrator choice
+        integrator_label = tk.Label(options_frame, text="Integrator:")
+        integrator_label.grid(row=0, column=6)
+        self.integrator_var = tk.StringVar(self.window)
+        self.integrator_var.set(self.building.integrator)
+        self.integrator_optionmenu = tk.OptionMenu(
+            options_frame, self.integrator_var, *cst.INTEGRATORS
+        )
+        self.integrator_optionmenu.grid(row=0, column=7, padx=10, pady=10)
+
     def _create_plot(self, built_in_screen):
         """
         Create and configure the matplotlib plot embedded in the Tkinter window.
@@ -356,8 +375,13 @@ class Simulator:
         self.building_outside_temperature_label.config(
             text=f"Outside temperature: {self.building.outside_temperature:.2f} °C"
         )
+        with self.engine.lock:
+            energy_kWh = self.engine.meter.window(cst.ENERGY_WINDOWS["hour"])[
+                "energy_kWh"
+            ]
+            price = self.engine.meter.cost_per_year(cst.ENERGY_WINDOWS["day"])
         self.energy_consumption_label.config(
-            text=f"Energy consumption: {self.building.calculate_energy_consumption_kWh():.2f} kWh"
+            text=f"Energy consumption (last hour): {energy_kWh:.2f} kWh"
         )
         self.boiler_heat_power_label.config(
             text=f"Current boiler heat power: {self.boiler.current_power:.2f} W"
@@ -365,9 +389,7 @@ class Simulator:
         self.fuel_consumption_label.config(
             text=f"Fuel consumption: {self.boiler.calculate_fuel_consumption():.2f} kg/h or m³/h or kWh"
         )
-        self.energy_price_label.config(
-            text=f"Energy price: {self.boiler.calculate_fuel_price_per_year():.2f} CHF/year"
-        )
+        self.energy_price_label.config(text=f"Energy price: {price:.2f} CHF/year")
 
     def _update_graph(self):
         """
@@ -376,16 +398,28 @@ class Simulator:
         self.ax.clear()
         self.ax2.clear()
 
+        # Recorded values against their time in time steps (the history of a long simulation is compacted)
+        with self.engine.lock:
+            history, length = self.engine.history, len(self.engine.history)
+        history = history.to_dict(length)
+        times = [time / cst.TIME_STEP[self.time_step] for time in history["times"]]
         self.ax.set_title("Building temperature evolution")
-        self.ax.plot(self.temperatures, label="Building temperature", color="red")
         self.ax.plot(
-            self.set_temperatures,
+            times,
+            history["building_temperatures"],
+            label="Building temperature",
+            color="red",
+        )
+        self.ax.plot(
+            times,
+            history["set_temperatures"],
             label="Set temperature",
             color="orange",
             linestyle="dashed",
         )
         self.ax.plot(
-            self.outside_temperatures,
+            times,
+            history["outside_temperatures"],
             label="Outside temperature",
             color="skyblue",
             linestyle="dotted",
@@ -394,12 +428,15 @@ class Simulator:
             self.ax.set_xlabel("Time (minutes)")
         elif self.time_step == "hour":
             self.ax.set_xlabel("Time (hours)")
+        elif self.time_step == "day":
+            self.ax.set_xlabel("Time (days)")
         else:
             self.ax.set_xlabel("Time")
         self.ax.set_ylabel("Temperature (°C)")
 
         self.ax2.plot(
-            self.boiler_operating_percentages,
+            times,
+            history["boiler_operating_percentages"],
             label="Boiler operating percentage",
             color="grey",
             linestyle="dotted",
@@ -490,6 +527,9 @@ class Simulator:
         self.old_time_step_var = self._update_attribute(
             self, "time_step", self.time_step_var, self.old_time_step_var
         )
+        self.old_integrator_var = self._update_attribute(
+            self.building, "integrator", self.integrator_var, self.old_integrator_var
+        )
 
         # Update the old values
         self.old_temperature_scale = self.set_temperature_scale.get()
@@ -504,30 +544,16 @@ class Simulator:
         self.old_fuel_var = self.fuel_var.get()
         self.old_volume_heat_capacity_var = self.volume_heat_capacity_var.get()
         self.old_time_step_var = self.time_step_var.get()
+        self.old_integrator_var = self.integrator_var.get()
 
-        # Update outside temperature (if we use real weather data)
-        if self.building.use_real_weather:
-            self.building.weather.update_building_outside_temperature(
-                self.building, cst.TIME_STEP[self.time_step]
-            )
-
-        # Regulate boiler
-        self.regulator.regulate_temperature(self.building)
-
-        # Calculate new building temperature
-        self.building.update_temperature(self.time_step)
-
-        # Add the new temperature to the temperature list
-        self.temperatures.append(self.building.building_temperature)
-        self.outside_temperatures.append(self.building.outside_temperature)
-        self.set_temperatures.append(self.building.set_temperature)
-        self.boiler_operating_percentages.append(self.boiler.operating_percentage)
+        # Advance the simulation of one time step
+        self.engine.step()
 
         # Update use_real_weather button
         if self.building.use_real_weather:
-            self.building.use_real_weather_button.configure(text="☀")
+            self.use_real_weather_button.configure(text="☀")
         else:
-            self.building.use_real_weather_button.configure(text="☼")
+            self.use_real_weather_button.configure(text="☼")
 
         # Update the graph
         self._update_graph()
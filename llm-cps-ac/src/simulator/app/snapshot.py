@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for the snapshots of the simulation state, used for the checkpoints on disk and the /snapshot routes.
+
+A snapshot contains the complete state of the engine (building, boiler, regulator, weather cursor, simulated time,
+history and energy meter). It is serialized as compressed JSON: floats are written with their exact representation, so a
+restored simulation gives the same results as the original one, and loading a snapshot never executes code.
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-25"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import json
+import logging
+import math
+import os
+import threading
+import zlib
+
+import app.constants as cst
+from app.energy import EnergyMeter
+from app.engine import History
+
+
+SNAPSHOT_VERSION = 2
+
+# Attributes saved for each element of the simulation
+BUILDING_ATTRIBUTES = [
+    "building_temperature",
+    "set_temperature",
+    "outside_temperature",
+    "building_edge",
+    "heat_transfer_coefficient",
+    "volume_heat_capacity",
+    "volume_heat_capacity_var",
+    "integrator",
+    "use_real_weather",
+]
+BOILER_ATTRIBUTES = ["boiler_power", "operating_percentage", "fuel", "current_power"]
+REGULATOR_ATTRIBUTES = ["cumulative_error", "previous_error", "Kp", "Ki", "Kd"]
+WEATHER_ATTRIBUTES = ["index", "counter", "weather_data"]
+
+
+def _get_attributes(obj, attributes):
+    """
+    Get the given attributes of an object as a dictionary.
+    """
+    return {attribute: getattr(obj, attribute) for attribute in attributes}
+
+
+def _set_attributes(obj, values, attributes):
+    """
+    Set the given attributes of an object from a dictionary.
+    """
+    for attribute in attributes:
+        setattr(obj, attribute, values[attribute])
+
+
+def _is_number(value):
+    """
+    Check if a value is a finite number (booleans excluded).
+    """
+    return (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and math.isfinite(value)
+    )
+
+
+def _is_count(value):
+    """
+    Check if a value is a non-negative integer (booleans excluded), e.g. an index.
+    """
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def _is_number_list(values):
+    """
+    Check if a value is a list of finite numbers.
+    """
+    return isinstance(values, list) and all(_is_number(value) for value in values)
+
+
+# Checks of the values of each element of the simulation
+# fmt: off
+BUILDING_CHECKS = {
+    "building_temperature": _is_number,
+    "set_temperature": _is_number,
+    "outside_temperature": _is_number,
+    "building_edge": lambda value: _is_number(value) and value > 0,
+    "heat_transfer_coefficient": lambda value: _is_number(value) and value > 0,
+    "volume_heat_capacity": lambda value: _is_number(value) and value > 0,
+    "volume_heat_capacity_var": lambda value: value is None or (isinstance(value, str) and value in cst.HEAT_CAPACITY),
+    "integrator": lambda value: isinstance(value, str) and value in cst.INTEGRATORS,
+    "use_real_weather": lambda value: isinstance(value, bool),
+}
+BOILER_CHECKS = {
+    "boiler_power": lambda value: _is_number(value) and value >= 0,
+    "operating_percentage": _is_number,
+    "fuel": lambda value: isinstance(value, str) and value in cst.FUEL_EFFICIENCIES,
+    "current_power": _is_number,
+}
+REGULATOR_CHECKS = {attribute: _is_number for attribute in REGULATOR_ATTRIBUTES}
+WEATHER_CHECKS = {
+    "index": _is_count,
+    "counter": lambda value: _is_count(value) and value < cst.TIME_STEP["hour"],
+    "weather_data": lambda value: isinstance(value, list) and len(value) > 0 and all(
+        isinstance(data, list) and len(data) == 2 and _is_number(data[1]) for data in value
+    ),
+}
+# fmt: on
+
+
+def _check_values(values, checks, name):
+    """
+    Check the values of an element of the simulation.
+
+    Raises:
+        ValueError: If a value is missing or not valid
+    """
+    if not isinstance(values, dict):
+        raise ValueError(f"Invalid snapshot: {name} missing")
+    for attribute, check in checks.items():
+        if attribute not in values:
+            raise ValueError(f"Invalid snapshot: {name}.{attribute} missing")
+        if not check(values[attribute]):
+            raise ValueError(
+                f"Invalid snapshot: {name}.{attribute} has an invalid value"
+            )
+
+
+def _check_lists(values, fields, name):
+    """
+    Check that the given fields are lists of numbers of the same length.
+
+    Raises:
+        ValueError: If a list is missing, not valid or of another length
+    """
+    _check_values(values, {field: _is_number_list for field in fields}, name)
+    if len({len(values[field]) for field in fields}) > 1:
+        raise ValueError(f"Invalid snapshot: the lists of {name} differ in length")
+
+
+def validate_state(state):
+    """
+    Check a whole state before it is restored: required keys, types of the values and lengths of the lists.
+
+    Args:
+        state (dict): State returned by `get_state`
+
+    Raises:
+        ValueError: If the state is not a valid snapshot
+    """
+    if not isinstance(state, dict) or state.get("version") != SNAPSHOT_VERSION:
+        raise ValueError("Snapshot version not supported")
+    if not _is_number(state.get("time")):
+        raise ValueError("Invalid snapshot: time has an invalid value")
+    if (
+        not isinstance(state.get("time_step"), str)
+        or state["time_step"] not in cst.TIME_STEP
+    ):
+        raise ValueError("Invalid snapshot: time_step has an invalid value")
+
+    _check_values(state.get("building"), BUILDING_CHECKS, "building")
+    _check_values(state.get("boiler"), BOILER_CHECKS, "boiler")
+    _check_values(state.get("regulator"), REGULATOR_CHECKS, "regulator")
+    if state.get("weather") is not None:
+        _check_values(state["weather"], WEATHER_CHECKS, "weather")
+        if state["weather"]["index"] >= len(state["weather"]["weather_data"]):
+            raise ValueError("Invalid snapshot: weather.index out of the weather data")
+
+    _check_lists(state.get("history"), History.FIELDS, "history")
+    meter = state.get("meter")
+    _check_values(
+        meter,
+        {
+            "energy_kWh": _is_number,
+            "cost": _is_number,
+            "fuel_consumption": lambda value: isinstance(value, dict)
+            and all(
+                isinstance(fuel, str)
+                and fuel in cst.FUEL_EFFICIENCIES
+                and _is_number(consumption)
+                for fuel, consumption in value.items()
+            ),
+        },
+        "meter",
+    )
+    _check_lists(meter, ["times", "cumulative_energy", "cumulative_cost"], "meter")
+    if not meter["times"]:
+        raise ValueError("Invalid snapshot: the lists of meter are empty")
+
+
+def get_state(engine):
+    """
+    Get the complete state of an engine as a dictionary. Only the small state and the bounded energy meter
+    are copied under the lock of the engine, the history is copied after.
+
+    Args:
+        engine (Engine): Engine of the simulation
+    """
+    with engine.lock:
+        weather = engine.building.weather
+        history, history_length = engine.history, len(engine.history)
+        state = {
+            "version": SNAPSHOT_VERSION,
+            "time": engine.time,
+            "time_step": engine.time_step,
+            "building": _get_attributes(engine.building, BUILDING_ATTRIBUTES),
+            "boiler": _get_attributes(engine.boiler, BOILER_ATTRIBUTES),
+            "regulator": _get_attributes(engine.regulator, REGULATOR_ATTRIBUTES),
+            "weather": _get_attributes(weather, WEATHER_ATTRIBUTES)
+            if weather is not None
+            else None,
+            "meter": engine.meter.to_dict(),
+        }
+
+    # The history is only appended to (or replaced when compacted), it is copied without blocking the engine
+    state["history"] = history.to_dict(history_length)
+    return state
+
+
+def set_state(engine, state):
+    """
+    Restore the state of an engine from a dictionary. The whole state is validated first, and then swapped in
+    under the lock of the engine, so that an invalid snapshot leaves the engine unchanged. The elements of the
+    simulation are modified in place, so that the references to them (e.g. in the routes) stay valid.
+
+    Args:
+        engine (Engine): Engine of the simulation
+        state (dict): State returned by `get_state`
+
+    Raises:
+        ValueError: If the state is not a valid snapshot
+    """
+    validate_state(state)
+    if state["building"]["use_real_weather"] and engine.building.weather is None:
+        raise ValueError("Invalid snapshot: real weather data not available")
+    history = History.from_dict(state["history"])
+    meter = EnergyMeter.from_dict(state["meter"])
+
+    with engine.lock:
+        _set_attributes(engine.building, state["building"], BUILDING_ATTRIBUTES)
+        _set_attributes(engine.boiler, state["boiler"], BOILER_ATTRIBUTES)
+        _set_attributes(engine.regulator, state["regulator"], REGULATOR_ATTRIBUTES)
+        weather = engine.building.weather
+        if weather is not None and state["weather"] is not None:
+            _set_attributes(weather, state["weather"], WEATHER_ATTRIBUTES)
+            weather.weather_data = [tuple(data) for data in weather.weather_data]
+        engine.history = history
+        engine.meter = meter
+        engine.time = state["time"]
+        engine.time_step = state["time_step"]
+
+
+def dumps(engine):
+    """
+    Serialize the state of an engine to bytes.
+    """
+    return zlib.compress(json.dumps(get_state(engine)).encode("utf-8"))
+
+
+def loads(engine, data):
+    """
+    Restore the state of an engine from bytes returned by `dumps`.
+
+    Raises:
+        ValueError: If the data is not a valid snapshot
+    """
+    try:
+        state = json.loads(zlib.decompress(data).decode("utf-8"))
+    except (zlib.error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid snapshot: {e}")
+    set_state(engine, state)
+
+
+def save_checkpoint(engine, path):
+    """
+    Save the state of an engine to a file. The file is replaced atomically, so a crash during the
+    writing never leaves a corrupted checkpoint.
+
+    Args:
+        engine (Engine): Engine of the simulation
+        path (str): Path of the checkpoint file
+    """
+    data = dumps(engine)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(engine, path):
+    """
+    Restore the state of an engine from a checkpoint file, if it exists and is valid.
+
+    Returns:
+        bool: True if the state has been restored
+    """
+    if not os.path.exists(path):
+        return False
+    try:
+        with open(path, "rb") as file:
+            loads(engine, file.read())
+    except (OSError, ValueError) as e:
+        logging.warning(f"Checkpoint {path} not restored: {e}")
+        return False
+    return True
+
+
+class Checkpointer:
+    """
+    Background thread saving the state of an engine to a checkpoint file at regular intervals.
+    """
+
+    def __init__(self, engine, path, interval):
+        """
+        Initialize the checkpointer.
+
+        Args:
+            engine (Engine): Engine of the simulation
+            path (str): Path of the checkpoint file
+            interval (float): Time between two checkpoints in seconds
+        """
+        self.engine = engine
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        """
+        Save a checkpoint at each interval until the checkpointer is stopped.
+        """
+        while not self._stop_event.wait(self.interval):
+            try:
+                save_checkpoint(self.engine, self.path)
+            except OSError as e:
+                logging.error(f"Checkpoint {self.path} not saved: {e}")
+
+    def start(self):
+        """
+        Start saving checkpoints in the background.
+        """
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the checkpointer and save a last checkpoint.
+        """
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        save_checkpoint(self.engine, self.path)
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for the parameter sweeps: a grid or a Latin hypercube sample of building and boiler parameters is
+simulated in a pool of worker processes, and the results are streamed to a CSV (or Parquet) file.
+
+Run a sweep from the command line with:
+    python -m app.sweep --param building_edge=5,10,20 --param fuel=gas,pellets --output sweep.csv
+    python -m app.sweep --param building_edge=5:20 --param boiler_power=5000:35000 --samples 100 --seed 1
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-27"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import argparse
+import csv
+import io
+import itertools
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import app.constants as cst
+from app.boiler import Boiler
+from app.building import Building
+from app.regulator import Regulator
+from app.whatif import WHAT_IF_LIMITS, run_what_if
+
+# Parquet output is optional
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# Parameters of a sweep case, with the default values of the simulation
+BASE_CASE = {
+    "building_temperature": 15,  # °C
+    "set_temperature": 20,  # °C
+    "outside_temperature": 5,  # °C
+    "building_edge": 10,  # m
+    "heat_transfer_coefficient": 0.2,  # W/m²*K
+    "volume_heat_capacity": "house",
+    "boiler_power": 30000,  # W
+    "fuel": "pellets",
+    "integrator": "exact",
+}
+
+# Results of each case, written after its parameters
+RESULT_FIELDS = ["final_temperature", "energy_kWh", "fuel_consumption", "cost"]
+FIELDNAMES = list(BASE_CASE) + RESULT_FIELDS
+
+# Number of rows written at once in a Parquet file
+PARQUET_BATCH_SIZE = 1000
+
+# Pool of worker processes of the API sweeps, created at the first sweep (separate from the what-if pool)
+_executor = None
+
+
+def grid(parameters):
+    """
+    Expand a grid of parameters into cases (cartesian product).
+
+    Args:
+        parameters (dict): Values of each parameter, e.g. {"building_edge": [5, 10], "fuel": ["gas", "pellets"]}
+
+    Returns:
+        list[dict]: One case per combination of values
+    """
+    names = list(parameters)
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*(parameters[name] for name in names))
+    ]
+
+
+def count_cases(grid, ranges, samples=None):
+    """
+    Count the cases of a sweep without expanding them, to reject a too large sweep before building it.
+
+    Args:
+        grid (dict): Values of each parameter of the grid (choices of the Latin hypercube if samples is given)
+        ranges (dict): Range (min, max) of each numerical parameter, sampled if samples is given
+        samples (int): Number of cases of a Latin hypercube sample, a grid by default
+
+    Returns:
+        int: Number of cases
+
+    Raises:
+        ValueError: If the number of samples is not positive, if ranges are given without samples, or if a
+            parameter is both in the grid and the ranges
+    """
+    for name in grid:
+        if name in ranges:
+            raise ValueError(f"Parameter {name} is both in the grid and the ranges")
+    if samples is not None:
+        if samples < 1:
+            raise ValueError("The number of samples must be positive")
+        return samples
+    if ranges:
+        raise ValueError("ranges require a number of samples")
+    return math.prod(len(values) for values in grid.values())
+
+
+def latin_hypercube(parameters, samples, seed=None):
+    """
+    Sample cases with a Latin hypercube: the range of each parameter is divided into as many strata as samples,
+    and each stratum is sampled exactly once, so that the cases cover the ranges evenly.
+
+    Args:
+        parameters (dict): Range (min, max) of each numerical parameter, or list of choices of the others
+        samples (int): Number of cases
+        seed (int): Seed of the random generator, for reproducible samples
+
+    Returns:
+        list[dict]: The sampled cases
+    """
+    generator = random.Random(seed)
+    columns = {}
+    for name, values in parameters.items():
+        strata = list(range(samples))
+        generator.shuffle(strata)
+        if isinstance(values, tuple):
+            minimum, maximum = values
+            columns[name] = [
+                minimum + (stratum + generator.random()) / samples * (maximum - minimum)
+                for stratum in strata
+            ]
+        else:
+            # Choices spread evenly over the strata
+            columns[name] = [
+                values[stratum * len(values) // samples] for stratum in strata
+            ]
+    return [
+        {name: column[i] for name, column in columns.items()} for i in range(samples)
+    ]
+
+
+def run_case(case, hours, time_step, adaptive=False):
+    """
+    Simulate a case from the default values of the simulation.
+
+    Args:
+        case (dict): Values of the parameters different from BASE_CASE
+        hours (float): Duration of the simulation in hours
+        time_step (str): Time step of the simulation ("minute", "hour" or "day")
+        adaptive (bool): Integrate with adaptive steps (the integrator parameter is then not used)
+
+    Returns:
+        dict: The parameters of the case followed by its results
+    """
+    parameters = {**BASE_CASE, **case}
+    boiler = Boiler(parameters["boiler_power"], 0, parameters["fuel"])
+    building = Building(
+        parameters["building_temperature"],
+        parameters["set_temperature"],
+        parameters["outside_temperature"],
+        parameters["building_edge"],
+        parameters["heat_transfer_coefficient"],
+        cst.HEAT_CAPACITY[parameters["volume_heat_capacity"]],
+        boiler,
+        None,
+        parameters["integrator"],
+    )
+    result = run_what_if(boiler, building, Regulator(), time_step, hours, adaptive)
+    return {**parameters, **{field: result[field] for field in RESULT_FIELDS}}
+
+
+def _run_chunk(cases, hours, time_step, adaptive=False):
+    """
+    Simulate several cases in a worker, to send fewer tasks to the pool.
+    """
+    return [run_case(case, hours, time_step, adaptive) for case in cases]
+
+
+def validate_cases(cases):
+    """
+    Check the parameters of the cases before running them.
+
+    Raises:
+        ValueError: If a parameter cannot be swept or a value is not valid
+    """
+    choices = {
+        "fuel": cst.FUEL_EFFICIENCIES,
+        "volume_heat_capacity": cst.HEAT_CAPACITY,
+        "integrator": cst.INTEGRATORS,
+    }
+    for case in cases:
+        for name, value in case.items():
+            if name not in BASE_CASE:
+                raise ValueError(f"Parameter {name} cannot be swept")
+            if name in choices:
+                if not isinstance(value, str) or value not in choices[name]:
+                    raise ValueError(f"Value {value} of {name} not recognized")
+                continue
+            # The other parameters are numbers
+            if (
+                not isinstance(value, (int, float))
+                or isinstance(value, bool)
+                or not math.isfinite(value)
+            ):
+                raise ValueError(f"Value {value} of {name} is not a number")
+            if name in WHAT_IF_LIMITS:
+                minimum, maximum = WHAT_IF_LIMITS[name]
+                if not minimum <= value <= maximum:
+                    raise ValueError(f"{name} must be between {minimum} and {maximum}")
+
+
+def submit_sweep(cases, hours, time_step, executor, workers, adaptive=False):
+    """
+    Send the cases to a pool of workers, in chunks (several chunks per worker to balance the load).
+
+    Args:
+        cases (list[dict]): Cases of the sweep, checked with `validate_cases`
+        hours (float): Duration of each simulation in hours
+        time_step (str): Time step of the simulations
+        executor (Executor): Pool of workers
+        workers (int): Number of workers of the pool
+        adaptive (bool): Integrate the cases with adaptive steps
+
+    Returns:
+        list[Future]: The results of the chunks, in the order of the cases
+    """
+    chunk_size = max(1, len(cases) // (workers * 4))
+    chunks = [cases[i : i + chunk_size] for i in range(0, len(cases), chunk_size)]
+    return [
+        executor.submit(_run_chunk, chunk, hours, time_step, adaptive)
+        for chunk in chunks
+    ]
+
+
+def cancel_sweep(futures):
+    """
+    Cancel the chunks of a sweep which are not started yet, e.g. when the client of a streamed sweep disconnects.
+    """
+    for future in futures:
+        future.cancel()
+
+
+def iter_results(futures):
+    """
+    Yield the results of the chunks in the order of the cases, as soon as they are ready.
+    The chunks not started yet are cancelled if the iteration stops early.
+    """
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        cancel_sweep(futures)
+
+
+def iter_sweep(cases, hours, time_step, executor, workers, adaptive=False):
+    """
+    Simulate cases in a pool of workers and yield the results in the order of the cases, as soon as they are ready.
+
+    Args:
+        cases (list[dict]): Cases of the sweep, checked with `validate_cases`
+        hours (float): Duration of each simulation in hours
+        time_step (str): Time step of the simulations
+        executor (Executor): Pool of workers
+        workers (int): Number of workers of the pool
+        adaptive (bool): Integrate the cases with adaptive steps
+    """
+    return iter_results(
+        submit_sweep(cases, hours, time_step, executor, workers, adaptive)
+    )
+
+
+def get_executor():
+    """
+    Get the pool of worker processes running the API sweeps.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=cst.SWEEP_WORKERS)
+    return _executor
+
+
+def iter_csv(rows):
+    """
+    Convert the results of a sweep to lines of CSV, starting with the header.
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDNAMES)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def write_results(rows, path):
+    """
+    Write the results of a sweep to a file while they are computed: Parquet if the path ends with .parquet
+    (requires pyarrow), CSV otherwise.
+
+    Returns:
+        int: Number of rows written
+    """
+    count = 0
+    if os.path.splitext(path)[1] == ".parquet":
+        if pyarrow is None:
+            raise ValueError("pyarrow is required to write Parquet files")
+        writer = None
+        rows = iter(rows)
+        while batch := list(itertools.islice(rows, PARQUET_BATCH_SIZE)):
+            table = pyarrow.Table.from_pylist(batch)
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            count += len(batch)
+        if writer is not None:
+            writer.close()
+        return count
+
+    with open(path, "w", newline="") as file:
+        for line in iter_csv(rows):
+            file.write(line)
+            count += line.count("\n")
+    return count - 1  # Without the header
+
+
+def parse_values(text):
+    """
+    Parse the values of a parameter from the command line: "min:max" for a range, "a,b,c" for a list.
+    """
+
+    def parse(value):
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+    if ":" in text:
+        minimum, maximum = text.split(":")
+        return (float(minimum), float(maximum))
+    return [parse(value) for value in text.split(",")]
+
+
+def main():
+    """
+    Main function to run a sweep from the command line.
+    """
+    parser = argparse.ArgumentParser(
+        description="Simulate a grid or a Latin hypercube sample of parameters."
+    )
+    parser.add_argument(
+        "--param",
+        action="append",
+        required=True,
+        help="Parameter values, name=a,b,c (list) or name=min:max (range, with --samples)",
+    )
+    parser.add_argument(
+        "--samples", type=int, help="Latin hypercube sample size (grid by default)"
+    )
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--time-step", choices=list(cst.TIME_STEP), default="minute")
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Integrate with adaptive steps, for long simulations",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", default="sweep.csv")
+    args = parser.parse_args()
+
+    parameters = dict(param.split("=", 1) for param in args.param)
+    parameters = {name: parse_values(values) for name, values in parameters.items()}
+    if args.samples:
+        cases = latin_hypercube(parameters, args.samples, args.seed)
+    else:
+        if any(isinstance(values, tuple) for values in parameters.values()):
+            parser.error("Ranges require --samples")
+        cases = grid(parameters)
+    try:
+        validate_cases(cases)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.output.endswith(".parquet") and pyarrow is None:
+        parser.error("pyarrow is required to write Parquet files")
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        count = write_results(
+            iter_sweep(
+                cases,
+                args.hours,
+                args.time_step,
+                executor,
+                args.workers,
+                args.adaptive,
+            ),
+            args.output,
+        )
+    duration = time.perf_counter() - start
+    print(
+        f"{count} cases in {duration:.2f} s with {args.workers} workers "
+        + f"({count / duration:.1f} cases/s), written to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for the queries of the history of the simulation: a time range is found by binary search in the recorded
+times, and its values are downsampled on the server, either into buckets (min, max and mean) or with the
+Largest-Triangle-Three-Buckets (LTTB) algorithm, which keeps the points shaping the curve.
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-30"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+from bisect import bisect_left, bisect_right
+
+from app.engine import History
+
+
+# Downsampling methods of the history queries
+HISTORY_METHODS = ["buckets", "lttb"]
+
+
+def aggregate(times, values, resolution):
+    """
+    Aggregate values into buckets of equal duration, empty buckets are skipped.
+
+    Args:
+        times (list[float]): Sorted times of the values
+        values (list[float]): Values to aggregate
+        resolution (int): Maximum number of buckets
+
+    Returns:
+        dict: Start time, min, max and mean of each bucket
+    """
+    result = {"times": [], "min": [], "max": [], "mean": []}
+    if not times:
+        return result
+
+    start, end = times[0], times[-1]
+    width = (end - start) / resolution or 1
+    index = 0
+    for bucket in range(resolution):
+        # Values until the start of the next bucket (the last bucket includes the end)
+        if bucket == resolution - 1:
+            next_index = len(times)
+        else:
+            next_index = bisect_left(times, start + (bucket + 1) * width, index)
+        if next_index > index:
+            bucket_values = values[index:next_index]
+            result["times"].append(start + bucket * width)
+            result["min"].append(min(bucket_values))
+            result["max"].append(max(bucket_values))
+            result["mean"].append(sum(bucket_values) / len(bucket_values))
+        index = next_index
+    return result
+
+
+def lttb(times, values, threshold):
+    """
+    Downsample a curve with the Largest-Triangle-Three-Buckets algorithm: the first and last points are kept,
+    and in each bucket the point forming the largest triangle with the point kept in the previous bucket and the
+    mean of the next bucket.
+
+    Args:
+        times (list[float]): Sorted times of the values
+        values (list[float]): Values to downsample
+        threshold (int): Number of points to keep (at least 3)
+
+    Returns:
+        dict: Times and values of the kept points
+    """
+    if threshold >= len(times) or threshold < 3:
+        return {"times": list(times), "values": list(values)}
+
+    sampled = [0]
+    bucket_size = (len(times) - 2) / (threshold - 2)
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+
+        # Mean of the next bucket (the last point after the last bucket)
+        next_start, next_end = end, min(int((bucket + 2) * bucket_size) + 1, len(times))
+        if next_start >= next_end:
+            next_start, next_end = len(times) - 1, len(times)
+        mean_time = sum(times[next_start:next_end]) / (next_end - next_start)
+        mean_value = sum(values[next_start:next_end]) / (next_end - next_start)
+
+        # Point of the bucket forming the largest triangle
+        best_area, best = -1, start
+        for i in range(start, end):
+            area = abs(
+                (times[previous] - mean_time) * (values[i] - values[previous])
+                - (times[previous] - times[i]) * (mean_value - values[previous])
+            )
+            if area > best_area:
+                best_area, best = area, i
+        sampled.append(best)
+        previous = best
+    sampled.append(len(times) - 1)
+
+    return {
+        "times": [times[i] for i in sampled],
+        "values": [values[i] for i in sampled],
+    }
+
+
+def query_history(
+    history, fields, start=None, end=None, resolution=500, method="buckets"
+):
+    """
+    Get the values of the history in a time range, downsampled to a number of points.
+
+    Args:
+        history (History): History of the simulation
+        fields (list[str]): Recorded values to get (History.FIELDS without "times")
+        start (float): Start of the range in hours of simulated time, relative to the last time if negative,
+            the first time by default
+        end (float): End of the range in hours, relative to the last time if negative, the last time by default
+        resolution (int): Maximum number of points of each field
+        method (str): Downsampling method, "buckets" (min, max and mean) or "lttb"
+
+    Returns:
+        dict: Range in hours, and the downsampled values of each field with their times in hours
+
+    Raises:
+        ValueError: If a field, the resolution or the method is not valid
+    """
+    for field in fields:
+        if field not in History.FIELDS or field == "times":
+            raise ValueError(f"Field {field} not recorded")
+    if method not in HISTORY_METHODS:
+        raise ValueError(f"Method {method} not supported")
+    if resolution < 3:
+        raise ValueError("Resolution must be at least 3")
+
+    times = history.times
+    last = times[-1] / 3600 if times else 0
+
+    def to_seconds(hours, default):
+        if hours is None:
+            return default
+        return (last + hours if hours < 0 else hours) * 3600
+
+    start = to_seconds(start, times[0] if times else 0)
+    end = to_seconds(end, times[-1] if times else 0)
+
+    # Range of the recorded values, found by binary search in the sorted times
+    # (without a value being appended to the fields during the query)
+    first_index = bisect_left(times, start)
+    last_index = min(
+        bisect_right(times, end), *(len(getattr(history, field)) for field in fields)
+    )
+    range_times = [time / 3600 for time in times[first_index:last_index]]  # h
+
+    result = {"from": start / 3600, "to": end / 3600, "method": method, "fields": {}}
+    for field in fields:
+        values = getattr(history, field)[first_index:last_index]
+        if method == "lttb":
+            result["fields"][field] = lttb(range_times, values, resolution)
+        else:
+            result["fields"][field] = aggregate(range_times, values, resolution)
+    return result
@@ -98,12 +98,12 @@ class Weather:
 
         Args:
             building (Building): The building to update.
-            time_step (int): The time step in minutes
+            time_step (int): The time step in seconds
         """
+        # Move forward of the number of hours elapsed (hourly weather data)
         self.counter += time_step
-        if self.counter >= TIME_STEP["hour"]:
-            self.counter = 0
-            self.index = (self.index + 1) % len(self.weather_data)
+        hours, self.counter = divmod(self.counter, TIME_STEP["hour"])
+        self.index = (self.index + int(hours)) % len(self.weather_data)
 
         time, temperature = self.weather_data[self.index]
         building.outside_temperature = temperature
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for the what-if simulations: the live state is forked, hypothetical changes are applied to the fork
+(fuel, boiler power, set temperature...), and the fork is run forward headlessly in a pool of worker processes,
+without disturbing the live simulation.
+"""
+
+__author__ = "Philippe Marziale"
+__copyright__ = "Copyright 2023, School of Engineering and Architecture of Fribourg"
+__license__ = "SPDX-License-Identifier: Apache-2.0"
+__date__ = "2023-07-26"
+__version__ = "1.0"
+__email__ = "philippe.marziale@edu.hefr.ch"
+
+
+import copy
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import app.constants as cst
+from app.engine import Engine
+from app.integrators import simulate_adaptive
+
+
+# Numerical parameters which can be changed in a what-if simulation, with their limits
+# fmt: off
+WHAT_IF_LIMITS = {
+    "set_temperature": (cst.MIN_SET_TEMPERATURE, cst.MAX_SET_TEMPERATURE),
+    "outside_temperature": (cst.MIN_OUTSIDE_TEMPERATURE, cst.MAX_OUTSIDE_TEMPERATURE),
+    "building_edge": (cst.MIN_BUILDING_EDGE, cst.MAX_BUILDING_EDGE),
+    "heat_transfer_coefficient": (cst.MIN_HEAT_TRANSFER_COEFFICIENT, cst.MAX_HEAT_TRANSFER_COEFFICIENT),
+    "boiler_power": (cst.MIN_BOILER_POWER, cst.MAX_BOILER_POWER),
+}
+# fmt: on
+
+# Pool of worker processes, created at the first what-if simulation
+_executor = None
+
+
+def fork(engine):
+    """
+    Fork the live state of an engine. The boiler, building, regulator and weather are shallow copies:
+    they only hold numbers and strings, which are replaced (never modified) when the fork changes, and the
+    weather data is shared with the live simulation. The history is not copied.
+
+    Args:
+        engine (Engine): Engine of the live simulation
+
+    Returns:
+        tuple: The copies of the boiler, the building and the regulator
+    """
+    with engine.lock:
+        boiler = copy.copy(engine.boiler)
+        building = copy.copy(engine.building)
+        regulator = copy.copy(engine.regulator)
+        building.boiler = boiler
+        if building.weather is not None:
+            building.weather = copy.copy(building.weather)
+    return boiler, building, regulator
+
+
+def apply_changes(boiler, building, changes):
+    """
+    Apply hypothetical changes to a forked state.
+
+    Args:
+        boiler (Boiler): Boiler of the fork
+        building (Building): Building of the fork
+        changes (dict): New values of the parameters (WHAT_IF_LIMITS keys, "fuel" and "volume_heat_capacity")
+
+    Raises:
+        ValueError: If a parameter is unknown or out of its limits
+    """
+    for parameter, value in changes.items():
+        if parameter in WHAT_IF_LIMITS:
+            minimum, maximum = WHAT_IF_LIMITS[parameter]
+            if value < minimum or value > maximum:
+                raise ValueError(f"{parameter} must be between {minimum} and {maximum}")
+        elif parameter == "fuel":
+            if value not in cst.FUEL_EFFICIENCIES:
+                raise ValueError(f"Fuel type {value} not recognized")
+        elif parameter == "volume_heat_capacity":
+            if value not in cst.HEAT_CAPACITY:
+                raise ValueError(f"Volume heat capacity {value} not recognized")
+        else:
+            raise ValueError(f"Parameter {parameter} cannot be changed")
+
+    if "boiler_power" in changes:
+        boiler.boiler_power = changes["boiler_power"]
+        boiler._update_heating_power()
+    if "fuel" in changes:
+        boiler.fuel = changes["fuel"]
+    if "volume_heat_capacity" in changes:
+        building.volume_heat_capacity_var = changes["volume_heat_capacity"]
+        building.volume_heat_capacity = cst.HEAT_CAPACITY[
+            changes["volume_heat_capacity"]
+        ]
+    for parameter in [
+        "set_temperature",
+        "outside_temperature",
+        "building_edge",
+        "heat_transfer_coefficient",
+    ]:
+        if parameter in changes:
+            setattr(building, parameter, changes[parameter])
+
+    # A fixed outside temperature replaces the real weather
+    if "outside_temperature" in changes:
+        building.use_real_weather = False
+
+
+def run_what_if(boiler, building, regulator, time_step, hours, adaptive=False):
+    """
+    Run a forked state forward and integrate its energy consumption and cost.
+
+    Args:
+        boiler (Boiler): Boiler of the fork
+        building (Building): Building of the fork
+        regulator (Regulator): Regulator of the fork
+        time_step (str): Time step of the simulation ("minute", "hour" or "day")
+        hours (float): Duration of the simulation in hours
+        adaptive (bool): Integrate the building and its regulator with adaptive steps (`run_adaptive`) instead of
+            one step of the engine per time step
+
+    Returns:
+        dict: Hourly trajectories of the simulation, with the energy, fuel and cost over the whole duration
+    """
+    if adaptive:
+        return run_adaptive(boiler, building, regulator, time_step, hours)
+
+    engine = Engine(boiler, building, regulator, time_step)
+    duration = cst.TIME_STEP[time_step]
+    for _ in range(math.ceil(hours * 3600 / duration)):
+        engine.step()
+
+    stride = max(1, cst.TIME_STEP["hour"] // duration)
+    trajectories = {
+        field: values[::stride] for field, values in engine.history.to_dict().items()
+    }
+    trajectories["times"] = [time / 3600 for time in trajectories["times"]]  # h
+
+    return {
+        **trajectories,
+        "final_temperature": building.building_temperature,
+        "energy_kWh": engine.meter.energy_kWh,
+        "fuel_consumption": engine.meter.fuel_consumption.get(boiler.fuel, 0),
+        "cost": engine.meter.cost,  # CHF
+    }
+
+
+def run_adaptive(boiler, building, regulator, time_step, hours):
+    """
+    Run a forked state forward with adaptive steps (`simulate_adaptive`): large steps in steady state and small
+    steps around the regulator transitions, so that long simulations take far fewer steps than the engine.
+    With real weather data, the simulation is split at each change of the hourly outside temperature.
+
+    Args:
+        boiler (Boiler): Boiler of the fork
+        building (Building): Building of the fork
+        regulator (Regulator): Regulator of the fork
+        time_step (str): Time step of the discrete regulator matched by the simulation ("minute", "hour" or "day")
+        hours (float): Duration of the simulation in hours
+
+    Returns:
+        dict: Same results as `run_what_if`, the trajectories being interpolated at each hour
+    """
+    duration = hours * 3600  # s
+    weather = building.weather if building.use_real_weather else None
+    if weather is not None:
+        weather.update_building_outside_temperature(building, 0)
+
+    times, temperatures, operating_percentages, outside_temperatures = [], [], [], []
+    start = 0
+    while start < duration:
+        # Next change of the outside temperature (same hours as Weather.update_building_outside_temperature)
+        end = duration
+        if weather is not None:
+            end = min(end, start + cst.TIME_STEP["hour"] - weather.counter)
+
+        segment = simulate_adaptive(building, regulator, end - start, time_step)
+        first = 1 if times else 0
+        times += [start + time for time in segment[0][first:]]
+        temperatures += segment[1][first:]
+        operating_percentages += segment[2][first:]
+        outside_temperatures += [building.outside_temperature] * (
+            len(segment[0]) - first
+        )
+
+        if weather is not None:
+            # Whole number of seconds, the duration being a float (index of the hourly weather data)
+            weather.update_building_outside_temperature(
+                building, int(round(end - start))
+            )
+        start = end
+
+    # Energy of the boiler power between the accepted steps (trapezoidal rule)
+    power = boiler.boiler_power * np.array(operating_percentages) / 100  # W
+    energy_kWh = float(np.trapz(power, times)) / 3.6e6  # J to kWh
+
+    hourly_times = [
+        min(hour * 3600, duration) for hour in range(1, math.ceil(hours) + 1)
+    ]
+    return {
+        "times": [time / 3600 for time in hourly_times],  # h
+        "building_temperatures": np.interp(hourly_times, times, temperatures).tolist(),
+        "outside_temperatures": [
+            outside_temperatures[min(np.searchsorted(times, time), len(times) - 1)]
+            for time in hourly_times
+        ],
+        "set_temperatures": [building.set_temperature] * len(hourly_times),
+        "boiler_operating_percentages": np.interp(
+            hourly_times, times, operating_percentages
+        ).tolist(),
+        "final_temperature": building.building_temperature,
+        "energy_kWh": energy_kWh,
+        "fuel_consumption": energy_kWh / cst.FUEL_EFFICIENCIES[boiler.fuel],
+        "cost": energy_kWh * cst.FUEL_PRICE[boiler.fuel] / 100,  # CHF
+    }
+
+
+def get_executor():
+    """
+    Get the pool of worker processes running the what-if simulations.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=cst.WHAT_IF_WORKERS)
+    return _executor
+
+
+def submit_what_if(engine, changes, hours, time_step=None, adaptive=False):
+    """
+    Fork the live state, apply the changes and run the fork in a worker process.
+
+    Args:
+        engine (Engine): Engine of the live simulation
+        changes (dict): New values of the parameters
+        hours (float): Duration of the simulation in hours
+        time_step (str): Time step of the simulation, the one of the live simulation by default
+        adaptive (bool): Integrate with adaptive steps, for long simulations
+
+    Returns:
+        Future: The result of `run_what_if`
+
+    Raises:
+        ValueError: If the changes or the duration are not valid
+    """
+    if hours <= 0 or hours > cst.MAX_WHAT_IF_HOURS:
+        raise ValueError(f"Duration must be between 0 and {cst.MAX_WHAT_IF_HOURS} h")
+    boiler, building, regulator = fork(engine)
+    apply_changes(boiler, building, changes)
+    return get_executor().submit(
+        run_what_if,
+        boiler,
+        building,
+        regulator,
+        time_step or engine.time_step,
+        hours,
+        adaptive,
+    )
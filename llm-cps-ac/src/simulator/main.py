@@ -19,13 +19,16 @@ from fastapi import FastAPI
 from app.routes import router
 from uvicorn import run
 
+import app.constants as cst
 from app.instances import (
     building,
     boiler,
     regulator,
+    engine,
     TIME_STEP,
 )
 from app.simulator import Simulator
+from app.snapshot import Checkpointer, load_checkpoint
 
 
 # Initialize the simulator objects
@@ -48,6 +51,7 @@ def run_simulator():
         regulator,
         TIME_STEP,
         built_in_screen=False,
+        engine=engine,
     )
 
 
@@ -62,6 +66,12 @@ def main():
     """
     Main function to run the simulation and the API.
     """
+    # Restore the state of the last run, then save it regularly in the background
+    if load_checkpoint(engine, cst.CHECKPOINT_PATH):
+        print(f"Simulation restored from {cst.CHECKPOINT_PATH}")
+    checkpointer = Checkpointer(engine, cst.CHECKPOINT_PATH, cst.CHECKPOINT_INTERVAL)
+    checkpointer.start()
+
     # Create threads for the API
     api_thread = threading.Thread(target=run_api, args=())
 
@@ -71,6 +81,9 @@ def main():
     # Run the simulator in the main thread
     run_simulator()
 
+    # Save the state when the simulator is stopped
+    checkpointer.stop()
+
     # Wait for the API thread to complete
     api_thread.join()
 
@@ -15,15 +15,45 @@ __version__ = "1.0"
 __email__ = "philippe.marziale@edu.hefr.ch"
 
 
+import csv
+import math
+import os
+import tempfile
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch
 from datetime import timedelta
 
 from app.boiler import Boiler
 from app.building import Building
+from app.constants import ENERGY_COMPACTION_SIZE, FUEL_PRICE
+from app.energy import EnergyMeter
+from app.engine import Engine, History
+from app.integrators import simulate_adaptive, solve_rk45
 from app.simulator import Simulator
+from app.montecarlo import run_monte_carlo
 from app.regulator import Regulator
+from app.sweep import (
+    count_cases,
+    grid,
+    iter_results,
+    iter_sweep,
+    latin_hypercube,
+    submit_sweep,
+    validate_cases,
+    write_results,
+)
+from app.snapshot import (
+    dumps,
+    get_state,
+    load_checkpoint,
+    loads,
+    save_checkpoint,
+    set_state,
+)
+from app.timeseries import aggregate, lttb, query_history
 from app.weather import Weather
+from app.whatif import apply_changes, fork, run_what_if
 
 
 class TestBoiler(unittest.TestCase):
@@ -154,6 +184,612 @@ class TestBuilding(unittest.TestCase):
             )
 
 
+class TestBuildingIntegrator(unittest.TestCase):
+    """Test the integrators of the building temperature."""
+
+    # Set up a building with 20°C inside temperature, 24°C set temperature,
+    # 10°C outside temperature, 10m edge, 0.2 W/m^2K heat transfer coefficient,
+    # 1 J/m^3K volume heat capacity (air) and a boiler with 30000 W power, 50%
+    # operating percentage and gas as fuel, without weather
+    def setUp(self):
+        self.boiler = Boiler(30000, 50, "gas")
+        self.building = Building(
+            20, 24, 10, 10, 0.2, 1, self.boiler, None, integrator="exact"
+        )
+
+    # Test that the derived quantities are updated when their inputs change
+    def test_derived_quantities(self):
+        self.assertEqual(self.building.building_surface, 500)  # 10^2 * 5
+        self.assertEqual(self.building.thermal_conductance, 100)  # 0.2 * 500
+        self.assertEqual(self.building.thermal_capacity, 1000000)  # 1000 * 1000 * 1
+        self.building.building_edge = 2
+        self.assertEqual(self.building.building_surface, 20)  # 2^2 * 5
+        self.assertEqual(self.building.building_volume, 8)  # 2^3
+        self.assertEqual(self.building.thermal_conductance, 4)  # 0.2 * 20
+        self.building.heat_transfer_coefficient = 1
+        self.assertEqual(self.building.thermal_conductance, 20)  # 1 * 20
+        self.building.volume_heat_capacity = 200
+        self.assertEqual(self.building.thermal_capacity, 1600000)  # 8 * 1000 * 200
+
+    # Test the default integrator and an invalid integrator
+    def test_check_integrator(self):
+        building = Building(20, 24, 10, 10, 0.2, 1, self.boiler, None)
+        self.assertEqual(building.integrator, "euler")
+        with self.assertRaises(ValueError):
+            Building(20, 24, 10, 10, 0.2, 1, self.boiler, None, integrator="rk4")
+        with self.assertRaises(ValueError):
+            Building(20, 24, 10, 10, 0.2, 1, self.boiler, None, integrator="rk45")
+
+    # Test the exact step against the analytical solution
+    def test_update_temperature_exact(self):
+        self.building.update_temperature("minute")
+        equilibrium = 10 + 15000 / (0.2 * 500)  # 160°C
+        expected = equilibrium + (20 - equilibrium) * math.exp(
+            -0.2 * 500 * 60 / (1000 * 1000 * 1)
+        )
+        self.assertAlmostEqual(self.building.building_temperature, expected)
+
+    # Test that a large step gives the same temperature as many small steps
+    def test_update_temperature_exact_large_step(self):
+        building = Building(
+            20, 24, 10, 10, 0.2, 1, self.boiler, None, integrator="exact"
+        )
+        for _ in range(60):
+            building.update_temperature("minute")
+        self.building.update_temperature("hour")
+        self.assertAlmostEqual(
+            self.building.building_temperature, building.building_temperature
+        )
+
+    # Test that the exact step never overshoots the equilibrium temperature, unlike the Euler step
+    def test_update_temperature_exact_no_overshoot(self):
+        self.boiler.operating_percentage = 0
+        building = Building(20, 24, 10, 10, 10, 1, self.boiler, None)
+        building.update_temperature("hour")
+        self.assertLess(building.building_temperature, 10)  # Euler overshoots
+
+        self.building.heat_transfer_coefficient = 10
+        self.building.update_temperature("day")
+        self.assertAlmostEqual(self.building.building_temperature, 10)
+
+    # Test the weather index with a time step of a day
+    def test_weather_index_day_step(self):
+        weather = Weather.__new__(Weather)
+        weather.weather_data = [(hour, hour) for hour in range(48)]
+        weather.index = 0
+        weather.counter = 0
+        weather.update_building_outside_temperature(self.building, 86400)
+        self.assertEqual(weather.index, 24)
+        self.assertEqual(self.building.outside_temperature, 24)
+
+
+class TestAdaptiveIntegration(unittest.TestCase):
+    """Test the adaptive step-size integration (RK45)."""
+
+    # Set up a building with 15°C inside temperature, 20°C set temperature,
+    # 5°C outside temperature, 10m edge, 0.2 W/m^2K heat transfer coefficient,
+    # 200 J/m^3K volume heat capacity (house), a boiler with 30000 W power, 0%
+    # operating percentage and pellets as fuel, and a regulator, without weather
+    def setUp(self):
+        self.building = Building(
+            15, 20, 5, 10, 0.2, 200, Boiler(30000, 0, "pellets"), None, "exact"
+        )
+        self.regulator = Regulator()
+
+    # Test the solver on an exponential decay, with fewer steps than a fixed step
+    def test_solve_rk45(self):
+        times, states, _ = solve_rk45(
+            lambda t, y: [-y[0]], 0, [1], 10, rtol=1e-8, atol=1e-10
+        )
+        self.assertAlmostEqual(states[-1][0], math.exp(-10), places=7)
+        self.assertEqual(times[-1], 10)
+        self.assertLess(len(times), 200)
+
+    # Test the closed loop simulation against the discrete one with a minute step
+    def test_simulate_adaptive(self):
+        duration = 2 * 86400  # 2 days
+        discrete_building = Building(
+            15, 20, 5, 10, 0.2, 200, Boiler(30000, 0, "pellets"), None, "exact"
+        )
+        discrete_regulator = Regulator()
+        for _ in range(duration // 60):
+            discrete_regulator.regulate_temperature(discrete_building)
+            discrete_building.update_temperature("minute")
+
+        times, temperatures, _ = simulate_adaptive(
+            self.building, self.regulator, duration
+        )
+        self.assertEqual(times[-1], duration)
+        self.assertLess(len(times), duration // 60 / 10)
+        self.assertAlmostEqual(
+            temperatures[-1], discrete_building.building_temperature, places=1
+        )
+        self.assertEqual(self.building.building_temperature, temperatures[-1])
+
+
+class TestSnapshot(unittest.TestCase):
+    """Test the snapshots of the simulation state."""
+
+    # Create an engine with a building at 15°C, 20°C set temperature, 5°C outside
+    # temperature, a boiler with 30000 W power and a regulator, without weather
+    @staticmethod
+    def create_engine():
+        boiler = Boiler(30000, 0, "pellets")
+        building = Building(15, 20, 5, 10, 0.2, 200, boiler, None)
+        return Engine(boiler, building, Regulator(), "minute")
+
+    def setUp(self):
+        self.engine = self.create_engine()
+        for _ in range(30):
+            self.engine.step()
+
+    # Test that each step of the engine is recorded in the history
+    def test_step(self):
+        self.assertEqual(len(self.engine.history), 31)
+        self.assertEqual(self.engine.time, 30 * 60)
+        self.assertEqual(self.engine.history.times[-1], self.engine.time)
+        self.assertEqual(
+            self.engine.history.building_temperatures[-1],
+            self.engine.building.building_temperature,
+        )
+
+    # Test that a restored engine continues exactly like the original one
+    def test_round_trip(self):
+        restored = self.create_engine()
+        loads(restored, dumps(self.engine))
+        self.assertEqual(restored.history.to_dict(), self.engine.history.to_dict())
+        self.assertEqual(restored.meter.to_dict(), self.engine.meter.to_dict())
+        for _ in range(30):
+            self.engine.step()
+            restored.step()
+        self.assertEqual(restored.time, self.engine.time)
+        self.assertEqual(
+            restored.building.building_temperature,
+            self.engine.building.building_temperature,
+        )
+        self.assertEqual(
+            restored.boiler.operating_percentage,
+            self.engine.boiler.operating_percentage,
+        )
+
+    # Test saving and loading a checkpoint file
+    def test_checkpoint(self):
+        restored = self.create_engine()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "checkpoint.snapshot")
+            self.assertFalse(load_checkpoint(restored, path))
+            save_checkpoint(self.engine, path)
+            self.assertTrue(load_checkpoint(restored, path))
+        self.assertEqual(
+            restored.building.building_temperature,
+            self.engine.building.building_temperature,
+        )
+
+    # Test that invalid data is rejected without modifying the engine
+    def test_invalid_snapshot(self):
+        temperature = self.engine.building.building_temperature
+        with self.assertRaises(ValueError):
+            loads(self.engine, b"not a snapshot")
+        self.assertEqual(self.engine.building.building_temperature, temperature)
+
+    # Test that a snapshot with a missing key or an invalid value is rejected before any change
+    def test_invalid_state(self):
+        restored = self.create_engine()
+        before = get_state(restored)
+        state = get_state(self.engine)
+        invalid_states = []
+        for section, key, value in [
+            ("building", "building_temperature", "20"),
+            ("boiler", "fuel", "coal"),
+            ("regulator", "Kp", None),
+            ("building", "use_real_weather", True),
+        ]:
+            invalid_states.append({**state, section: {**state[section], key: value}})
+        invalid_states.append(
+            {key: value for key, value in state.items() if key != "meter"}
+        )
+        invalid_states.append(
+            {
+                **state,
+                "history": {
+                    **state["history"],
+                    "times": state["history"]["times"][:-1],
+                },
+            }
+        )
+        for invalid_state in invalid_states:
+            with self.assertRaises(ValueError):
+                set_state(restored, invalid_state)
+            self.assertEqual(get_state(restored), before)
+
+    # Test that a weather counter which is not a whole number of seconds is rejected
+    def test_invalid_weather_counter(self):
+        restored = self.create_engine()
+        weather = Weather.__new__(Weather)
+        weather.weather_data = [[hour, hour - 5] for hour in range(24)]
+        weather.index, weather.counter = 3, 1800
+        restored.building.weather = weather
+        state = get_state(restored)
+        for counter in [1800.5, True, -60, 3600]:
+            with self.assertRaises(ValueError):
+                set_state(
+                    restored,
+                    {**state, "weather": {**state["weather"], "counter": counter}},
+                )
+            self.assertEqual((weather.index, weather.counter), (3, 1800))
+        set_state(restored, {**state, "weather": {**state["weather"], "counter": 60}})
+        self.assertEqual(weather.counter, 60)
+
+
+class TestWhatIf(unittest.TestCase):
+    """Test the what-if simulations of the live state."""
+
+    # Set up a live engine with a building at 15°C, 20°C set temperature, 5°C outside
+    # temperature, a boiler with 30000 W power and a regulator, without weather
+    def setUp(self):
+        boiler = Boiler(30000, 0, "pellets")
+        building = Building(15, 20, 5, 10, 0.2, 200, boiler, None)
+        self.engine = Engine(boiler, building, Regulator(), "minute")
+        for _ in range(10):
+            self.engine.step()
+
+    # Test that the changes of a fork do not modify the live state
+    def test_fork(self):
+        boiler, building, regulator = fork(self.engine)
+        self.assertIs(building.boiler, boiler)
+        apply_changes(boiler, building, {"fuel": "gas", "set_temperature": 22})
+        run_what_if(boiler, building, regulator, "minute", 1)
+        self.assertEqual(self.engine.boiler.fuel, "pellets")
+        self.assertEqual(self.engine.building.set_temperature, 20)
+        self.assertEqual(len(self.engine.history), 11)
+        self.assertNotEqual(
+            building.building_temperature,
+            self.engine.building.building_temperature,
+        )
+
+    # Test the hourly trajectories and the cost of a what-if simulation
+    def test_run_what_if(self):
+        result = run_what_if(*fork(self.engine), "minute", 48)
+        self.assertEqual(len(result["times"]), 49)
+        self.assertEqual(result["times"][-1], 48)
+        self.assertAlmostEqual(result["final_temperature"], 20, places=1)
+        self.assertAlmostEqual(
+            result["cost"], result["energy_kWh"] * FUEL_PRICE["pellets"] / 100
+        )
+
+    # Test the adaptive what-if simulation against the engine, for a long duration
+    def test_run_adaptive(self):
+        boiler, building, regulator = fork(self.engine)
+        building.integrator = "exact"
+        result = run_what_if(boiler, building, regulator, "minute", 240)
+        adaptive_result = run_what_if(*fork(self.engine), "minute", 240, adaptive=True)
+        self.assertEqual(len(adaptive_result["times"]), 240)
+        self.assertEqual(adaptive_result["times"][-1], 240)
+        self.assertAlmostEqual(
+            adaptive_result["final_temperature"], result["final_temperature"], places=1
+        )
+        self.assertAlmostEqual(
+            adaptive_result["energy_kWh"] / result["energy_kWh"], 1, places=2
+        )
+        self.assertAlmostEqual(
+            adaptive_result["cost"],
+            adaptive_result["energy_kWh"] * FUEL_PRICE["pellets"] / 100,
+        )
+
+    # Test that the adaptive what-if simulation follows the hourly weather data, for a float duration
+    def test_run_adaptive_weather(self):
+        boiler, building, regulator = fork(self.engine)
+        weather = Weather.__new__(Weather)
+        weather.weather_data = [(hour, hour % 24 - 5) for hour in range(48)]
+        weather.index = 0
+        weather.counter = 1800
+        building.weather, building.use_real_weather = weather, True
+        result = run_what_if(boiler, building, regulator, "minute", 5.5, adaptive=True)
+        self.assertEqual(result["outside_temperatures"], [-4, -3, -2, -1, 0, 0])
+        self.assertEqual((weather.index, weather.counter), (6, 0))
+
+    # Test that invalid changes are rejected
+    def test_invalid_changes(self):
+        boiler, building, _ = fork(self.engine)
+        with self.assertRaises(ValueError):
+            apply_changes(boiler, building, {"boiler_power": 1})
+        with self.assertRaises(ValueError):
+            apply_changes(boiler, building, {"fuel": "coal"})
+        with self.assertRaises(ValueError):
+            apply_changes(boiler, building, {"regulator": 1})
+
+
+class TestSweep(unittest.TestCase):
+    """Test the parameter sweeps."""
+
+    # Test the expansion of a grid of parameters
+    def test_grid(self):
+        cases = grid({"building_edge": [5, 10, 20], "fuel": ["gas", "pellets"]})
+        self.assertEqual(len(cases), 6)
+        self.assertIn({"building_edge": 20, "fuel": "gas"}, cases)
+
+    # Test that a Latin hypercube samples each stratum once, reproducibly
+    def test_latin_hypercube(self):
+        parameters = {"building_edge": (5, 25), "fuel": ["gas", "pellets"]}
+        cases = latin_hypercube(parameters, 10, seed=1)
+        strata = sorted(int((case["building_edge"] - 5) // 2) for case in cases)
+        self.assertEqual(strata, list(range(10)))
+        self.assertEqual([case["fuel"] for case in cases].count("gas"), 5)
+        self.assertEqual(cases, latin_hypercube(parameters, 10, seed=1))
+
+    # Test that the cases are counted without being built, and that invalid sweeps are rejected
+    def test_count_cases(self):
+        self.assertEqual(
+            count_cases({"building_edge": [5, 10, 20], "fuel": ["gas", "pellets"]}, {}),
+            6,
+        )
+        self.assertEqual(count_cases({}, {"building_edge": (5, 20)}, 10**8), 10**8)
+        with self.assertRaises(ValueError):
+            count_cases({}, {"building_edge": (5, 20)}, 0)
+        with self.assertRaises(ValueError):
+            count_cases({}, {"building_edge": (5, 20)})
+        with self.assertRaises(ValueError):
+            count_cases({"building_edge": [5]}, {"building_edge": (5, 20)}, 4)
+
+    # Test that invalid cases are rejected
+    def test_validate_cases(self):
+        with self.assertRaises(ValueError):
+            validate_cases([{"fuel": "coal"}])
+        with self.assertRaises(ValueError):
+            validate_cases([{"boiler_power": 1}])
+        with self.assertRaises(ValueError):
+            validate_cases([{"weather": "sunny"}])
+        for case in [
+            {"building_edge": "abc"},
+            {"building_temperature": "warm"},
+            {"set_temperature": None},
+            {"fuel": 1},
+            {"integrator": ["exact"]},
+        ]:
+            with self.assertRaises(ValueError):
+                validate_cases([case])
+        validate_cases([{"building_temperature": 10, "building_edge": 5.5}])
+
+    # Test that the chunks not started are cancelled when the results stop being read
+    def test_cancel_sweep(self):
+        cases = grid({"boiler_power": [10000, 20000, 30000, 35000]})
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            futures = submit_sweep(cases, 24, "minute", executor, 1)
+            rows = iter_results(futures)
+            next(rows)
+            rows.close()
+            self.assertTrue(futures[-1].cancelled())
+
+    # Test that the results are written in the order of the cases
+    def test_write_results(self):
+        cases = grid({"boiler_power": [10000, 20000, 30000], "fuel": ["gas", "wood"]})
+        with ThreadPoolExecutor(
+            max_workers=2
+        ) as executor, tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sweep.csv")
+            count = write_results(iter_sweep(cases, 2, "minute", executor, 2), path)
+            with open(path, newline="") as file:
+                rows = list(csv.DictReader(file))
+        self.assertEqual(count, 6)
+        self.assertEqual(
+            [(float(row["boiler_power"]), row["fuel"]) for row in rows],
+            [(case["boiler_power"], case["fuel"]) for case in cases],
+        )
+        self.assertGreater(float(rows[0]["cost"]), 0)
+
+    # Test that the adaptive sweep gives the same results as the engine
+    def test_adaptive_sweep(self):
+        cases = grid({"boiler_power": [10000, 30000]})
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            rows = list(iter_sweep(cases, 48, "minute", executor, 2))
+            adaptive_rows = list(iter_sweep(cases, 48, "minute", executor, 2, True))
+        for row, adaptive_row in zip(rows, adaptive_rows):
+            self.assertAlmostEqual(
+                row["final_temperature"], adaptive_row["final_temperature"], places=1
+            )
+            self.assertAlmostEqual(
+                row["energy_kWh"] / adaptive_row["energy_kWh"], 1, delta=0.01
+            )
+
+
+class TestMonteCarlo(unittest.TestCase):
+    """Test the Monte Carlo uncertainty simulations."""
+
+    # Set up a building with 15°C inside temperature, 20°C set temperature,
+    # 5°C outside temperature, a boiler with 30000 W power and a regulator, without weather
+    def setUp(self):
+        self.boiler = Boiler(30000, 0, "pellets")
+        self.building = Building(15, 20, 5, 10, 0.2, 200, self.boiler, None, "exact")
+        self.regulator = Regulator()
+
+    # Test that replicas without perturbation match the discrete simulation
+    def test_without_perturbation(self):
+        result = run_monte_carlo(
+            self.boiler,
+            self.building,
+            self.regulator,
+            replicas=3,
+            hours=24,
+            outside_sigma=0,
+            heat_transfer_sigma=0,
+            heat_capacity_sigma=0,
+        )
+        energy = 0
+        engine = Engine(self.boiler, self.building, self.regulator, "minute")
+        for _ in range(24 * 60):
+            engine.step()
+            energy += self.boiler.current_power * 60
+        self.assertAlmostEqual(result["energy_kWh"]["p50"], energy / 3.6e6)
+        self.assertAlmostEqual(
+            result["building_temperature"]["p95"][-1],
+            self.building.building_temperature,
+        )
+
+    # Test that the results are reproducible and the bands ordered
+    def test_seed(self):
+        results = [
+            run_monte_carlo(self.boiler, self.building, self.regulator, 200, 12, seed=1)
+            for _ in range(2)
+        ]
+        self.assertEqual(results[0], results[1])
+        cost = results[0]["cost"]
+        self.assertLess(cost["p5"], cost["p50"])
+        self.assertLess(cost["p50"], cost["p95"])
+        self.assertEqual(len(results[0]["times"]), 13)
+        self.assertEqual(self.building.building_temperature, 15)
+
+
+class TestEnergyMeter(unittest.TestCase):
+    """Test the integrated energy and cost accounting."""
+
+    # Record 48 hours of a boiler at 10 kW during the first day and 5 kW during the second one
+    def setUp(self):
+        self.meter = EnergyMeter()
+        boiler = Boiler(10000, 100, "pellets")
+        for hour in range(1, 49):
+            if hour == 25:
+                boiler.operating_percentage = 50
+                boiler._update_heating_power()
+            self.meter.record(hour * 3600, boiler, 3600)
+
+    # Test the accumulators since the start
+    def test_totals(self):
+        self.assertAlmostEqual(self.meter.energy_kWh, 24 * 10 + 24 * 5)
+        self.assertAlmostEqual(
+            self.meter.cost, self.meter.energy_kWh * FUEL_PRICE["pellets"] / 100
+        )
+        self.assertAlmostEqual(
+            self.meter.fuel_consumption["pellets"], self.meter.energy_kWh / 4.8
+        )
+
+    # Test the windows, including a window starting within a step
+    def test_window(self):
+        self.assertAlmostEqual(self.meter.window(3600)["energy_kWh"], 5)
+        self.assertAlmostEqual(self.meter.window(86400)["mean_power"], 5000)
+        self.assertAlmostEqual(self.meter.window(30 * 3600)["energy_kWh"], 180)
+        self.assertAlmostEqual(self.meter.window(24.5 * 3600)["energy_kWh"], 125)
+        self.assertEqual(self.meter.window(30 * 86400)["hours"], 48)
+
+    # Test the cost of the last day extrapolated to a year
+    def test_cost_per_year(self):
+        self.assertAlmostEqual(
+            self.meter.cost_per_year(86400), self.meter.window(86400)["cost"] * 365
+        )
+        self.assertEqual(EnergyMeter().cost_per_year(86400), 0)
+
+    # Test that the cumulative sums of 60 days of minutes are bounded and the windows unchanged
+    def test_compaction(self):
+        meter = EnergyMeter()
+        boiler = Boiler(10000, 100, "gas")
+        for minute in range(1, 60 * 1440 + 1):
+            boiler.operating_percentage = minute % 100
+            boiler._update_heating_power()
+            meter.record(minute * 60, boiler, 60)
+        self.assertLessEqual(len(meter.to_dict()["times"]), ENERGY_COMPACTION_SIZE)
+
+        # Windows compared to the sums of the recorded powers, exact during the fine horizon and within
+        # the energy of one hourly bucket (at most 10 kWh) before
+        powers = [(minute % 100) * 100 for minute in range(1, 60 * 1440 + 1)]
+        for duration in [3600, 86400]:
+            energy = sum(powers[-duration // 60 :]) * 60 / 3.6e6
+            self.assertAlmostEqual(meter.window(duration)["energy_kWh"], energy)
+        energy = sum(powers[-30 * 1440 :]) * 60 / 3.6e6
+        self.assertAlmostEqual(meter.window(30 * 86400)["energy_kWh"], energy, delta=10)
+        self.assertEqual(meter.summary()["total"]["hours"], 60 * 24)
+        self.assertAlmostEqual(meter.energy_kWh, sum(powers) * 60 / 3.6e6)
+
+    # Test that the engine records the consumption of each step
+    def test_engine(self):
+        boiler = Boiler(30000, 0, "gas")
+        building = Building(15, 20, 5, 10, 0.2, 200, boiler, None)
+        engine = Engine(boiler, building, Regulator(), "minute")
+        energy = 0
+        for _ in range(120):
+            engine.step()
+            energy += boiler.current_power * 60 / 3.6e6
+        self.assertAlmostEqual(engine.meter.energy_kWh, energy)
+        self.assertEqual(engine.meter.summary()["total"]["hours"], 2)
+
+
+class TestHistoryQuery(unittest.TestCase):
+    """Test the queries of the history with downsampling."""
+
+    # Set up a history of 10 days recorded every minute, with a daily temperature cycle
+    def setUp(self):
+        self.history = History()
+        self.history.times = [minute * 60 for minute in range(10 * 1440 + 1)]
+        self.history.building_temperatures = [
+            20 + 5 * math.sin(time / 86400 * 2 * math.pi) for time in self.history.times
+        ]
+        for field in [
+            "outside_temperatures",
+            "set_temperatures",
+            "boiler_operating_percentages",
+        ]:
+            setattr(self.history, field, [0] * len(self.history.times))
+
+    # Test the min, max and mean of buckets of equal duration
+    def test_aggregate(self):
+        result = aggregate([0, 1, 2, 3], [1, 2, 3, 4], 2)
+        self.assertEqual(result["times"], [0, 1.5])
+        self.assertEqual(result["min"], [1, 3])
+        self.assertEqual(result["max"], [2, 4])
+        self.assertEqual(result["mean"], [1.5, 3.5])
+
+    # Test that LTTB keeps the first, last and extreme points
+    def test_lttb(self):
+        result = lttb([0, 1, 2, 3, 4], [0, 5, 0, -5, 0], 3)
+        self.assertEqual(result["times"], [0, 1, 4])
+        result = lttb(self.history.times, self.history.building_temperatures, 50)
+        self.assertEqual(len(result["times"]), 50)
+        self.assertAlmostEqual(max(result["values"]), 25, places=2)
+
+    # Test a range relative to the last time, downsampled into buckets
+    def test_query_history(self):
+        result = query_history(
+            self.history, ["building_temperatures"], -24, None, resolution=24
+        )
+        self.assertEqual((result["from"], result["to"]), (216, 240))
+        buckets = result["fields"]["building_temperatures"]
+        self.assertEqual(len(buckets["times"]), 24)
+        self.assertAlmostEqual(max(buckets["max"]), 25, places=2)
+        self.assertAlmostEqual(min(buckets["min"]), 15, places=2)
+        with self.assertRaises(ValueError):
+            query_history(self.history, ["times"])
+
+    # Test that the compacted history keeps every minute of the last 7 days and one value per hour before
+    def test_compact(self):
+        history = self.history.compact(self.history.times[-1])
+        self.assertEqual(len(history), 7 * 1440 + 1 + 3 * 24)
+        self.assertEqual(history.times[:2], [59 * 60, 119 * 60])
+        self.assertEqual(history.times[-1440:], self.history.times[-1440:])
+        self.assertEqual(
+            history.building_temperatures[-1440:],
+            self.history.building_temperatures[-1440:],
+        )
+        result = query_history(history, ["building_temperatures"], resolution=10)
+        self.assertAlmostEqual(
+            max(result["fields"]["building_temperatures"]["max"]), 25, places=2
+        )
+
+    # Test that the engine replaces its history by a compacted one, read consistently by a query running before
+    @patch("app.constants.HISTORY_FINE_HORIZON", 3600)
+    @patch("app.constants.HISTORY_COMPACTION_SIZE", 200)
+    def test_engine_compaction(self):
+        boiler = Boiler(30000, 0, "gas")
+        building = Building(15, 20, 5, 10, 0.2, 200, boiler, None)
+        engine = Engine(boiler, building, Regulator(), "minute", compact_history=True)
+        previous = engine.history
+        for _ in range(1440):
+            engine.step()
+        self.assertLessEqual(len(engine.history), 200)
+        self.assertEqual(
+            engine.history.times[-61:], [m * 60 for m in range(1380, 1441)]
+        )
+        self.assertEqual(len(previous.to_dict()["times"]), 201)
+        self.assertEqual(get_state(engine)["history"], engine.history.to_dict())
+
+
 class TestRegulator(unittest.TestCase):
     """Test the regulator class."""
 